@@ -0,0 +1,257 @@
+""" Benchmark of hot paths of TLView on synthetic connection tables.
+
+    psutil.net_connections() and psutil.Process are replaced by a deterministic
+    generator of connections, so results don't depend on the host. Qt works
+    on offscreen platform, no display is needed. Results are written as JSON:
+
+        python benchmark.py --sizes 1000 10000 --output new.json --compare old.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import platform
+import tempfile
+import statistics
+from contextlib import contextmanager
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import psutil
+from psutil._common import sconn, addr
+from PySide2.QtCore import Qt, QCoreApplication
+from PySide2.QtWidgets import QApplication
+from tltablemodel import TLTableModel
+from tlbackends import PsutilBackend
+from tlsnapshot import SnapshotDiffer
+from work_with_list import tables_match
+from work_with_netdata import CacheProcesses
+
+
+SIZES = (1000, 10000, 50000, 200000)        # counts of connections in tables
+REPEAT = 5                                  # count of measurements of every benchmark
+CHURN = 0.05                                # share of connections replaced between snapshots
+COUNT_PROCESSES = 200                       # count of processes that own connections
+VIEWPORT_ROWS = 50                          # count of rows visible in tableview
+SORT_COLUMNS = (0, 3, 7)                    # columns by which table is sorted
+# status -> share of connections, status NONE means UDP socket
+STATE_MIX = {"ESTABLISHED": 0.6, "LISTEN": 0.1, "TIME_WAIT": 0.15, "CLOSE_WAIT": 0.05, "NONE": 0.1}
+IPV6_SHARE = 0.2                            # share of IPv6 connections
+TCP_STATUSES = ("ESTABLISHED", "SYN_SENT", "FIN_WAIT1", "FIN_WAIT2", "TIME_WAIT", "CLOSE_WAIT", "LAST_ACK")
+
+
+class SyntheticProcess:
+    """ Stand-in of psutil.Process for processes of synthetic connections """
+    def __init__(self, pid: int):
+        self.pid = pid
+
+    def name(self)-> str:
+        return f"process{self.pid}.exe"
+
+    def create_time(self)-> float:
+        return 1000000.0 + self.pid
+
+
+class SyntheticConnections:
+    """ Deterministic generator of connections in form of psutil.net_connections() """
+    def __init__(self, size: int, churn: float = CHURN, state_mix: dict = None,
+                 count_processes: int = COUNT_PROCESSES, seed: int = 0):
+        self.churn = churn
+        self.states = list(state_mix if state_mix is not None else STATE_MIX)
+        self.weights = [(state_mix if state_mix is not None else STATE_MIX)[state] for state in self.states]
+        self.countProcesses = count_processes
+        self.random = random.Random(seed)
+        self.__port = 0                             # counter of local ports, it keeps connections unique
+        self.connections = [self.connection() for _ in range(size)]
+
+    def __ip(self, family: socket.AddressFamily)-> str:
+        rand = self.random.getrandbits
+        if family == socket.AF_INET6:
+            return f"2001:db8::{rand(16):x}:{rand(16):x}"
+        return f"10.{rand(8)}.{rand(8)}.{rand(8)}"
+
+    def connection(self)-> sconn:
+        """ return new random connection """
+        status = self.random.choices(self.states, self.weights)[0]
+        family = socket.AF_INET6 if self.random.random() < IPV6_SHARE else socket.AF_INET
+        self.__port += 1
+        laddr = addr(self.__ip(family), 1024 + self.__port % 64000)
+        if status == "NONE":
+            return sconn(-1, family, socket.SOCK_DGRAM, laddr, (), status,
+                         1 + self.random.randrange(self.countProcesses))
+        raddr = () if status == "LISTEN" else addr(self.__ip(family), self.random.randrange(1, 65536))
+        return sconn(-1, family, socket.SOCK_STREAM, laddr, raddr, status,
+                     1 + self.random.randrange(self.countProcesses))
+
+    def step(self):
+        """ replace share churn of connections with new ones and
+            change status of half as many TCP connections """
+        count = round(len(self.connections) * self.churn)
+        if count == 0:
+            return
+        for ind in self.random.sample(range(len(self.connections)), count):
+            self.connections[ind] = self.connection()
+        for ind in self.random.sample(range(len(self.connections)), count // 2):
+            connection = self.connections[ind]
+            if connection.type == socket.SOCK_STREAM and connection.status != "LISTEN":
+                self.connections[ind] = connection._replace(status=self.random.choice(TCP_STATUSES))
+
+    def net_connections(self, kind: str = 'inet')-> list:
+        return list(self.connections)
+
+
+@contextmanager
+def patched_psutil(synthetic: SyntheticConnections):
+    """ replace system data of psutil by synthetic connections """
+    net_connections, process = psutil.net_connections, psutil.Process
+    psutil.net_connections, psutil.Process = synthetic.net_connections, SyntheticProcess
+    try:
+        yield
+    finally:
+        psutil.net_connections, psutil.Process = net_connections, process
+
+
+def measure(func, repeat: int, setup = None)-> dict:
+    """ run func repeat times and return statistics of durations in seconds.
+        setup - function that returns arguments of func, it is not measured """
+    durations = []
+    for _ in range(repeat):
+        args = setup() if setup is not None else ()
+        start = time.perf_counter()
+        func(*args)
+        durations.append(time.perf_counter() - start)
+    return {'repeat': repeat, 'min': min(durations), 'median': statistics.median(durations),
+            'mean': statistics.mean(durations)}
+
+
+def wait_applied(model: TLTableModel):
+    """ process events until snapshot requested from collector is applied """
+    while model.collecting:
+        QCoreApplication.processEvents()
+        time.sleep(0.001)
+
+
+def bench_size(size: int, repeat: int, churn: float, state_mix: dict, seed: int)-> list:
+    """ run all benchmarks on table with size connections """
+    results = []
+
+    def add(name: str, stats: dict):
+        results.append({'benchmark': name, 'size': size, **stats})
+        print(f"{size:>8} {name:<24} min {stats['min'] * 1000:10.3f} ms  "
+              f"median {stats['median'] * 1000:10.3f} ms", file=sys.stderr)
+
+    synthetic = SyntheticConnections(size, churn, state_mix, seed=seed)
+    with patched_psutil(synthetic):
+        backend = PsutilBackend()
+        cache_processes = CacheProcesses()
+        add('loadDataNetConnections', measure(
+            lambda: TLTableModel.loadDataNetConnections(lambda: 0, cache_processes, backend), repeat))
+
+        # the same pair of consecutive snapshots is compared every time
+        old_table = TLTableModel.loadDataNetConnections(iter(range(2 * size + 1)).__next__, cache_processes, backend)
+        synthetic.step()
+        new_table = TLTableModel.loadDataNetConnections(iter(range(2 * size + 1, 4 * size + 2)).__next__,
+                                                        cache_processes, backend)
+        # tables_match is the diff of SnapshotDiffer.update(), it is measured without assigning primary keys
+        add('tables_match', measure(
+            lambda: tables_match(old_table, new_table, *TLTableModel.UNIQUE_KEY), repeat))
+
+        def differ_setup():
+            differ = SnapshotDiffer(TLTableModel.UNIQUE_KEY, (7,), 8)
+            differ.table = old_table
+            return differ, [row[:] for row in new_table]
+        add('SnapshotDiffer.update', measure(lambda differ, table: differ.update(table), repeat, differ_setup))
+
+        model = TLTableModel(backend=backend)
+        try:
+            model.setDomainNameMode(False)      # synthetic addresses must not be resolved
+            wait_applied(model)
+            # apply snapshots with churn, so table has highlighted and deleted rows
+            synthetic.step()
+            model.updateData()
+            wait_applied(model)
+
+            for column in SORT_COLUMNS:
+                model.setSortColumn(column)
+
+                def sort_setup():
+                    model.setAscendingSort(not model.sortASC)
+                    return ()
+                add(f'sortData[column={column}]', measure(model.sortData, repeat, sort_setup))
+
+            first = max(0, model.rowCount() // 2 - VIEWPORT_ROWS // 2)
+            indexes = [model.index(row, column) for row in range(first, min(first + VIEWPORT_ROWS, model.rowCount()))
+                       for column in range(model.columnCount())]
+
+            def viewport():
+                for index in indexes:
+                    model.data(index, Qt.DisplayRole)
+                    model.data(index, Qt.BackgroundRole)
+            add('data[viewport, cold]', measure(viewport, repeat, lambda: model.displayRows.clear() or ()))
+            add('data[viewport, warm]', measure(viewport, repeat))
+
+            with tempfile.TemporaryDirectory() as dirname:
+                model.setFilename(os.path.join(dirname, 'benchmark.csv'))
+                add('writeDataInFile', measure(model.writeDataInFile, repeat))
+        finally:
+            model.stopCollector()
+    return results
+
+
+def parse_state_mix(text: str)-> dict:
+    """ "ESTABLISHED=0.6,LISTEN=0.4" -> {"ESTABLISHED": 0.6, "LISTEN": 0.4} """
+    state_mix = {}
+    for item in text.split(','):
+        state, share = item.split('=')
+        state_mix[state.strip().upper()] = float(share)
+    return state_mix
+
+
+def compare(results: list, base_filename: str):
+    """ print ratios of median durations to durations of the base file """
+    with open(base_filename) as file:
+        base = {(result['benchmark'], result['size']): result for result in json.load(file)['results']}
+    print(f"{'size':>8} {'benchmark':<24} {'base ms':>12} {'new ms':>12} {'ratio':>8}", file=sys.stderr)
+    for result in results:
+        old = base.get((result['benchmark'], result['size']), None)
+        if old is None:
+            continue
+        print(f"{result['size']:>8} {result['benchmark']:<24} {old['median'] * 1000:12.3f} "
+              f"{result['median'] * 1000:12.3f} {result['median'] / old['median']:8.2f}", file=sys.stderr)
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Benchmark of TLView on synthetic connections")
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help="counts of connections")
+    parser.add_argument('--repeat', type=int, default=REPEAT, help="count of measurements")
+    parser.add_argument('--churn', type=float, default=CHURN, help="share of connections replaced per snapshot")
+    parser.add_argument('--states', type=parse_state_mix, default=STATE_MIX,
+                        help="mix of statuses, e.g. ESTABLISHED=0.6,LISTEN=0.1,NONE=0.3 (NONE - UDP)")
+    parser.add_argument('--seed', type=int, default=0, help="seed of generator of connections")
+    parser.add_argument('--output', default='-', help="file for JSON results, '-' - stdout")
+    parser.add_argument('--compare', metavar='FILE', help="JSON results of previous version")
+    args = parser.parse_args(argv)
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    results = []
+    for size in args.sizes:
+        results.extend(bench_size(size, args.repeat, args.churn, args.states, args.seed))
+    report = {'meta': {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                       'platform': platform.platform(), 'repeat': args.repeat, 'churn': args.churn,
+                       'states': args.states, 'seed': args.seed},
+              'results': results}
+    if args.output == '-':
+        json.dump(report, sys.stdout, indent=1)
+        print()
+    else:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=1)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
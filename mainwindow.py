@@ -1,13 +1,36 @@
-from PySide2.QtWidgets import QMainWindow, QMenu, QAction, QMessageBox, QFileDialog
+from PySide2.QtWidgets import (QMainWindow, QMenu, QAction, QMessageBox, QFileDialog, QLabel, QProgressDialog,
+                               QToolBar, QSlider, QLineEdit, QShortcut, QTreeView, QInputDialog)
+from PySide2.QtGui import QKeySequence
 from ui_mainwindow import Ui_MainWindow
 from tltablemodel import TLTableModel
-from PySide2.QtCore import QTimer, Slot, Signal, Qt
+from tltreemodel import TLTreeModel
+from tlbackends import CollectionFilter
+from tlscheduler import AdaptiveInterval
+from tlprofiler import ProfileLog
+from tlhistory import HistoryReader
+from tlfilter import RowFilter
+from tlagent import AgentSource, parse_address, DEFAULT_PORT
+from PySide2.QtCore import QTimer, Slot, Signal, Qt, QEvent
 import psutil
+import os
+import time
+import socket
+import sqlite3
 
 
 TIMER_VALUES = (1000, 2000, 5000)
+DNS_CACHE_FILENAME = os.path.join(os.path.expanduser('~'), '.tlview_dns_cache.sqlite3')
+HISTORY_FILENAME = os.path.join(os.path.expanduser('~'), '.tlview_history.tlh')
+INTERVALS_FILENAME = os.path.join(os.path.expanduser('~'), '.tlview_intervals.sqlite3')
+REPLAY_DELAY = 50           # milliseconds between move of time slider and update of table
+FILTER_DELAY = 300          # milliseconds between the last edit of filter expression and its applying
+FILTER_PLACEHOLDER = "Filter: proc:nginx state:ESTABLISHED rport:443 raddr:10.0.0.0/8"
+AGENT_ADDRESS = f"127.0.0.1:{DEFAULT_PORT}"     # default address of agent (python -m tlagent)
 
 class MainWindow(QMainWindow):
+    exportProgress = Signal(int, int)           # written rows and all rows of export, emitted from export thread
+    exportFinished = Signal(bool, str)          # export is finished and error message, emitted from export thread
+
     def __init__(self):
         super().__init__()
         self.ui = Ui_MainWindow()
@@ -16,47 +39,205 @@ class MainWindow(QMainWindow):
         self.filename_save = ""
 
         # link model with view
-        self.tableModel = TLTableModel()
+        self.tableModel = TLTableModel(DNS_CACHE_FILENAME)
         self.ui.tableView.setModel(self.tableModel)
-        self.tableModel.modelAboutToBeReset.connect(self.ui.tableView.storeSelectedRowNum)
-        self.tableModel.modelReset.connect(self.ui.tableView.restoreSelectedRowNum)
+        # keep scroll position on the same connection, selection is kept by the model
+        self.tableModel.layoutAboutToBeChanged.connect(self.ui.tableView.storeTopRow)
+        self.tableModel.layoutChanged.connect(self.ui.tableView.restoreTopRow)
+        self.tableModel.rowsAboutToBeRemoved.connect(self.ui.tableView.storeTopRow)
+        self.tableModel.rowsRemoved.connect(self.ui.tableView.restoreTopRow)
         # link view headers with model sorting
         header = self.ui.tableView.horizontalHeader()
         header.sectionClicked.connect(self.tableModel.sortDataByColumn)
 
         self.updateInfoInDownToolBar()
+        self.tableModel.aggregatesChanged.connect(self.updateInfoInDownToolBar)
 
         # link model with timer
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.tableModel.updateData)
-        self.timer.timeout.connect(self.updateInfoInDownToolBar)
         self.timer.setInterval(TIMER_VALUES[0])
         self.timer.start()
+        # in "Auto" mode timer is single shot and started again after every applied snapshot,
+        # so timer events never pile up behind slow collection
+        self.autoUpdate = False
+        self.updatePaused = False           # collection is paused while window is hidden
+        self.adaptiveInterval = AdaptiveInterval()
+        self.tableModel.deltaApplied.connect(self.scheduleUpdate)
 
         # link tableview with context menu
         self.ui.tableView.setContextMenuPolicy(Qt.CustomContextMenu)
         self.ui.tableView.customContextMenuRequested.connect(self.displayCustomContextMenu)
+        # connections grouped by process are shown by tree view in place of table view,
+        # tree model follows rows and deltas of table model and is made only while it is shown
+        self.treeView = QTreeView(self.ui.centralWidget)
+        self.treeView.setUniformRowHeights(True)
+        self.treeView.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.treeView.customContextMenuRequested.connect(self.displayCustomContextMenu)
+        self.treeView.hide()
+        self.ui.gridLayout.addWidget(self.treeView, 0, 0, 1, 1)
+        self.treeModel = None
+        self.ui.actionGroup_by_Process.triggered.connect(self.slot_group_changed)
+        self.ui.actionGroup_by_Protocol.triggered.connect(self.slot_group_changed)
+        self.ui.actionGroup_by_State.triggered.connect(self.slot_group_changed)
+        self.ui.actionGroup_by_Protocol.setEnabled(False)
+        self.ui.actionGroup_by_State.setEnabled(False)
 
         self.ui.actionExit.triggered.connect(self.close)
         self.ui.actionResolve_Addresses.triggered.connect(self.tableModel.setDomainNameMode)
         self.ui.actionResolve_Addresses.triggered.connect(self.tableModel.setServiceNameMode)
+        self.ui.actionSort_by_Names.triggered.connect(self.tableModel.setSortByDisplay)
 
         check_action1 = MainWindow.gen_check_for_checkable_action(self.ui.action1_seconds,
-                                                       self.ui.action2_seconds, self.ui.action3_seconds)
+                                                       self.ui.action2_seconds, self.ui.action3_seconds,
+                                                       self.ui.actionAuto)
         check_action2 = MainWindow.gen_check_for_checkable_action(self.ui.action2_seconds,
-                                                       self.ui.action1_seconds, self.ui.action3_seconds)
+                                                       self.ui.action1_seconds, self.ui.action3_seconds,
+                                                       self.ui.actionAuto)
         check_action3 = MainWindow.gen_check_for_checkable_action(self.ui.action3_seconds,
-                                                       self.ui.action1_seconds, self.ui.action2_seconds)
+                                                       self.ui.action1_seconds, self.ui.action2_seconds,
+                                                       self.ui.actionAuto)
+        check_action_auto = MainWindow.gen_check_for_checkable_action(self.ui.actionAuto, self.ui.action1_seconds,
+                                                       self.ui.action2_seconds, self.ui.action3_seconds)
         self.ui.action1_seconds.triggered.connect(check_action1)
         self.ui.action2_seconds.triggered.connect(check_action2)
         self.ui.action3_seconds.triggered.connect(check_action3)
+        self.ui.actionAuto.triggered.connect(check_action_auto)
         self.ui.action1_seconds.triggered.connect(self.slot_action1_seconds)
         self.ui.action2_seconds.triggered.connect(self.slot_action2_seconds)
         self.ui.action3_seconds.triggered.connect(self.slot_action5_seconds)
+        self.ui.actionAuto.triggered.connect(self.slot_action_auto)
+        # protocols of collected connections
+        self.filterActions = ((self.ui.actionTCP, (socket.AF_INET, socket.SOCK_STREAM)),
+                              (self.ui.actionTCPV6, (socket.AF_INET6, socket.SOCK_STREAM)),
+                              (self.ui.actionUDP, (socket.AF_INET, socket.SOCK_DGRAM)),
+                              (self.ui.actionUDPV6, (socket.AF_INET6, socket.SOCK_DGRAM)))
+        for action, _ in self.filterActions:
+            action.triggered.connect(self.slot_filter_changed)
+        self.ui.actionListening_Only.triggered.connect(self.slot_filter_changed)
+        # measurement of update stages, profiles are made only when readout or log is on
+        self.performanceLabel = QLabel(self)
+        self.performanceLabel.hide()
+        self.ui.statusBar.addPermanentWidget(self.performanceLabel)
+        self.profileLog = None
+        self.tableModel.profileReady.connect(self.updatePerformanceInfo)
+        self.ui.actionPerformance.triggered.connect(self.slot_performance)
+        self.ui.actionPerformance_Log.triggered.connect(self.slot_performance_log)
         self.ui.actionAbout.triggered.connect(self.slot_about)
+        # export of table is written in background thread
+        self.tableExport = None
+        self.exportDialog = None
+        self.exportProgress.connect(self.updateExportProgress)
+        self.exportFinished.connect(self.finishExport)
+        # history: recording of deltas and replay with time slider
+        self.replayToolBar = QToolBar("History", self)
+        self.replayToolBar.setObjectName("replayToolBar")
+        self.replaySlider = QSlider(Qt.Horizontal, self.replayToolBar)
+        self.replayTimeLabel = QLabel(self.replayToolBar)
+        self.replayToolBar.addWidget(self.replaySlider)
+        self.replayToolBar.addWidget(self.replayTimeLabel)
+        self.replayToolBar.addAction("Live", self.slot_live)
+        self.addToolBar(Qt.TopToolBarArea, self.replayToolBar)
+        self.replayToolBar.hide()
+        self.historyReader = None
+        # moves of slider are coalesced, table is updated after slider stops for REPLAY_DELAY
+        self.replayTimer = QTimer(self)
+        self.replayTimer.setSingleShot(True)
+        self.replayTimer.setInterval(REPLAY_DELAY)
+        self.replayTimer.timeout.connect(self.replayToSlider)
+        self.replaySlider.valueChanged.connect(self.replayTimer.start)
+        self.replaySlider.sliderPressed.connect(self.refreshReplayRange)
+        # filter bar: rows of table are filtered by expression (see tlfilter)
+        self.filterToolBar = QToolBar("Filter", self)
+        self.filterToolBar.setObjectName("filterToolBar")
+        self.filterEdit = QLineEdit(self.filterToolBar)
+        self.filterEdit.setPlaceholderText(FILTER_PLACEHOLDER)
+        self.filterEdit.setClearButtonEnabled(True)
+        self.filterToolBar.addWidget(self.filterEdit)
+        self.addToolBar(Qt.TopToolBarArea, self.filterToolBar)
+        self.filterTimer = QTimer(self)
+        self.filterTimer.setSingleShot(True)
+        self.filterTimer.setInterval(FILTER_DELAY)
+        self.filterTimer.timeout.connect(self.applyRowFilter)
+        self.filterEdit.textChanged.connect(self.filterTimer.start)
+        self.filterEdit.returnPressed.connect(self.applyRowFilter)
+        self.filterShortcut = QShortcut(QKeySequence.Find, self)
+        self.filterShortcut.activated.connect(self.filterEdit.setFocus)
+        self.filterShortcut.activated.connect(self.filterEdit.selectAll)
+        self.ui.actionRecord_History.triggered.connect(self.slot_record_history)
+        self.ui.actionRecord_Intervals.triggered.connect(self.slot_record_intervals)
+        self.ui.actionOpen_History.triggered.connect(self.slot_open_history)
+        # connections of remote agent are shown instead of local ones, state of agent is in status bar
+        self.agentAddress = AGENT_ADDRESS
+        self.agentLabel = QLabel(self)
+        self.agentLabel.hide()
+        self.ui.statusBar.addPermanentWidget(self.agentLabel)
+        self.tableModel.deltaApplied.connect(self.updateAgentInfo)
+        self.ui.actionConnect_to_Agent.triggered.connect(self.slot_connect_agent)
+        self.ui.actionDisconnect_from_Agent.triggered.connect(self.slot_disconnect_agent)
         self.ui.actionSave.triggered.connect(self.slot_save)
         self.ui.actionSave_as.triggered.connect(self.slot_save_as)
 
+    def closeEvent(self, event):
+        """ stop updating data before window closing """
+        self.timer.stop()
+        if self.tableExport is not None:
+            self.tableExport.cancel()
+            self.tableExport.wait()
+        self.tableModel.stopCollector()
+        if self.historyReader is not None:
+            self.historyReader.close()
+        if self.profileLog is not None:
+            self.profileLog.close()
+        super().closeEvent(event)
+
+    def hideEvent(self, event):
+        self.pauseUpdate()
+        super().hideEvent(event)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if not self.isMinimized():
+            self.resumeUpdate()
+
+    def changeEvent(self, event):
+        """ collection is paused while window is minimized """
+        if event.type() == QEvent.WindowStateChange:
+            if self.isMinimized():
+                self.pauseUpdate()
+            elif self.isVisible():
+                self.resumeUpdate()
+        super().changeEvent(event)
+
+    def pauseUpdate(self):
+        self.updatePaused = True
+        self.timer.stop()
+
+    def resumeUpdate(self):
+        """ update data at once and start timer again """
+        if not self.updatePaused:
+            return
+        self.updatePaused = False
+        self.tableModel.updateData()
+        if not self.autoUpdate:
+            self.timer.start()
+
+    @Slot(object)
+    def scheduleUpdate(self, delta):
+        """ in "Auto" mode start timer for the next update with interval
+            computed from cost and churn of the applied snapshot """
+        if not self.autoUpdate or self.updatePaused:
+            return
+        total = delta.aggregates.total if delta.aggregates is not None else self.tableModel.rowCount()
+        self.timer.start(self.adaptiveInterval.update(delta.collect_time, delta.count_changes(), total))
+
+    def setFixedInterval(self, interval: int):
+        self.autoUpdate = False
+        self.timer.setSingleShot(False)
+        self.timer.setInterval(interval)
+        if not self.updatePaused:
+            self.timer.start()
+
     @Slot()
     def updateInfoInDownToolBar(self):
         """ update info in down tool bar """
@@ -73,19 +254,30 @@ class MainWindow(QMainWindow):
         menu = QMenu(self)
         # create action for process termination
         terminateAction = QAction("End process...", self)
+        # processes of agent are on other computer, owner of some sockets is unknown
+        selected_row = self.selectedRow()
+        terminateAction.setEnabled(self.tableModel.agentSource() is None and
+                                   (selected_row < 0 or self.tableModel.pid(selected_row) is not None))
         menu.addAction(terminateAction)
         terminateAction.triggered.connect(self.slot_terminate_process)
         # display context menu
-        menu.popup(self.ui.tableView.viewport().mapToGlobal(pos))
+        view = self.treeView if self.treeModel is not None else self.ui.tableView
+        menu.popup(view.viewport().mapToGlobal(pos))
+
+    def selectedRow(self)-> int:
+        """ return row number of selected connection in table model, -1 if it is not selected """
+        if self.treeModel is not None:
+            return self.treeModel.sourceRow(self.treeView.currentIndex())
+        selected_inds = self.ui.tableView.selectedIndexes()
+        return selected_inds[0].row() if len(selected_inds) > 0 else -1
 
     @Slot()
     def slot_terminate_process(self):
         """ Handle for process termination"""
-        selected_inds = self.ui.tableView.selectedIndexes()
-        if len(selected_inds) == 0:
+        selected_row = self.selectedRow()
+        if selected_row < 0 or self.tableModel.pid(selected_row) is None:
             return
         self.timer.stop()                                       # stop updating data on the window
-        selected_row = selected_inds[0].row()
         # create message box for confirmation process termination
         ans = QMessageBox.warning(self, "Process termination",
                                   f"Terminate the process <{self.tableModel.process(selected_row)}>?",
@@ -124,15 +316,229 @@ class MainWindow(QMainWindow):
 
     @Slot()
     def slot_action1_seconds(self):
-        self.timer.setInterval(TIMER_VALUES[0])
+        self.setFixedInterval(TIMER_VALUES[0])
 
     @Slot()
     def slot_action2_seconds(self):
-        self.timer.setInterval(TIMER_VALUES[1])
+        self.setFixedInterval(TIMER_VALUES[1])
 
     @Slot()
     def slot_action5_seconds(self):
-        self.timer.setInterval(TIMER_VALUES[2])
+        self.setFixedInterval(TIMER_VALUES[2])
+
+    @Slot()
+    def slot_action_auto(self):
+        self.autoUpdate = True
+        self.adaptiveInterval.reset(self.timer.interval())
+        self.timer.setSingleShot(True)
+        if not self.updatePaused:
+            self.timer.start(self.adaptiveInterval.interval)
+
+    @Slot()
+    def slot_filter_changed(self):
+        """ Build collection filter by checked actions of filter menu """
+        protocols = [protocol for action, protocol in self.filterActions if action.isChecked()]
+        statuses = ("LISTEN",) if self.ui.actionListening_Only.isChecked() else None
+        self.tableModel.setCollectionFilter(CollectionFilter(protocols, statuses))
+        self.tableModel.updateData()
+
+    @Slot()
+    def slot_group_changed(self):
+        """ show connections grouped by process in tree or ungrouped in table """
+        self.ui.actionGroup_by_Protocol.setEnabled(self.ui.actionGroup_by_Process.isChecked())
+        self.ui.actionGroup_by_State.setEnabled(self.ui.actionGroup_by_Process.isChecked())
+        if not self.ui.actionGroup_by_Process.isChecked():
+            if self.treeModel is not None:
+                self.treeView.setModel(None)
+                self.treeModel.detach()
+                self.treeModel.deleteLater()
+                self.treeModel = None
+            self.treeView.hide()
+            self.ui.tableView.show()
+            return
+        levels = ('process',)
+        if self.ui.actionGroup_by_Protocol.isChecked():
+            levels += ('protocol',)
+        if self.ui.actionGroup_by_State.isChecked():
+            levels += ('state',)
+        if self.treeModel is None:
+            # tree is made of rows of table model, no collection is requested
+            self.treeModel = TLTreeModel(self.tableModel, levels)
+            self.treeView.setModel(self.treeModel)
+        else:
+            self.treeModel.setLevels(levels)
+        self.ui.tableView.hide()
+        self.treeView.show()
+
+    @Slot()
+    def applyRowFilter(self):
+        """ show only rows accepted by expression of filter bar, invalid expression is marked
+            and the previous filter is kept """
+        self.filterTimer.stop()
+        expression = self.filterEdit.text()
+        try:
+            row_filter = RowFilter(expression)
+        except ValueError as e:
+            self.filterEdit.setStyleSheet("QLineEdit { color: red; }")
+            self.filterEdit.setToolTip(str(e))
+            self.ui.statusBar.showMessage(f"Filter: {e}", 5000)
+            return
+        self.filterEdit.setStyleSheet("")
+        self.filterEdit.setToolTip("")
+        current = self.tableModel.rowFilter()
+        if (current.expression if current is not None else '') != row_filter.expression:
+            self.tableModel.setRowFilter(row_filter)
+
+    @Slot(object)
+    def updatePerformanceInfo(self, profile):
+        """ show durations of stages of the last update in status bar and write them in log """
+        if self.profileLog is not None:
+            self.profileLog.write(profile)
+        if not self.ui.actionPerformance.isChecked():
+            return
+        stages = ' | '.join(f'{stage} {duration * 1000:.1f} ms' for stage, duration in profile.stages.items())
+        dns_requests = profile.counter('dns_hits') + profile.counter('dns_misses')
+        dns_hit_rate = f"{100 * profile.counter('dns_hits') / dns_requests:.0f}%" if dns_requests else "-"
+        self.performanceLabel.setText(f"{stages} | rows in {profile.counter('rows_in')}, "
+                                      f"diffed {profile.counter('rows_diffed')} | "
+                                      f"data() {profile.counter('data_calls')} | DNS hits {dns_hit_rate}")
+
+    def updateProfiling(self):
+        self.tableModel.setProfiling(self.ui.actionPerformance.isChecked() or self.profileLog is not None)
+
+    @Slot(bool)
+    def slot_performance(self, flag: bool):
+        self.performanceLabel.setVisible(flag)
+        if not flag:
+            self.performanceLabel.clear()
+        self.updateProfiling()
+
+    @Slot(bool)
+    def slot_performance_log(self, flag: bool):
+        """ write profiles of updates in file as JSON lines """
+        if flag:
+            filename, _ = QFileDialog.getSaveFileName(self, "Performance log", "tlview_profile.jsonl",
+                                                      "JSON lines (*.jsonl);;All files (*)")
+            if not filename:
+                self.ui.actionPerformance_Log.setChecked(False)
+                return
+            try:
+                self.profileLog = ProfileLog(filename)
+            except OSError as e:
+                QMessageBox.critical(self, "Performance log", f"Unable to open file: {e}", QMessageBox.Ok)
+                self.ui.actionPerformance_Log.setChecked(False)
+                return
+        elif self.profileLog is not None:
+            self.profileLog.close()
+            self.profileLog = None
+        self.updateProfiling()
+
+    @Slot(bool)
+    def slot_record_history(self, flag: bool):
+        """ write deltas of table in history file """
+        try:
+            self.tableModel.setRecording(HISTORY_FILENAME if flag else None)
+        except (OSError, ValueError) as e:
+            self.ui.actionRecord_History.setChecked(False)
+            QMessageBox.critical(self, "Record history", f"Unable to record history: {e}", QMessageBox.Ok)
+
+    @Slot(bool)
+    def slot_record_intervals(self, flag: bool):
+        """ write lifetimes of connections in database, it is queried by python -m tlintervals """
+        try:
+            self.tableModel.setIntervalStore(INTERVALS_FILENAME if flag else None)
+        except sqlite3.Error as e:
+            self.ui.actionRecord_Intervals.setChecked(False)
+            QMessageBox.critical(self, "Record intervals", f"Unable to record intervals: {e}", QMessageBox.Ok)
+
+    @Slot()
+    def slot_open_history(self):
+        """ show history of file with time slider instead of live connections """
+        filename = QFileDialog.getOpenFileName(self, "Open history", HISTORY_FILENAME,
+                                               "History files (*.tlh);;All files (*)")[0]
+        if not filename:
+            return
+        try:
+            reader = HistoryReader(filename)
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, "Open history", f"Unable to open history: {e}", QMessageBox.Ok)
+            return
+        if len(reader.keyframes) == 0:
+            reader.close()
+            QMessageBox.information(self, "Open history", "History is empty", QMessageBox.Ok)
+            return
+        if self.historyReader is not None:
+            self.historyReader.close()
+        self.historyReader = reader
+        self.tableModel.startReplay(reader)
+        self.refreshReplayRange()
+        self.replaySlider.setValue(self.replaySlider.maximum())
+        self.replayToolBar.show()
+        self.replayToSlider()
+
+    @Slot()
+    def refreshReplayRange(self):
+        """ history can be written now, new records extend range of slider """
+        self.historyReader.refresh()
+        self.replaySlider.setRange(0, int(self.historyReader.end_time() - self.historyReader.start_time()))
+
+    @Slot()
+    def replayToSlider(self):
+        if not self.tableModel.isReplaying():
+            return
+        if self.replaySlider.value() == self.replaySlider.maximum():
+            replay_time = self.historyReader.end_time()
+        else:
+            replay_time = self.historyReader.start_time() + self.replaySlider.value()
+        shown_time = self.tableModel.replayTo(replay_time)
+        self.replayTimeLabel.setText(time.strftime(" %Y-%m-%d %H:%M:%S ", time.localtime(shown_time)))
+
+    @Slot()
+    def slot_live(self):
+        """ leave history and show live connections """
+        self.replayTimer.stop()
+        self.replayToolBar.hide()
+        self.tableModel.stopReplay()
+        self.historyReader.close()
+        self.historyReader = None
+
+    @Slot()
+    def slot_connect_agent(self):
+        """ show connections of agent (python -m tlagent) instead of local connections """
+        text, ok = QInputDialog.getText(self, "Connect to agent", "Address of agent (host:port):",
+                                        QLineEdit.Normal, self.agentAddress)
+        if not ok or not text.strip():
+            return
+        try:
+            host, port = parse_address(text)
+        except ValueError as e:
+            QMessageBox.critical(self, "Connect to agent", f"Wrong address: {e}", QMessageBox.Ok)
+            return
+        self.agentAddress = text.strip()
+        # source connects in background, state of connection is shown in status bar
+        self.tableModel.setAgentSource(AgentSource(host, port))
+        self.ui.actionDisconnect_from_Agent.setEnabled(True)
+        self.agentLabel.show()
+        self.updateAgentInfo()
+
+    @Slot()
+    def slot_disconnect_agent(self):
+        """ show local connections again """
+        self.tableModel.setAgentSource(None)
+        self.ui.actionDisconnect_from_Agent.setEnabled(False)
+        self.agentLabel.hide()
+
+    @Slot()
+    def updateAgentInfo(self):
+        source = self.tableModel.agentSource()
+        if source is None:
+            return
+        if source.connected:
+            self.agentLabel.setText(f"Agent {source}: {source.bytesReceived // 1024} KiB received")
+        elif source.error is not None:
+            self.agentLabel.setText(f"Agent {source}: {source.error}, reconnecting...")
+        else:
+            self.agentLabel.setText(f"Agent {source}: connecting...")
 
     @Slot()
     def slot_about(self):
@@ -145,19 +551,51 @@ class MainWindow(QMainWindow):
         if self.filename_save == '':
             self.save_table_dialog()
         if self.filename_save != '':
-            print("file created!!!")
-            self.tableModel.writeDataInFile()
+            self.startExport()
 
     @Slot()
     def slot_save_as(self):
         self.save_table_dialog()
         if self.filename_save != '':
-            print("file created!!!")
-            self.tableModel.writeDataInFile()
+            self.startExport()
 
     @Slot()
     def save_table_dialog(self):
         filename = f"/home/{self.tableModel.filename()}"
-        filter = f"Text files (*.{TLTableModel.DEFAULT_EXTANSIONS[0]} *.{TLTableModel.DEFAULT_EXTANSIONS[1]})"
+        filter = f"Text files (*.{TLTableModel.DEFAULT_EXTANSIONS[0]} *.{TLTableModel.DEFAULT_EXTANSIONS[1]});;" \
+                 f"JSON Lines (*.jsonl);;SQLite database (*.sqlite *.db)"
         self.filename_save = QFileDialog.getSaveFileName(self, "Save file", filename, filter)[0]
         self.tableModel.setFilename(self.filename_save)
+
+    def startExport(self):
+        """ write snapshot of table in file in background, window is not blocked """
+        if self.tableExport is not None:
+            QMessageBox.information(self, "Save file", "The previous file is still being saved", QMessageBox.Ok)
+            return
+        self.tableExport = self.tableModel.exportData(on_progress=self.exportProgress.emit,
+                                                      on_finished=self.exportFinished.emit)
+        self.exportDialog = QProgressDialog(f"Saving {self.tableExport.filename}...", "Cancel",
+                                            0, max(self.tableExport.countRows, 1), self)
+        self.exportDialog.setWindowTitle("Save file")
+        self.exportDialog.setMinimumDuration(500)
+        self.exportDialog.canceled.connect(self.tableExport.cancel)
+        self.tableExport.start()
+
+    @Slot(int, int)
+    def updateExportProgress(self, written: int, count: int):
+        if self.exportDialog is not None:
+            self.exportDialog.setValue(min(written, count))
+
+    @Slot(bool, str)
+    def finishExport(self, ok: bool, error: str):
+        filename = self.tableExport.filename
+        cancelled = self.tableExport.is_cancelled()
+        self.tableExport = None
+        self.exportDialog.canceled.disconnect()
+        self.exportDialog.reset()
+        self.exportDialog.deleteLater()
+        self.exportDialog = None
+        if ok:
+            self.ui.statusBar.showMessage(f"Saved {filename}", 5000)
+        elif not cancelled:
+            QMessageBox.critical(self, "Save file", f"Unable to save file: {error}", QMessageBox.Ok)
@@ -1,49 +1,135 @@
+import time
 import psutil
+import heapq
+import itertools
 import threading
+import traceback
 
-class MultiThread:
-    """ Provides functionality for parallelizing the work of methods of other classes. """
-    __MAX_COUNT_THREADS = psutil.cpu_count() - 1 if psutil.cpu_count() else 1       # calculate count logical cpus
-    def __init__(self):
-        self.__threads = []             # list of active threads
 
-    def max_count_threads(self)-> int:
-        return self.__MAX_COUNT_THREADS
+MAX_COUNT_THREADS = psutil.cpu_count() - 1 if psutil.cpu_count() else 1       # calculate count logical cpus
 
-    def remove_dead_threads(self):
-        """ Removes all thread that finished work """
-        dead_threads = [thread for thread in self.__threads if not thread.is_alive()]
-        for thread in dead_threads:
-            self.__threads.remove(thread)
+class WorkerPool:
+    """ Fixed pool of threads that calls a function for queued arguments.
+        An argument is queued once while it is waiting or in work.
+        Arguments are taken in order of priority (less value - higher priority).
+        If timeout is given, then call that lasts longer is reported by on_timeout
+        and its late result is dropped. Thread of such call is not replaced, so the
+        number of threads stays fixed even when calls hang. """
+    def __init__(self, func, count_threads: int = MAX_COUNT_THREADS, timeout: float = None,
+                 on_result = None, on_timeout = None):
+        """ * func - function(argument) -> result;
+            * timeout - the number of seconds for one call, None - no limit;
+            * on_result - function(argument, result) that is called from worker thread after call in time;
+            * on_timeout - function(argument) that is called from watchdog thread when time of call is out """
+        self.__func = func
+        self.__count_threads = max(count_threads, 1)
+        self.__timeout = timeout
+        self.__on_result = on_result
+        self.__on_timeout = on_timeout
+        self.__threads = []                     # list of started threads
+        self.__watchdog = None                  # thread that reports calls out of time
+        self.__queue = []                       # heap of tuples(priority, sequence number, argument)
+        self.__priorities = {}                  # waiting argument -> its priority
+        self.__in_work = {}                     # argument processed by thread now -> sequence number of call
+        self.__deadlines = []                   # heap of tuples(deadline, sequence number, argument) of calls
+        self.__expired = set()                  # arguments in work whose time is out, their results are dropped
+        self.__sequence = itertools.count()     # keeps order of arguments with equal priorities
+        self.__condition = threading.Condition()
+        self.__stopped = False
 
-    def run_thread(self, func, *args)-> bool:
-        """ Runs a function on a new thread.
+    def put(self, arg, priority: int = 0)-> bool:
+        """ Queues argument or raises priority of already waiting argument.
             return:
-               False - cannot be started since the number
-                       of threads is equal to the number of logical cores
-               True - function run in new thread"""
-        self.remove_dead_threads()
-        if len(self.__threads) < self.max_count_threads():
-            thread = threading.Thread(target=func, args=args, daemon=True)
-            thread.work_function = func
-            thread.work_args = args
-            self.__threads.append(thread)
-            thread.start()
+               False - argument is in work or is waiting with the same or higher priority
+               True - argument queued """
+        with self.__condition:
+            if self.__stopped or arg in self.__in_work:
+                return False
+            current = self.__priorities.get(arg, None)
+            if current is not None and current <= priority:
+                return False
+            # entry with the old priority stays in the heap and is skipped later
+            self.__priorities[arg] = priority
+            heapq.heappush(self.__queue, (priority, next(self.__sequence), arg))
+            if len(self.__threads) < self.__count_threads:
+                thread = threading.Thread(target=self.__work, daemon=True)
+                self.__threads.append(thread)
+                thread.start()
+            if self.__timeout is not None and self.__watchdog is None:
+                self.__watchdog = threading.Thread(target=self.__watch, daemon=True)
+                self.__watchdog.start()
+            self.__condition.notify_all()
             return True
-        return False
-
-    def find_args_not_in_threads(self, func, *args)-> list:
-        """ The function looks for arguments that
-            are not currently calculated by other threads."""
-        not_in_work = []         # arguments not involved in settlement
-        # prepare list threads that work with func
-        threads = [thread for thread in self.__threads if thread.work_function == func]
-        for arg in args:
-            flag = True
-            for thread in threads:
-                if arg in thread.work_args:
-                    flag = False
-                    break
-            if flag:
-                not_in_work.append(arg)
-        return not_in_work
\ No newline at end of file
+
+    def __work(self):
+        while True:
+            with self.__condition:
+                while not self.__stopped and not self.__queue:
+                    self.__condition.wait()
+                if self.__stopped:
+                    return
+                priority, _, arg = heapq.heappop(self.__queue)
+                if self.__priorities.get(arg, None) != priority:
+                    continue                    # outdated entry
+                del self.__priorities[arg]
+                call = self.__in_work[arg] = next(self.__sequence)
+                if self.__timeout is not None:
+                    heapq.heappush(self.__deadlines, (time.monotonic() + self.__timeout, call, arg))
+                    self.__condition.notify_all()
+            try:
+                result = self.__func(arg)
+                failed = False
+            except Exception:
+                # thread is kept for other arguments
+                traceback.print_exc()
+                result, failed = None, True
+            with self.__condition:
+                del self.__in_work[arg]
+                in_time = arg not in self.__expired
+                self.__expired.discard(arg)
+            if in_time and not failed and self.__on_result is not None:
+                self.__on_result(arg, result)
+
+    def __watch(self):
+        """ reports calls whose time is out """
+        while True:
+            expired = []
+            with self.__condition:
+                now = time.monotonic()
+                # entries of finished calls are dropped, argument can be in work again by other call
+                while self.__deadlines and (self.__deadlines[0][0] <= now or
+                                            self.__in_work.get(self.__deadlines[0][2], None) != self.__deadlines[0][1]):
+                    deadline, call, arg = heapq.heappop(self.__deadlines)
+                    if self.__in_work.get(arg, None) == call and arg not in self.__expired:
+                        self.__expired.add(arg)
+                        expired.append(arg)
+                if not expired:
+                    if self.__stopped:
+                        return
+                    self.__condition.wait(self.__deadlines[0][0] - now if self.__deadlines else None)
+                    continue
+            if self.__on_timeout is not None:
+                for arg in expired:
+                    self.__on_timeout(arg)
+
+    def stop(self):
+        """ Stops threads after current work, waiting arguments are dropped """
+        with self.__condition:
+            self.__stopped = True
+            self.__queue.clear()
+            self.__priorities.clear()
+            self.__condition.notify_all()
+
+    def count_threads(self)-> int:
+        return self.__count_threads
+
+    def count_started_threads(self)-> int:
+        """ count of started worker threads, it is never more than count_threads() """
+        return len(self.__threads)
+
+    def count_waiting(self)-> int:
+        return len(self.__priorities)
+
+    def __contains__(self, arg):
+        with self.__condition:
+            return arg in self.__priorities or arg in self.__in_work
@@ -0,0 +1,144 @@
+""" Streaming of connection table from Agent to AgentSource over loopback with stub load function """
+import time
+import socket
+import unittest
+from unittest import mock
+import tlagent
+from tlcore import TLCore
+from tlagent import Agent, AgentSource
+
+
+def wait_for(condition, timeout: float = 5.0)-> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class StubTable:
+    """ load function of TLCore, table is changed by tests between calls """
+    def __init__(self, count: int):
+        self.core = None                        # TLCore that generates primary keys
+        self.rows = {port: self.row(port) for port in range(1000, 1000 + count)}    # local port -> row
+
+    @staticmethod
+    def row(port: int, status: str = 'ESTABLISHED')-> list:
+        return ['nginx', 10, (socket.AF_INET, socket.SOCK_STREAM), bytes((127, 0, 0, 1)), port,
+                bytes((10, 0, 0, 1)), 443, status]
+
+    def __call__(self, profile = None)-> list:
+        return [row + [self.core.pk()] for row in self.rows.values()]
+
+
+class AgentTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(tlagent, 'RECONNECT_INTERVAL', 0.05)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.table = StubTable(50)
+        self.agent = self.start_agent(('127.0.0.1', 0))
+        self.source = AgentSource(*self.agent.address)
+        self.addCleanup(self.source.close)
+        self.core = TLCore(backend=object())
+        self.core.set_source(self.source)
+        self.mirror = {}                        # primary key -> row after applied deltas
+
+    def start_agent(self, address: tuple)-> Agent:
+        core = TLCore(backend=object(), load_function=self.table)
+        self.table.core = core
+        agent = Agent(core, address, 0.01)
+        self.addCleanup(agent.stop)
+        agent.update()
+        return agent
+
+    def apply(self, delta):
+        if delta.keyframe:
+            self.mirror.clear()
+        for pk in delta.del_pks:
+            self.assertIn(pk, self.mirror)
+            del self.mirror[pk]
+        for row in delta.upd_rows:
+            self.assertIn(row[8], self.mirror)
+            self.mirror[row[8]] = row
+        for row in delta.new_rows:
+            self.assertNotIn(row[8], self.mirror)
+            self.mirror[row[8]] = row
+
+    def synchronize(self)-> list:
+        """ send changes of agent table and apply deltas until the copy matches it, return deltas """
+        deltas = []
+        def synchronized():
+            # client can be accepted after the first update, it gets keyframe at the next one
+            self.agent.update()
+            expected = {pk: list(row) for pk, row in self.agent.rows.items()}
+            delta = self.core.collect()
+            if not delta.is_empty() or delta.keyframe:
+                deltas.append(delta)
+                self.apply(delta)
+            return {pk: list(row) for pk, row in self.mirror.items()} == expected
+        self.assertTrue(wait_for(synchronized))
+        return deltas
+
+    def test_keyframe(self):
+        deltas = self.synchronize()
+        self.assertTrue(deltas[0].keyframe)
+        self.assertEqual(len(self.mirror), 50)
+        self.assertEqual(deltas[-1].aggregates.total, 50)
+
+    def test_changes(self):
+        self.synchronize()
+        pks = {row[4]: pk for pk, row in self.mirror.items()}
+        del self.table.rows[1000]
+        self.table.rows[1001][7] = 'CLOSE_WAIT'
+        self.table.rows[2000] = StubTable.row(2000)
+        deltas = self.synchronize()
+        self.assertEqual(len(deltas), 1)
+        delta = deltas[0]
+        self.assertFalse(delta.keyframe)
+        self.assertEqual(list(delta.del_pks), [pks[1000]])
+        self.assertEqual([row[4] for row in delta.new_rows], [2000])
+        self.assertEqual([row[8] for row in delta.upd_rows], [pks[1001]])
+        self.assertEqual(list(delta.chg_pks), [pks[1001]])
+        self.assertEqual(delta.aggregates.statuses['CLOSE_WAIT'], 1)
+
+    def test_reconnect(self):
+        self.synchronize()
+        address = self.agent.address
+        self.agent.stop()
+        self.assertTrue(wait_for(lambda: not self.source.connected))
+        self.table.rows[2000] = StubTable.row(2000)
+        # new agent has other primary keys, keyframe of new connection replaces all rows
+        self.agent = self.start_agent(address)
+        self.synchronize()
+        self.assertTrue(self.source.connected)
+        self.assertEqual(len(self.mirror), 51)
+
+    def test_stalled_client(self):
+        self.synchronize()
+        stalled = socket.socket()
+        stalled.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        stalled.connect(self.agent.address)
+        self.addCleanup(stalled.close)
+        self.assertTrue(wait_for(lambda: len(self.agent.clients) == 2))
+        # buffers of system take a little, so frames wait in the queue of the client
+        self.agent.clients[1].sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        self.table.rows.update((port, StubTable.row(port)) for port in range(3000, 8000))
+        backlogs = []
+        with mock.patch.object(tlagent, 'MAX_BACKLOG', 1 << 16):
+            for i in range(20):
+                for port in range(3000, 8000):
+                    self.table.rows[port][7] = 'CLOSE_WAIT' if i % 2 else 'ESTABLISHED'
+                started = time.monotonic()
+                self.synchronize()
+                # other clients and collection are not delayed by client that doesn't read
+                self.assertLess(time.monotonic() - started, tlagent.SEND_TIMEOUT / 2)
+                backlogs.append(self.agent.clients[1].backlog())
+        keyframe = len(tlagent.frame(tlagent.KIND_KEYFRAME, tlagent.RecordEncoder().keyframe(self.agent.rows.values())))
+        self.assertGreater(max(backlogs), 0)
+        self.assertLessEqual(max(backlogs), (1 << 16) + keyframe)
+        self.assertEqual(self.agent.clients[0].backlog(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
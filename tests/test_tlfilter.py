@@ -0,0 +1,182 @@
+""" Filter expressions of tlfilter and filtered deltas of TLCore """
+import random
+import socket
+import unittest
+from tlcore import TLCore
+from tlfilter import RowFilter
+
+
+TCP = (socket.AF_INET, socket.SOCK_STREAM)
+UDP6 = (socket.AF_INET6, socket.SOCK_DGRAM)
+
+
+def row(process: str = 'nginx', pid: int = 10, protocol: tuple = TCP, laddr: str = '127.0.0.1', lport: int = 1000,
+        raddr: str = '10.0.0.1', rport: int = 443, status: str = 'ESTABLISHED')-> list:
+    family = protocol[0]
+    return [process, pid, protocol, socket.inet_pton(family, laddr), lport, socket.inet_pton(family, raddr), rport,
+            status, 1]
+
+
+class RowFilterTest(unittest.TestCase):
+    def assertAccepts(self, expression: str, accepted: list, rejected: list):
+        row_filter = RowFilter(expression)
+        for accepted_row in accepted:
+            self.assertTrue(row_filter.accepts(accepted_row), (expression, accepted_row))
+        for rejected_row in rejected:
+            self.assertFalse(row_filter.accepts(rejected_row), (expression, rejected_row))
+
+    def test_fields(self):
+        self.assertAccepts('proc:NGI', [row(), row('my nginx')], [row('sshd'), row(None)])
+        self.assertAccepts('process:ng*x', [row()], [row('nginx2')])
+        self.assertAccepts('pid:10', [row()], [row(pid=1), row(pid=None)])
+        self.assertAccepts('proto:UDP6', [row(protocol=UDP6, laddr='::1', raddr='::2')], [row()])
+        self.assertAccepts('STATE:established', [row()], [row(status='LISTEN')])
+        self.assertAccepts('status:NONE', [row(status='NONE')], [row()])
+        self.assertAccepts('lport:1000', [row()], [row(rport=1000, lport=1)])
+        self.assertAccepts('rport:443', [row()], [row(lport=443, rport=1)])
+        self.assertAccepts('port:443', [row(), row(lport=443, rport=1)], [row(rport=80)])
+        self.assertAccepts('laddr:127.0.0.1', [row()], [row(laddr='127.0.0.2')])
+        self.assertAccepts('raddr:10.0.0.1', [row()], [row(raddr='10.0.0.2')])
+        self.assertAccepts('addr:10.0.0.1', [row(), row(laddr='10.0.0.1', raddr='1.1.1.1')], [row(raddr='1.1.1.1')])
+
+    def test_values(self):
+        self.assertAccepts('rport:80,443', [row(), row(rport=80)], [row(rport=8080)])
+        self.assertAccepts('rport:1024-2048,443', [row(rport=1024), row(rport=2048), row()],
+                           [row(rport=1023), row(rport=2049)])
+        self.assertAccepts('port:65535', [row(lport=65535)], [row()])
+        self.assertAccepts('raddr:10.0.0.0/8', [row(), row(raddr='10.255.255.255')], [row(raddr='11.0.0.0')])
+        self.assertAccepts('raddr:10.0.0.7/8', [row()], [row(raddr='11.0.0.0')])
+        self.assertAccepts('raddr:2001:db8::/32', [row(protocol=UDP6, laddr='::1', raddr='2001:db8::1')],
+                           [row(protocol=UDP6, laddr='::1', raddr='2001:db9::1'), row()])
+        # IPv4 network doesn't match IPv6 addresses
+        self.assertAccepts('raddr:0.0.0.0/0', [row()], [row(protocol=UDP6, laddr='::1', raddr='::')])
+        self.assertAccepts('proc:"my app"', [row('my app')], [row()])
+
+    def test_terms(self):
+        self.assertAccepts('nginx', [row()], [row('sshd')])
+        self.assertAccepts('nginx sshd', [], [row(), row('sshd')])
+        self.assertAccepts('nginx rport:443 state:ESTABLISHED', [row()], [row(rport=80), row(status='LISTEN')])
+        self.assertAccepts('-state:LISTEN', [row()], [row(status='LISTEN')])
+        self.assertAccepts('!pid:10 !nginx', [row('sshd', 1)], [row(pid=1), row('sshd')])
+        self.assertAccepts('-', [row('a-b')], [row()])
+        for expression in ('', '   '):
+            self.assertTrue(RowFilter(expression).is_empty())
+            self.assertAccepts(expression, [row(None, None)], [])
+        row_filter = RowFilter(' nginx  rport:443 ')
+        self.assertFalse(row_filter.is_empty())
+        self.assertEqual(str(row_filter), 'nginx  rport:443')
+        self.assertEqual(repr(row_filter), "RowFilter('nginx  rport:443')")
+
+    def test_errors(self):
+        for expression in ('user:root', 'pid:x', 'pid:-1', 'rport:1-x', 'lport:', 'state:,', 'raddr:10.0.0.256',
+                           'addr:host', 'proto:icmp', 'proc:"my app'):
+            with self.assertRaises(ValueError, msg=expression):
+                RowFilter(expression)
+
+
+class StubTable:
+    """ load function of TLCore, table is changed by tests between calls """
+    def __init__(self, rnd: random.Random):
+        self.rnd = rnd
+        self.core = None                        # TLCore that generates primary keys
+        self.rows = {}                          # local port -> row without primary key
+        self.table = []                         # the last loaded snapshot, primary keys are set by differ
+        self.port = 1000
+
+    def change(self):
+        rnd = self.rnd
+        for port in list(self.rows):
+            if rnd.random() < 0.1:
+                del self.rows[port]
+            elif rnd.random() < 0.2:
+                self.rows[port] = self.rows[port][:7] + [rnd.choice(('ESTABLISHED', 'LISTEN', 'CLOSE_WAIT'))]
+            elif rnd.random() < 0.1:
+                self.rows[port] = self.rows[port][:1] + [rnd.randrange(3)] + self.rows[port][2:]
+        for _ in range(rnd.randrange(8)):
+            self.rows[self.port] = row(rnd.choice(('nginx', 'sshd')), rnd.randrange(3), lport=self.port,
+                                       rport=rnd.choice((80, 443)), status=rnd.choice(('ESTABLISHED', 'LISTEN')))[:8]
+            self.port += 1
+
+    def __call__(self, profile = None)-> list:
+        self.table = [table_row + [self.core.pk()] for table_row in self.rows.values()]
+        return self.table
+
+
+class FilterDeltaTest(unittest.TestCase):
+    def setUp(self):
+        self.table = StubTable(random.Random(1))
+        self.core = TLCore(backend=object(), load_function=self.table)
+        self.table.core = self.core
+        self.mirror = {}                        # primary key -> row after applied deltas
+
+    def collect(self, row_filter: RowFilter = None):
+        """ apply the next delta to mirror, it must contain rows of table accepted by filter """
+        delta = self.core.collect()
+        for pk in delta.del_pks:
+            self.assertIn(pk, self.mirror)
+            del self.mirror[pk]
+        for new_row in delta.new_rows:
+            self.assertNotIn(new_row[8], self.mirror)
+            self.mirror[new_row[8]] = new_row
+        for upd_row in delta.upd_rows:
+            self.assertIn(upd_row[8], self.mirror)
+            self.mirror[upd_row[8]] = upd_row
+        self.assertTrue(set(delta.chg_pks) <= {upd_row[8] for upd_row in delta.upd_rows})
+        accepted = {table_row[8]: table_row for table_row in self.table.table
+                    if row_filter is None or row_filter.accepts(table_row)}
+        self.assertEqual(self.mirror, accepted)
+        shown = self.core._TLCore__shown
+        self.assertEqual(shown, set(accepted) if row_filter is not None else None)
+        return delta
+
+    def test_transitions(self):
+        row_filter = None
+        filters = ['state:ESTABLISHED', 'state:ESTABLISHED', 'rport:80', 'sshd -pid:1', '', 'pid:0,2', None]
+        for step in range(70):
+            self.table.change()
+            if step % 10 == 9:
+                expression = filters[step // 10]
+                row_filter = RowFilter(expression) if expression is not None else None
+                self.core.set_row_filter(row_filter)
+                if row_filter is not None and row_filter.is_empty():
+                    row_filter = None
+            self.collect(row_filter)
+
+    def test_set_and_clear(self):
+        """ table is not changed, so deltas contain only changes of shown rows """
+        self.table.change()
+        self.collect()
+        listen = {pk for pk, shown_row in self.mirror.items() if shown_row[7] == 'LISTEN'}
+        others = set(self.mirror) - listen
+        self.assertTrue(listen and others)
+        row_filter = RowFilter('state:LISTEN')
+        self.core.set_row_filter(row_filter)
+        delta = self.collect(row_filter)
+        self.assertEqual((set(delta.del_pks), delta.new_rows, delta.upd_rows), (others, [], []))
+        self.core.set_row_filter(RowFilter('-state:LISTEN'))
+        delta = self.collect(RowFilter('-state:LISTEN'))
+        self.assertEqual(set(delta.del_pks), listen)
+        self.assertEqual({new_row[8] for new_row in delta.new_rows}, others)
+        self.core.set_row_filter(None)
+        delta = self.collect()
+        self.assertEqual(delta.del_pks, ())
+        self.assertEqual({new_row[8] for new_row in delta.new_rows}, listen)
+        delta = self.collect()
+        self.assertTrue(delta.is_empty())
+
+    def test_resync(self):
+        row_filter = RowFilter('rport:443')
+        self.core.set_row_filter(row_filter)
+        for _ in range(3):
+            self.table.change()
+            self.collect(row_filter)
+        self.core.request_resync()
+        self.table.change()
+        self.mirror.clear()
+        delta = self.collect(row_filter)
+        self.assertTrue(delta.keyframe)
+        self.assertEqual(delta.del_pks, ())
+
+
+if __name__ == '__main__':
+    unittest.main()
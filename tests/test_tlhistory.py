@@ -0,0 +1,151 @@
+""" Binary format of history records and replay of history files """
+import os
+import random
+import socket
+import tempfile
+import unittest
+from tlsnapshot import TableDelta
+from tlhistory import (RecordEncoder, RecordDecoder, HistoryRecorder, HistoryReader, HistoryReplay, delta_between,
+                       MAGIC, KIND_KEYFRAME, KIND_DELTA, FLAG_ZLIB, COMPRESS_SIZE)
+
+
+def random_row(rnd: random.Random, pk: int)-> list:
+    family = rnd.choice((socket.AF_INET, socket.AF_INET6))
+    size = 4 if family == socket.AF_INET else 16
+    return [rnd.choice(('nginx', 'sshd', 'сервер', None)), rnd.choice((1, 2, 2 ** 40, None)),
+            (family, rnd.choice((socket.SOCK_STREAM, socket.SOCK_DGRAM))),
+            bytes(rnd.randrange(256) for _ in range(size)), rnd.choice((0, 80, 65535)),
+            bytes(rnd.randrange(256) for _ in range(size)), rnd.randrange(65536),
+            rnd.choice(('ESTABLISHED', 'LISTEN', 'NONE')), pk]
+
+
+def next_rows(rnd: random.Random, rows: dict, pk: int)-> dict:
+    """ return copy of table with removed, added and updated rows """
+    new_rows = {}
+    for key, row in rows.items():
+        if rnd.random() < 0.2:
+            continue
+        if rnd.random() < 0.2:
+            row = row[:7] + [rnd.choice(('ESTABLISHED', 'CLOSE_WAIT'))] + row[8:]
+        new_rows[key] = row
+    for i in range(rnd.randrange(1, 5)):
+        new_rows[pk + i] = random_row(rnd, pk + i)
+    return new_rows
+
+
+class RecordCodingTest(unittest.TestCase):
+    def test_round_trip(self):
+        rnd = random.Random(1)
+        encoder = RecordEncoder()
+        decoder = RecordDecoder()
+        rows = {pk: random_row(rnd, pk) for pk in range(20)}
+        rows[2 ** 64 - 1] = [None, None, (socket.AF_INET6, socket.SOCK_DGRAM), bytes(16), 65535,
+                             bytes(16), 65535, None, 2 ** 64 - 1]
+        del_pks, decoded = decoder.decode(KIND_KEYFRAME, encoder.keyframe(list(rows.values())))
+        self.assertIsNone(del_pks)
+        self.assertEqual(decoded, list(rows.values()))
+        for step in range(30):
+            new_rows = next_rows(rnd, rows, 100 + 10 * step)
+            delta = delta_between(rows, new_rows)
+            del_pks, decoded = decoder.decode(KIND_DELTA, encoder.delta(delta))
+            self.assertEqual(del_pks, list(delta.del_pks))
+            self.assertEqual(decoded, delta.new_rows + delta.upd_rows)
+            rows = new_rows
+            if step % 10 == 9:
+                # table of strings starts again
+                del_pks, decoded = decoder.decode(KIND_KEYFRAME, encoder.keyframe(list(rows.values())))
+                self.assertEqual(decoded, list(rows.values()))
+
+    def test_strings_are_written_once(self):
+        encoder = RecordEncoder()
+        rows = [random_row(random.Random(pk), pk) for pk in range(5)]
+        for row in rows:
+            row[0], row[7] = 'nginx', 'ESTABLISHED'
+        encoder.keyframe(rows)
+        payload = encoder.delta(TableDelta((), rows[:1]))
+        self.assertNotIn(b'nginx', payload)
+        self.assertNotIn(b'ESTABLISHED', payload)
+        payload = encoder.delta(TableDelta((), [rows[0][:7] + ['CLOSE_WAIT', 0]]))
+        self.assertIn(b'CLOSE_WAIT', payload)
+
+
+class HistoryFileTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.filename = os.path.join(directory.name, 'history.tlh')
+
+    def reader(self)-> HistoryReader:
+        reader = HistoryReader(self.filename)
+        self.addCleanup(reader.close)
+        return reader
+
+    def test_compression(self):
+        rnd = random.Random(2)
+        recorder = HistoryRecorder(self.filename)
+        small = {0: random_row(rnd, 0)}
+        recorder.record(TableDelta(), list(small.values()), 1.0)
+        large = {pk: random_row(rnd, pk) for pk in range(20)}
+        recorder.record(TableDelta(), list(large.values()), 2.0, keyframe=True)
+        recorder.close()
+        reader = self.reader()
+        self.assertEqual([record[4] for record in reader.records], [0, FLAG_ZLIB])
+        self.assertLess(len(RecordEncoder().keyframe(list(small.values()))), COMPRESS_SIZE)
+        self.assertEqual(reader.payload(1), RecordEncoder().keyframe(list(large.values())))
+        self.assertEqual(HistoryReplay(reader).seek(2.0), large)
+        self.assertEqual(os.path.getsize(self.filename), len(MAGIC) + recorder.bytesWritten)
+
+    def test_keyframe_interval(self):
+        rnd = random.Random(3)
+        recorder = HistoryRecorder(self.filename, keyframe_interval=10.0, keyframe_deltas=3)
+        rows = {}
+        for t in range(12):
+            new_rows = next_rows(rnd, rows, 10 * t) if t != 5 else rows
+            recorder.record(delta_between(rows, new_rows), list(new_rows.values()), float(t))
+            rows = new_rows
+        recorder.record(TableDelta(), list(rows.values()), 25.0)
+        recorder.record(delta_between(rows, rows), list(rows.values()), 26.0, keyframe=True)
+        recorder.close()
+        reader = self.reader()
+        # keyframe after 3 deltas, empty delta at time 5 is not written, keyframe after 10 seconds
+        self.assertEqual([(record[0], record[1]) for record in reader.records],
+                         [(KIND_KEYFRAME, 0.0), (KIND_DELTA, 1.0), (KIND_DELTA, 2.0), (KIND_DELTA, 3.0),
+                          (KIND_KEYFRAME, 4.0), (KIND_DELTA, 6.0), (KIND_DELTA, 7.0), (KIND_DELTA, 8.0),
+                          (KIND_KEYFRAME, 9.0), (KIND_DELTA, 10.0), (KIND_DELTA, 11.0),
+                          (KIND_KEYFRAME, 25.0), (KIND_KEYFRAME, 26.0)])
+        self.assertEqual(reader.keyframes, [0, 4, 8, 11, 12])
+
+    def test_seek(self):
+        rnd = random.Random(4)
+        recorder = HistoryRecorder(self.filename, keyframe_deltas=4)
+        states = [{}]                   # states[t] - table at time t
+        for t in range(1, 30):
+            rows = next_rows(rnd, states[-1], 10 * t)
+            recorder.record(delta_between(states[-1], rows), list(rows.values()), float(t))
+            states.append(rows)
+        recorder.close()
+        replay = HistoryReplay(self.reader())
+        self.assertEqual(len(replay.reader.keyframes), 6)
+        times = [29, 3, 3.5, 14, 12, 13, 2, 28, 0.5, 9, 10, 1, 29, 17] + [rnd.uniform(0, 30) for _ in range(50)]
+        for t in times:
+            rows = replay.seek(t)
+            self.assertEqual(rows, states[int(t)], t)
+            self.assertEqual(replay.time(), float(int(t)) if t >= 1 else 0.0)
+
+    def test_reader_refresh(self):
+        recorder = HistoryRecorder(self.filename)
+        self.addCleanup(recorder.close)
+        rows = {1: random_row(random.Random(5), 1)}
+        recorder.record(TableDelta(), list(rows.values()), 1.0)
+        reader = self.reader()
+        replay = HistoryReplay(reader)
+        new_rows = dict(rows)
+        new_rows[2] = random_row(random.Random(6), 2)
+        recorder.record(delta_between(rows, new_rows), list(new_rows.values()), 2.0)
+        self.assertEqual(replay.seek(2.0), rows)
+        self.assertEqual(reader.refresh(), 1)
+        self.assertEqual(replay.seek(2.0), new_rows)
+
+
+if __name__ == '__main__':
+    unittest.main()
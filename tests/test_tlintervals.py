@@ -0,0 +1,133 @@
+""" Lifetimes of connections written by IntervalStore and queries of tlintervals """
+import os
+import socket
+import sqlite3
+import tempfile
+import unittest
+from tlsnapshot import TableDelta
+from tlintervals import IntervalStore, query_intervals
+
+
+TCP = (socket.AF_INET, socket.SOCK_STREAM)
+TCP6 = (socket.AF_INET6, socket.SOCK_STREAM)
+
+
+def row(pk: int, rport: int = 443, status: str = 'ESTABLISHED', raddr: bytes = bytes((10, 2, 3, 4)),
+        protocol: tuple = TCP, pid: int = 10)-> list:
+    laddr = bytes(len(raddr))
+    return ['nginx', pid, protocol, laddr, 40000 + rport, raddr, rport, status, pk]
+
+
+class IntervalStoreTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.filename = os.path.join(directory.name, 'intervals.sqlite3')
+        self.store = IntervalStore(self.filename, commit_interval=1000)
+        self.addCleanup(self.store.close)
+        self.table = {}                 # primary key -> row of the last snapshot
+
+    def record(self, t: float, new_rows = (), upd_rows = (), del_pks = ()):
+        for pk in del_pks:
+            del self.table[pk]
+        for new_row in list(new_rows) + list(upd_rows):
+            self.table[new_row[8]] = new_row
+        self.store.record(TableDelta(del_pks, new_rows, upd_rows), list(self.table.values()), t)
+
+    def select(self, query: str, parameters = ())-> list:
+        connection = sqlite3.connect(self.filename)
+        try:
+            return connection.execute(query, parameters).fetchall()
+        finally:
+            connection.close()
+
+    def intervals(self)-> list:
+        self.store.commit()
+        return self.select("SELECT remote_port, status, first_seen, last_seen FROM connections ORDER BY id")
+
+    def test_open_and_close(self):
+        self.record(100.0, [row(1, 443), row(2, 80)])
+        self.record(110.0)
+        self.record(120.0, del_pks=[1])
+        # closed connection was seen the last time by the previous snapshot
+        self.assertEqual(self.intervals(), [(443, 'ESTABLISHED', 100.0, 110.0), (80, 'ESTABLISHED', 100.0, 120.0)])
+        self.record(130.0, del_pks=[2])
+        self.record(140.0)
+        self.assertEqual(self.intervals(), [(443, 'ESTABLISHED', 100.0, 110.0), (80, 'ESTABLISHED', 100.0, 120.0)])
+
+    def test_status_changes(self):
+        self.record(100.0, [row(1, status='SYN_SENT')])
+        self.record(110.0, upd_rows=[row(1, status='ESTABLISHED')])
+        self.record(120.0, upd_rows=[row(1, status='CLOSE_WAIT')])
+        self.assertEqual(self.intervals(), [(443, 'CLOSE_WAIT', 100.0, 120.0)])
+        self.assertEqual(self.select("SELECT time, status FROM status_changes ORDER BY time"),
+                         [(100.0, 'SYN_SENT'), (110.0, 'ESTABLISHED'), (120.0, 'CLOSE_WAIT')])
+
+    def test_owner_change(self):
+        self.record(100.0, [row(1, pid=10)])
+        self.record(110.0, upd_rows=[row(1, pid=20)])
+        self.store.commit()
+        self.assertEqual(self.select("SELECT pid, first_seen, last_seen FROM connections ORDER BY id"),
+                         [(10, 100.0, 100.0), (20, 110.0, 110.0)])
+
+    def test_shared_key(self):
+        """ rows of two descriptors of one socket are one connection until both are removed """
+        self.record(100.0, [row(1), row(2)])
+        self.record(110.0, del_pks=[1])
+        self.record(120.0, upd_rows=[row(2, status='CLOSE_WAIT')])
+        self.assertEqual(self.intervals(), [(443, 'CLOSE_WAIT', 100.0, 120.0)])
+        self.record(130.0, del_pks=[2])
+        self.record(140.0, [row(3)])
+        self.assertEqual(self.intervals(), [(443, 'CLOSE_WAIT', 100.0, 120.0), (443, 'ESTABLISHED', 140.0, 140.0)])
+
+    def test_keyframe(self):
+        self.record(100.0, [row(1, 443), row(2, 80)])
+        # primary keys of keyframe are new, connections are matched by endpoints
+        self.table = {3: row(3, 443), 4: row(4, 443), 5: row(5, 22)}
+        self.store.record(TableDelta((), self.table.values()), list(self.table.values()), 110.0, keyframe=True)
+        self.assertEqual(self.intervals(), [(443, 'ESTABLISHED', 100.0, 110.0), (80, 'ESTABLISHED', 100.0, 100.0),
+                                            (22, 'ESTABLISHED', 110.0, 110.0)])
+        self.record(120.0, del_pks=[3])
+        self.record(130.0, del_pks=[4])
+        self.assertEqual(self.intervals()[0], (443, 'ESTABLISHED', 100.0, 120.0))
+
+    def test_batched_commit(self):
+        self.record(100.0, [row(1)])
+        self.record(110.0, upd_rows=[row(1, status='CLOSE_WAIT')])
+        # changes wait for transaction in memory
+        self.assertEqual(self.select("SELECT COUNT(*) FROM connections"), [(0,)])
+        self.assertEqual(self.select("SELECT COUNT(*) FROM status_changes"), [(0,)])
+        # snapshot after commit interval writes all changes by one transaction
+        self.record(1e12, [row(2, 80)])
+        self.assertEqual(self.select("SELECT status, last_seen FROM connections ORDER BY id"),
+                         [('CLOSE_WAIT', 1e12), ('ESTABLISHED', 1e12)])
+        self.assertEqual(self.select("SELECT COUNT(*) FROM status_changes"), [(3,)])
+
+    def test_query_network(self):
+        self.record(100.0, [row(1, raddr=bytes((10, 2, 0, 1))), row(2, raddr=bytes((10, 2, 255, 255))),
+                            row(3, raddr=bytes((10, 3, 0, 0))), row(4, raddr=bytes((10, 1, 255, 255))),
+                            row(5, 5432, raddr=bytes((10, 2, 7, 7))),
+                            row(6, raddr=socket.inet_pton(socket.AF_INET6, '::ffff:10.2.0.1'), protocol=TCP6),
+                            row(7, raddr=socket.inet_pton(socket.AF_INET6, '2001:db8::1'), protocol=TCP6)])
+        self.record(200.0, del_pks=[1])
+        self.store.commit()
+
+        def remote_addresses(**conditions)-> list:
+            query, parameters = query_intervals(**conditions)
+            return [socket.inet_ntop(socket.AF_INET if version == 4 else socket.AF_INET6, raddr)
+                    for version, raddr in self.select(query.replace("SELECT *", "SELECT family, remote_address"),
+                                                      parameters)]
+        self.assertEqual(sorted(remote_addresses(raddr='10.2.0.0/16')), ['10.2.0.1', '10.2.255.255', '10.2.7.7'])
+        self.assertEqual(remote_addresses(raddr='10.2.0.0/16', rport=5432), ['10.2.7.7'])
+        self.assertEqual(remote_addresses(raddr='10.2.0.1'), ['10.2.0.1'])
+        self.assertEqual(remote_addresses(raddr='2001:db8::/32'), ['2001:db8::1'])
+        self.assertEqual(sorted(remote_addresses(raddr='10.2.0.0/16', since=150.0)), ['10.2.255.255', '10.2.7.7'])
+        self.assertEqual(remote_addresses(raddr='10.2.0.0/16', until=50.0), [])
+        # query uses index of remote address
+        query, parameters = query_intervals(raddr='10.2.0.0/16')
+        plan = " ".join(record[-1] for record in self.select("EXPLAIN QUERY PLAN " + query, parameters))
+        self.assertIn("connections_remote_address", plan)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+""" Merge of changed rows into sorted order and background sort give the same order as full sort """
+import random
+import socket
+import unittest
+from tlstorage import ConnectionTable
+from tlsort import merged_order, sort_key_function, SortKeys, BackgroundSort
+
+
+def random_row(rnd: random.Random, pk: int)-> list:
+    family = rnd.choice((socket.AF_INET, socket.AF_INET6))
+    size = 4 if family == socket.AF_INET else 16
+    return [rnd.choice(('nginx', 'sshd', '', None)), rnd.choice((1, 2, None)),
+            (family, rnd.choice((socket.SOCK_STREAM, socket.SOCK_DGRAM))),
+            bytes(rnd.randrange(4) for _ in range(size)), rnd.choice((0, 80, 65535)),
+            bytes(rnd.randrange(4) for _ in range(size)), rnd.randrange(100),
+            rnd.choice(('ESTABLISHED', 'LISTEN', 'NONE')), pk]
+
+
+class MergedOrderTest(unittest.TestCase):
+    def check_merge(self, keys: list, stay: list, moved: set, reverse: bool):
+        order = merged_order(keys.__getitem__, stay, moved, reverse)
+        self.assertEqual(sorted(order), list(range(len(keys))))
+        self.assertEqual([keys[ind] for ind in order], sorted(keys, reverse=reverse))
+        # rows stay keep their order
+        self.assertEqual([ind for ind in order if ind not in moved], stay)
+
+    def test_inserts(self):
+        rnd = random.Random(1)
+        for reverse in (False, True):
+            for _ in range(200):
+                keys = [rnd.randrange(20) for _ in range(rnd.randrange(30))]
+                stay = sorted(range(len(keys)), key=keys.__getitem__, reverse=reverse)
+                count = len(keys)
+                keys += [rnd.randrange(20) for _ in range(rnd.randrange(10))]
+                self.check_merge(keys, stay, set(range(count, len(keys))), reverse)
+
+    def test_removals(self):
+        rnd = random.Random(2)
+        for reverse in (False, True):
+            for _ in range(200):
+                keys = [rnd.randrange(20) for _ in range(rnd.randrange(30))]
+                order = sorted(range(len(keys)), key=keys.__getitem__, reverse=reverse)
+                removed = {ind for ind in order if rnd.random() < 0.3}
+                # rows are renumbered after removal, as in table
+                numbers = {}
+                for ind in range(len(keys)):
+                    if ind not in removed:
+                        numbers[ind] = len(numbers)
+                keys = [key for ind, key in enumerate(keys) if ind not in removed]
+                stay = [numbers[ind] for ind in order if ind not in removed]
+                self.assertEqual(merged_order(keys.__getitem__, stay, (), reverse), stay)
+                self.check_merge(keys, stay, set(), reverse)
+
+    def test_changed_keys(self):
+        rnd = random.Random(3)
+        for reverse in (False, True):
+            for _ in range(200):
+                keys = [rnd.randrange(20) for _ in range(rnd.randrange(1, 30))]
+                order = sorted(range(len(keys)), key=keys.__getitem__, reverse=reverse)
+                moved = set(rnd.sample(range(len(keys)), rnd.randrange(len(keys))))
+                for ind in moved:
+                    keys[ind] = rnd.randrange(20)
+                self.check_merge(keys, [ind for ind in order if ind not in moved], moved, reverse)
+
+    def test_unique_keys(self):
+        rnd = random.Random(4)
+        keys = rnd.sample(range(1000), 100)
+        moved = set(rnd.sample(range(100), 30))
+        stay = sorted((ind for ind in range(100) if ind not in moved), key=keys.__getitem__)
+        self.assertEqual(merged_order(keys.__getitem__, stay, moved), sorted(range(100), key=keys.__getitem__))
+
+
+class SortKeysTest(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(5)
+        self.rows = [random_row(rnd, pk) for pk in range(100)]
+        self.table = ConnectionTable(self.rows)
+
+    def test_sort_key_function(self):
+        for column in range(8):
+            # keys of rows with None values are comparable with others
+            sorted(map(sort_key_function(column), self.rows))
+        ipv4 = [None, 1, (socket.AF_INET, socket.SOCK_STREAM), bytes((255,) * 4), 1, bytes(4), 1, 'NONE', 1]
+        ipv6 = [None, None, (socket.AF_INET6, socket.SOCK_STREAM), bytes(16), 1, bytes(16), 1, 'NONE', 2]
+        self.assertLess(sort_key_function(3)(ipv4), sort_key_function(3)(ipv6))
+        self.assertLess(sort_key_function(1)(ipv6), sort_key_function(1)(ipv4))
+
+    def test_update(self):
+        sort_keys = SortKeys(sort_key_function(7))
+        self.assertEqual(sort_keys.update(self.rows), [row[8] for row in self.rows])
+        changed = [row[:7] + ['CLOSE_WAIT', row[8]] for row in self.rows[:10]]
+        kept = [row[:6] + [row[6] + 1] + row[7:] for row in self.rows[10:20]]
+        self.assertEqual(sort_keys.update(changed + kept), [row[8] for row in changed])
+        self.assertEqual(sort_keys.row_keys(ConnectionTable(changed)), ['CLOSE_WAIT'] * 10)
+        sort_keys.remove(range(5, 50))
+        self.assertEqual(set(sort_keys.keys), set(range(5)) | set(range(50, 100)))
+        # only removed keys are computed again
+        sort_keys.fill(self.table)
+        key = sort_keys.row_key_function(self.table)
+        self.assertEqual([key(ind) for ind in range(5)], ['CLOSE_WAIT'] * 5)
+        self.assertEqual([key(ind) for ind in range(5, 100)], list(map(sort_key_function(7), self.rows[5:])))
+
+    def test_background_sort(self):
+        key_function = sort_key_function(5)
+        keys = {row[8]: key_function(row) for row in self.rows[::2]}
+        for reverse in (False, True):
+            finished = []
+            sort = BackgroundSort(self.table.copy(), key_function, keys, reverse, finished.append)
+            sort.start()
+            sort.wait()
+            self.assertEqual(finished, [sort])
+            self.assertEqual(sort.pks, [row[8] for row in sorted(self.rows, key=key_function, reverse=reverse)])
+            self.assertEqual(set(sort.keys), {row[8] for row in self.rows})
+        # given keys are not changed
+        self.assertEqual(len(keys), 50)
+
+    def test_cancelled_sort(self):
+        finished = []
+        sort = BackgroundSort(self.table, sort_key_function(0), on_finished=finished.append)
+        sort.cancel()
+        sort.run()
+        self.assertIsNone(sort.pks)
+        self.assertEqual(finished, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
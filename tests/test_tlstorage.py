@@ -0,0 +1,118 @@
+""" Round trips of rows through columnar ConnectionTable """
+import random
+import socket
+import unittest
+from tlstorage import CodeTable, ConnectionTable
+
+
+TCP = (socket.AF_INET, socket.SOCK_STREAM)
+UDP6 = (socket.AF_INET6, socket.SOCK_DGRAM)
+IPV6 = socket.inet_pton(socket.AF_INET6, '2001:db8::ff')
+ZERO_IPV6 = bytes(16)
+
+
+def random_row(rnd: random.Random, pk: int)-> list:
+    protocol = rnd.choice((TCP, UDP6))
+    size = 4 if protocol == TCP else 16
+    return [rnd.choice(('nginx', 'sshd', '', None)), rnd.choice((None, 0, 1, 2 ** 40)), protocol,
+            bytes(rnd.randrange(256) for _ in range(size)), rnd.choice((0, 1, 65535)),
+            bytes(rnd.randrange(256) for _ in range(size)), rnd.randrange(65536),
+            rnd.choice(('ESTABLISHED', 'LISTEN', 'NONE')), pk]
+
+
+class CodeTableTest(unittest.TestCase):
+    def test_codes(self):
+        table = CodeTable()
+        self.assertEqual([table.code(value) for value in (TCP, UDP6, TCP, 'x')], [0, 1, 0, 2])
+        self.assertEqual([table.value(code) for code in range(3)], [TCP, UDP6, 'x'])
+
+
+class ConnectionTableTest(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(1)
+        self.rows = [random_row(rnd, pk) for pk in range(50)]
+        # limits of typecodes of columns
+        self.rows.append(['', None, UDP6, ZERO_IPV6, 65535, IPV6, 65535, 'NONE', 2 ** 64 - 1])
+        self.rows.append(['python', 2 ** 63 - 1, TCP, bytes(4), 0, bytes((255,) * 4), 0, 'LISTEN', 0])
+        self.table = ConnectionTable(self.rows)
+
+    def test_extend(self):
+        self.assertEqual(len(self.table), len(self.rows))
+        self.assertEqual(list(self.table), self.rows)
+        self.assertEqual(self.table[-1], self.rows[-1])
+        self.assertEqual(list(self.table.pks()), [row[8] for row in self.rows])
+        self.assertEqual(list(self.table.column_values(1)), [row[1] for row in self.rows])
+        with self.assertRaises(IndexError):
+            self.table[len(self.rows)]
+        self.table.extend([self.rows[0]])
+        self.assertEqual(self.table[-1], self.rows[0])
+
+    def test_port_out_of_range(self):
+        with self.assertRaises(OverflowError):
+            ConnectionTable([['', 1, TCP, bytes(4), 65536, bytes(4), 0, 'LISTEN', 1]])
+
+    def test_set_row(self):
+        rnd = random.Random(2)
+        for _ in range(200):
+            ind = rnd.randrange(len(self.rows))
+            row = random_row(rnd, self.rows[ind][8])
+            self.rows[ind] = row
+            self.table.set_row(ind, row)
+        self.table.set_row(0, ['', None, UDP6, IPV6, 65535, IPV6, 65535, 'NONE', 7])
+        self.rows[0] = ['', None, UDP6, IPV6, 65535, IPV6, 65535, 'NONE', 7]
+        self.assertEqual(list(self.table), self.rows)
+
+    def test_delete(self):
+        rnd = random.Random(3)
+        while self.rows:
+            first = rnd.randrange(len(self.rows))
+            last = rnd.randrange(first, min(first + 5, len(self.rows)))
+            del self.rows[first:last + 1]
+            self.table.delete(first, last)
+            self.assertEqual(list(self.table), self.rows)
+        self.table.extend([random_row(rnd, 1)])
+        self.table.clear()
+        self.assertEqual(len(self.table), 0)
+
+    def test_permute(self):
+        rnd = random.Random(4)
+        for _ in range(20):
+            order = list(range(len(self.rows)))
+            rnd.shuffle(order)
+            self.rows = [self.rows[ind] for ind in order]
+            self.table.permute(order)
+            self.assertEqual(list(self.table), self.rows)
+        self.table.permute([0])
+        self.assertEqual(list(self.table), self.rows)
+
+    def test_copy(self):
+        copy = self.table.copy()
+        self.assertEqual(list(copy), self.rows)
+        # copy is independent, codes of new values of copy don't change rows of table
+        copy.set_row(0, ['new', 5, (socket.AF_INET6, socket.SOCK_STREAM), IPV6, 1, IPV6, 2, 'SYN_SENT', 1000])
+        copy.delete(1, 10)
+        copy.extend([['other', 6, (socket.AF_INET, socket.SOCK_DGRAM), bytes(4), 3, bytes(4), 4, 'NONE', 1001]])
+        copy.permute(list(reversed(range(len(copy)))))
+        self.assertEqual(list(self.table), self.rows)
+        self.assertEqual(len(copy), len(self.rows) - 9)
+        self.assertEqual(copy[-1][8], 1000)
+        self.table.set_row(1, copy[0])
+        self.assertEqual(self.table[1], copy[0])
+
+    def test_addresses_are_shared(self):
+        table = ConnectionTable([['a', 1, UDP6, bytes(IPV6), 1, bytes(IPV6), 2, 'NONE', 1],
+                                 ['b', 2, UDP6, bytes(IPV6), 3, bytes(IPV6), 4, 'NONE', 2]])
+        self.assertIs(table[0][3], table[1][5])
+
+    def test_sort_key(self):
+        for column in (0, 3, 4, 5, 6, 8):
+            key = self.table.sort_key(column)
+            self.assertEqual([key(ind) for ind in range(len(self.rows))], [row[column] for row in self.rows])
+        self.assertEqual([self.table.sort_key(1)(ind) for ind in range(len(self.rows))],
+                         [row[1] if row[1] is not None else ConnectionTable.NO_PID for row in self.rows])
+        self.assertEqual([self.table.sort_key(7)(ind) for ind in range(len(self.rows))],
+                         [row[7] for row in self.rows])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,188 @@
+""" Consistency of TLTableModel after sequences of deltas, without collector data and display """
+import io
+import os
+import time
+import random
+import socket
+import tempfile
+import unittest
+from unittest import mock
+from contextlib import redirect_stderr
+from PySide2.QtCore import QCoreApplication
+from tltablemodel import TLTableModel
+from tlsnapshot import TableDelta
+from tlhistory import HistoryRecorder, HistoryReader, delta_between
+
+
+class EmptyBackend:
+    """ backend of collector, rows are given to the model by tests """
+    filter = None
+
+    def load(self, pk_function = None, cache_processes = None, profile = None)-> list:
+        return []
+
+
+def random_row(rnd: random.Random, pk: int)-> list:
+    family = rnd.choice((socket.AF_INET, socket.AF_INET6))
+    size = 4 if family == socket.AF_INET else 16
+    return [rnd.choice(('nginx', 'sshd', '')), rnd.choice((1, 2, None)), (family, socket.SOCK_STREAM),
+            bytes(rnd.randrange(256) for _ in range(size)), rnd.choice((0, 80, 65535)),
+            bytes(rnd.randrange(256) for _ in range(size)), rnd.randrange(65536),
+            rnd.choice(('ESTABLISHED', 'LISTEN', 'TIME_WAIT')), pk]
+
+
+class TableModelTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QCoreApplication.instance() or QCoreApplication([])
+
+    def setUp(self):
+        self.model = TLTableModel(backend=EmptyBackend())
+        self.addCleanup(self.model.stopCollector)
+        self.model.cacheDomainNames.stop()          # addresses are not resolved
+        self.model.setDomainNameMode(False)
+        self.model.setServiceNameMode(False)
+        deadline = time.monotonic() + 5
+        while self.model.collecting and time.monotonic() < deadline:
+            self.app.processEvents()
+            time.sleep(0.001)
+        self.assertFalse(self.model.collecting)
+        self.rows = {}                  # primary key -> row of the last delta
+
+    def apply(self, new_rows: dict, check: bool = True)-> TableDelta:
+        delta = delta_between(self.rows, new_rows)
+        self.model.showDelta(delta)
+        # rows deleted by delta are shown until the next one
+        self.shown = {pk: self.rows[pk] for pk in delta.del_pks}
+        self.rows = dict(new_rows)
+        self.shown.update(self.rows)
+        if check:
+            self.check(self.shown)
+        return delta
+
+    def check(self, shown: dict):
+        """ indexes by primary keys, table and sort order correspond to shown rows """
+        model = self.model
+        table = model.net_connections
+        self.assertEqual(model.rowCount(), len(shown))
+        self.assertEqual(len(table.pks()), len(shown))
+        self.assertEqual(len(model.rowsByPK), len(shown))
+        for ind in range(model.rowCount()):
+            pk = table.pk(ind)
+            self.assertEqual(model.rowsByPK[pk], ind)
+            self.assertEqual(table.row(ind), shown[pk])
+        self.assertEqual(set(model.sortKeys.keys), set(shown))
+        key = model.sortKeyFunction()
+        keys = [key(table.row(ind)) for ind in range(model.rowCount())]
+        self.assertEqual(keys, sorted(keys, reverse=not model.sortASC))
+        self.assertEqual(model.sortMoved, set())
+
+    def test_random_deltas(self):
+        rnd = random.Random(1)
+        next_pk = 0
+        for step in range(60):
+            new_rows = {}
+            for pk, row in self.rows.items():
+                if rnd.random() < 0.2:
+                    continue            # deleted rows make several ranges of removed rows
+                if rnd.random() < 0.2:
+                    row = row[:7] + [rnd.choice(('ESTABLISHED', 'CLOSE_WAIT'))] + row[8:]
+                new_rows[pk] = row
+            for _ in range(rnd.randrange(15)):
+                new_rows[next_pk] = random_row(rnd, next_pk)
+                next_pk += 1
+            if step % 10 == 9:
+                self.model.sortDataByColumn(rnd.randrange(8))
+            self.apply(new_rows)
+
+    def test_removed_ranges(self):
+        self.model.sortDataByColumn(4)
+        rows = {pk: random_row(random.Random(pk), pk) for pk in range(10)}
+        for pk, row in rows.items():
+            row[4] = 1000 + pk          # rows are ordered by primary keys
+        self.apply(rows)
+        delta = self.apply({pk: row for pk, row in rows.items() if pk not in (1, 2, 5, 7, 8)})
+        self.assertEqual(sorted(delta.del_pks), [1, 2, 5, 7, 8])
+        self.assertEqual(self.model.rowCount(), 10)
+        # deleted rows are removed by the next delta in ranges (1, 2), (5, 5), (7, 8)
+        self.apply(self.rows)
+        self.assertEqual(list(self.model.net_connections.pks()), [0, 3, 4, 6, 9])
+        self.assertEqual(self.model.rowsByPK, {0: 0, 3: 1, 4: 2, 6: 3, 9: 4})
+
+    def test_unknown_updated_rows(self):
+        rnd = random.Random(2)
+        self.apply({pk: random_row(rnd, pk) for pk in range(5)})
+        unknown = random_row(rnd, 100)
+        updated = self.rows[3][:7] + ['CLOSE_WAIT', 3]
+        stderr = io.StringIO()
+        with redirect_stderr(stderr):
+            self.model.showDelta(TableDelta((), (), [unknown, updated], (100, 3)))
+        self.assertIn("not in the table", stderr.getvalue())
+        self.rows[3] = updated
+        self.check(self.rows)
+
+    def test_deltas_after_clear(self):
+        rnd = random.Random(3)
+        self.apply({pk: random_row(rnd, pk) for pk in range(5)})
+        self.model.clearTable()
+        # delta made before the table was cleared is skipped until keyframe
+        self.model.applyDelta(TableDelta((0,), (), [self.rows[1][:7] + ['CLOSE_WAIT', 1]], (1,)))
+        self.check({})
+        self.model.applyDelta(TableDelta((), self.rows.values(), keyframe=True))
+        self.check(self.rows)
+
+    @mock.patch('tltablemodel.BACKGROUND_SORT_ROWS', 50)
+    def test_background_sort(self):
+        rnd = random.Random(5)
+        self.apply({pk: random_row(rnd, pk) for pk in range(200)})
+        for step in range(6):
+            self.model.sortDataByColumn(rnd.choice((0, 4, 5, 6, 7)))
+            sort = self.model.backgroundSort
+            self.assertIsNotNone(sort)
+            sort.wait()
+            # sort is finished, but its result is applied after deltas that change the table
+            next_pk = 1000 * (step + 1)
+            for _ in range(3):
+                new_rows = {}
+                for pk, row in self.rows.items():
+                    if rnd.random() < 0.1:
+                        continue
+                    if rnd.random() < 0.1:
+                        row = random_row(rnd, pk)
+                    new_rows[pk] = row
+                for _ in range(10):
+                    new_rows[next_pk] = random_row(rnd, next_pk)
+                    next_pk += 1
+                self.apply(new_rows, check=False)
+                self.assertIs(self.model.backgroundSort, sort)
+            self.assertTrue(self.model.sortMoved)
+            self.app.processEvents()
+            self.assertIsNone(self.model.backgroundSort)
+            self.check(self.shown)
+
+    def test_start_replay(self):
+        rnd = random.Random(4)
+        self.apply({pk: random_row(rnd, pk) for pk in range(10)})
+        # history of other session has the same primary keys, but other rows
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        filename = os.path.join(directory.name, 'history.tlh')
+        history = {pk: random_row(rnd, pk) for pk in range(5, 15)}
+        recorder = HistoryRecorder(filename)
+        recorder.record(TableDelta(), list(history.values()), 100.0)
+        recorder.close()
+        reader = HistoryReader(filename)
+        self.addCleanup(reader.close)
+        self.model.startReplay(reader)
+        self.check({})
+        self.model.replayTo(100.0)
+        self.check(history)
+        self.assertEqual(self.model.del_pks, frozenset())
+        self.model.replayTo(100.0)
+        self.check(history)
+        self.assertEqual(self.model.new_pks, frozenset())
+        self.model.stopReplay()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+""" Equivalence of hash-indexed comparison of tables with the original quadratic functions """
+import random
+import unittest
+from work_with_list import tables_difference, updated_rows, tables_match, get_of
+
+
+ID_COLUMNS = (2, 3, 4, 5, 6)
+CMP_COLUMNS = (7,)
+OCCURRENCE_COLUMN = 9                   # column appended by numbered_rows()
+STATUSES = ("ESTABLISHED", "LISTEN", "TIME_WAIT", "CLOSE_WAIT")
+
+
+def random_row(rnd: random.Random, pk: int)-> list:
+    # small ranges of values, so keys of rows of two tables often coincide
+    return [rnd.choice(("nginx", "sshd")), rnd.randint(1, 3), (2, 1), bytes((10, 0, 0, rnd.randint(1, 3))),
+            rnd.randint(1, 4), bytes((10, 0, 1, rnd.randint(1, 3))), rnd.choice((80, 443)), rnd.choice(STATUSES), pk]
+
+
+def next_table(rnd: random.Random, table: list, pk: int)-> list:
+    """ return copy of table with deleted, added rows and rows with changed status """
+    new_table = []
+    for row in table:
+        if rnd.random() < 0.2:
+            continue
+        row = list(row)
+        if rnd.random() < 0.3:
+            row[7] = rnd.choice(STATUSES)       # only status is changed
+        new_table.append(row)
+    for i in range(rnd.randint(0, 10)):
+        new_table.append(random_row(rnd, pk + i))
+    rnd.shuffle(new_table)
+    return new_table
+
+
+def numbered_rows(table: list)-> list:
+    """ return copies of rows with appended number of occurrence of their key in table,
+        so the k-th rows with the same key of two tables have equal keys with this column """
+    counts = {}
+    rows = []
+    for row in table:
+        key = get_of(row, *ID_COLUMNS)
+        counts[key] = counts.get(key, 0) + 1
+        rows.append(row + [counts[key]])
+    return rows
+
+
+def old_functions(old_table: list, new_table: list)-> tuple:
+    """ result of tables_match() made by the quadratic functions: (unpaired rows of the old table,
+        unpaired rows of the new table, pairs, rows of the old table whose status is changed) """
+    old_numbered = numbered_rows(old_table)
+    new_numbered = numbered_rows(new_table)
+    columns = ID_COLUMNS + (OCCURRENCE_COLUMN,)
+    originals = {id(numbered): row for numbered, row in zip(old_numbered + new_numbered, old_table + new_table)}
+    del_rows = tables_difference(old_numbered, new_numbered, *columns)
+    new_rows = tables_difference(new_numbered, old_numbered, *columns)
+    chg_rows = updated_rows(old_numbered, new_numbered, columns, CMP_COLUMNS)
+    pairs = [(old_row, new_row) for new_row in new_numbered for old_row in old_numbered
+             if not any(old_row[column] != new_row[column] for column in columns)]
+    return ([originals[id(row)] for row in del_rows], [originals[id(row)] for row in new_rows],
+            [(originals[id(old_row)], originals[id(new_row)]) for old_row, new_row in pairs],
+            [originals[id(row)] for row in chg_rows])
+
+
+def unique_rows(table: list)-> list:
+    """ return rows of table with the first occurrence of every key """
+    keys = set()
+    rows = []
+    for row in table:
+        key = get_of(row, *ID_COLUMNS)
+        if key not in keys:
+            keys.add(key)
+            rows.append(row)
+    return rows
+
+
+class TablesMatchTest(unittest.TestCase):
+    def check_match(self, old_table: list, new_table: list):
+        """ result of tables_match() is the same as of the quadratic functions, rows are the same objects """
+        del_rows, new_rows, pairs = tables_match(old_table, new_table, *ID_COLUMNS)
+        old_del, old_new, old_pairs, old_chg = old_functions(old_table, new_table)
+        self.assertEqual(list(map(id, del_rows)), list(map(id, old_del)))
+        self.assertEqual(list(map(id, new_rows)), list(map(id, old_new)))
+        self.assertEqual([(id(old_row), id(new_row)) for old_row, new_row in pairs],
+                         [(id(old_row), id(new_row)) for old_row, new_row in old_pairs])
+        # pairs are in order of the new table, updated_rows() returns rows in order of the old table
+        changed = {id(old_row) for old_row, new_row in pairs if old_row[7] != new_row[7]}
+        self.assertEqual([id(row) for row in old_table if id(row) in changed], list(map(id, old_chg)))
+
+    def test_random_tables(self):
+        rnd = random.Random(4)
+        for _ in range(300):
+            old_table = unique_rows([random_row(rnd, pk) for pk in range(rnd.randint(0, 30))])
+            new_table = unique_rows(next_table(rnd, old_table, 100))
+            self.check_match(old_table, new_table)
+            # without duplicates numbering changes nothing, so the old functions are compared directly
+            del_rows, new_rows, pairs = tables_match(old_table, new_table, *ID_COLUMNS)
+            self.assertEqual(del_rows, tables_difference(old_table, new_table, *ID_COLUMNS))
+            self.assertEqual(new_rows, tables_difference(new_table, old_table, *ID_COLUMNS))
+
+    def test_status_changes(self):
+        rnd = random.Random(5)
+        old_table = unique_rows([random_row(rnd, pk) for pk in range(50)])
+        new_table = [list(row) for row in old_table]
+        for row in new_table[1::4]:
+            row[7] = "CLOSING" if row[7] != "CLOSING" else "LISTEN"
+        del_rows, new_rows, pairs = tables_match(old_table, new_table, *ID_COLUMNS)
+        self.assertEqual((del_rows, new_rows), ([], []))
+        self.assertEqual([old_row for old_row, new_row in pairs if old_row[7] != new_row[7]], old_table[1::4])
+        self.check_match(old_table, new_table)
+
+    def test_duplicate_keys(self):
+        """ rows with the same key are paired one to one in order of the tables """
+        rnd = random.Random(6)
+        surplus = 0
+        for _ in range(300):
+            old_table = [random_row(rnd, pk) for pk in range(rnd.randint(20, 40))]
+            old_table += [list(row) for row in rnd.sample(old_table, 5)]
+            new_table = next_table(rnd, old_table, 100)
+            self.check_match(old_table, new_table)
+            # duplicates whose key is still in the other table are unpaired too
+            new_keys = {get_of(row, *ID_COLUMNS) for row in new_table}
+            del_rows = tables_match(old_table, new_table, *ID_COLUMNS)[0]
+            surplus += sum(get_of(row, *ID_COLUMNS) in new_keys for row in del_rows)
+        self.assertGreater(surplus, 0)
+
+    def test_duplicate_order(self):
+        first = [None, 1, (2, 1), b"\x01", 1, b"\x02", 80, "LISTEN", 1]
+        second = [None, 1, (2, 1), b"\x01", 1, b"\x02", 80, "ESTABLISHED", 2]
+        other = [None, 1, (2, 1), b"\x01", 2, b"\x02", 80, "LISTEN", 3]
+        new_first = [None, 1, (2, 1), b"\x01", 1, b"\x02", 80, "ESTABLISHED", 4]
+        del_rows, new_rows, pairs = tables_match([first, other, second], [new_first], *ID_COLUMNS)
+        self.assertEqual(del_rows, [other, second])
+        self.assertEqual(new_rows, [])
+        self.assertEqual(pairs, [(first, new_first)])
+
+
+if __name__ == "__main__":
+    unittest.main()
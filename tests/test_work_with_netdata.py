@@ -0,0 +1,155 @@
+""" Resolving of domain names by CacheDomainNames with stub resolver instead of DNS,
+    process names of CacheProcesses """
+import os
+import time
+import socket
+import threading
+import unittest
+from unittest import mock
+import psutil
+from work_with_netdata import CacheDomainNames, CacheProcesses, rowViewStrs, DENIED_PROCESS_NAME
+
+
+def address(n: int)-> tuple:
+    return bytes((10, 0, 0, n)), socket.AF_INET
+
+
+def wait_for(condition, timeout: float = 5.0)-> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class StubResolver:
+    """ resolver that records calls, blocked addresses wait until release() """
+    def __init__(self, names: dict = None, blocked = ()):
+        self.names = names or {}                # ip -> domain name, other addresses are not found
+        self.calls = []
+        self.blocked = set(blocked)
+        self.released = threading.Event()
+        self.lock = threading.Lock()
+
+    def __call__(self, ip: str)-> str:
+        with self.lock:
+            self.calls.append(ip)
+        if ip in self.blocked:
+            self.released.wait(10)
+        return self.names.get(ip, ip)
+
+    def release(self):
+        self.released.set()
+
+
+class CacheDomainNamesTest(unittest.TestCase):
+    def make_cache(self, resolver: StubResolver, **kwargs)-> CacheDomainNames:
+        cache = CacheDomainNames(resolve_function=resolver, **kwargs)
+        self.addCleanup(cache.stop)
+        self.addCleanup(resolver.release)
+        return cache
+
+    def test_pending_addresses_are_queued_once(self):
+        resolver = StubResolver({'10.0.0.1': 'one.example'}, blocked={'10.0.0.1'})
+        cache = self.make_cache(resolver, count_threads=2, timeout=5)
+        for _ in range(10):
+            cache.append(address(1))
+            cache.prioritize(address(1))
+        self.assertTrue(wait_for(lambda: resolver.calls))
+        self.assertTrue(cache.is_pending(address(1)))
+        resolver.release()
+        self.assertTrue(wait_for(lambda: cache.domain_name(address(1)[0]) == 'one.example'))
+        self.assertFalse(cache.is_pending(address(1)))
+        # resolved address is not queued again
+        cache.append(address(1))
+        time.sleep(0.1)
+        self.assertEqual(resolver.calls, ['10.0.0.1'])
+
+    def test_negative_records_expire(self):
+        resolver = StubResolver()
+        cache = self.make_cache(resolver, lifetime_negative_record=0.3, count_threads=1)
+        cache.append(address(2))
+        self.assertTrue(wait_for(lambda: address(2)[0] in cache and not cache.is_pending(address(2))))
+        self.assertIsNone(cache.domain_name(address(2)[0]))
+        self.assertEqual(cache.domain_name(address(2)[0], '10.0.0.2'), '10.0.0.2')
+        # negative record stops lookups while it is alive
+        cache.append(address(2))
+        time.sleep(0.1)
+        self.assertEqual(len(resolver.calls), 1)
+        time.sleep(0.3)
+        cache.append(address(2))
+        self.assertTrue(wait_for(lambda: len(resolver.calls) == 2))
+
+    def test_timeout(self):
+        names = {f'10.0.0.{n}': f'host{n}.example' for n in range(1, 20)}
+        resolver = StubResolver(names, blocked=set(names))
+        resolved = []
+        cache = self.make_cache(resolver, count_threads=2, timeout=0.2, on_resolved=resolved.append)
+        threads = threading.active_count()
+        cache.append(*(address(n) for n in range(1, 20)))
+        # hanging lookups are written as failed, new threads are not started for the next addresses
+        self.assertTrue(wait_for(lambda: len(resolved) >= 2))
+        self.assertIsNone(cache.domain_name(address(1)[0]))
+        self.assertIsNone(cache.domain_name(address(2)[0]))
+        time.sleep(0.5)
+        self.assertEqual(len(resolver.calls), 2)
+        self.assertLessEqual(threading.active_count() - threads, 3)        # 2 workers and watchdog
+        # late results are dropped, the next addresses are resolved by the same threads
+        resolver.blocked.clear()
+        resolver.release()
+        self.assertTrue(wait_for(lambda: cache.domain_name(address(19)[0]) == 'host19.example'))
+        self.assertIsNone(cache.domain_name(address(1)[0]))
+        self.assertLessEqual(threading.active_count() - threads, 3)
+
+    def test_visible_addresses_first(self):
+        resolver = StubResolver(blocked={'10.0.0.1'})
+        cache = self.make_cache(resolver, count_threads=1, timeout=5)
+        cache.append(address(1))
+        self.assertTrue(wait_for(lambda: resolver.calls))
+        # the only thread is busy, addresses are waiting in queue
+        cache.append(*(address(n) for n in range(2, 8)))
+        cache.prioritize(address(6), address(7))
+        resolver.release()
+        self.assertTrue(wait_for(lambda: len(resolver.calls) == 7))
+        self.assertEqual(resolver.calls[:3], ['10.0.0.1', '10.0.0.6', '10.0.0.7'])
+        self.assertEqual(resolver.calls[3:], ['10.0.0.2', '10.0.0.3', '10.0.0.4', '10.0.0.5'])
+
+
+class CacheProcessesTest(unittest.TestCase):
+    def test_unknown_owner_is_skipped(self):
+        cache = CacheProcesses()
+        cache.update([None, os.getpid()])
+        # psutil.Process(None) would give name of the current process to sockets without owner
+        self.assertNotIn(None, cache)
+        self.assertIsNone(cache.process_name(None))
+        self.assertIsNotNone(cache.process_name(os.getpid()))
+
+    def test_access_denied(self):
+        """ process that the user may not read keeps its connections with placeholder name """
+        class DeniedProcess:
+            def __init__(self, pid: int):
+                self.pid = pid
+
+            def create_time(self)-> float:
+                raise psutil.AccessDenied(self.pid)
+
+        cache = CacheProcesses()
+        with mock.patch.object(psutil, 'Process', DeniedProcess):
+            cache.update([1, 2])
+            self.assertEqual(cache.process_name(1), DENIED_PROCESS_NAME)
+            cache.update([2])
+        self.assertNotIn(1, cache)
+        self.assertEqual(cache.process_name(2), DENIED_PROCESS_NAME)
+        self.assertEqual(cache.misses, 3)
+
+    def test_unknown_owner_view(self):
+        # exported strings are the same as in the table
+        row = ['', None, (socket.AF_INET, socket.SOCK_STREAM), bytes(4), 80, bytes(4), 0, 'LISTEN', 1]
+        self.assertEqual(rowViewStrs(row)[:2], ('', ''))
+        row[1] = 42
+        self.assertEqual(rowViewStrs(row)[1], '42')
+
+
+if __name__ == "__main__":
+    unittest.main()
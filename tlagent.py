@@ -0,0 +1,402 @@
+""" Remote collection agent of TLView.
+
+    Agent runs the pipeline of TLCore on a server and streams changes of the
+    connection table over TCP; the GUI applies them to its table instead of
+    local connections ("File > Connect to Agent..."):
+
+        python -m tlagent --listen 0.0.0.0:7407 --interval 1
+
+    Stream starts with MAGIC, then frames follow. Frame is header (kind, flags,
+    payload length) and payload, payload is compressed by zlib if flags has FLAG_ZLIB.
+    Payloads of keyframes and deltas are the same as in history files (see tlhistory):
+    every client gets keyframe of the whole table and then only deltas, so traffic
+    is proportional to changes. Heartbeats are sent while table doesn't change.
+    Agent has no authentication, so it listens on localhost by default;
+    SSH tunnel is the way to watch servers over untrusted networks.
+"""
+import sys
+import time
+import zlib
+import socket
+import struct
+import argparse
+import threading
+from collections import deque
+from tlcore import TLCore
+from tlsnapshot import TableDelta, TableAggregates
+from tlhistory import RecordEncoder, RecordDecoder, KIND_KEYFRAME, KIND_DELTA, FLAG_ZLIB, COMPRESS_SIZE
+from tlbackends import PsutilBackend, ProcNetBackend, CollectionFilter, PROTOCOL_NAMES
+from tlfilter import RowFilter
+
+
+MAGIC = b'TLVA\x01'
+KIND_HEARTBEAT = b'H'
+FRAME_HEADER = struct.Struct('<cBI')            # kind, flags, length of payload
+DEFAULT_PORT = 7407
+INTERVAL = 1.0                  # the number of seconds between updates of agent
+HEARTBEAT_INTERVAL = 5.0        # the number of seconds without frames after which heartbeat is sent
+RECEIVE_TIMEOUT = 3 * HEARTBEAT_INTERVAL        # connection without frames for this time is lost
+SEND_TIMEOUT = 10.0             # client that doesn't receive frames for this time is disconnected
+MAX_BACKLOG = 4 << 20           # bytes queued for client after which its queue is replaced by keyframe
+RECONNECT_INTERVAL = 2.0        # the number of seconds between attempts to connect to agent
+BACKENDS = {'auto': None, 'psutil': PsutilBackend, 'procfs': ProcNetBackend}
+
+
+def parse_address(text: str, default_host: str = '127.0.0.1')-> tuple:
+    """ "host:port", "host", ":port" or "[IPv6]:port" -> (host, port) """
+    text = text.strip()
+    host, port = text, DEFAULT_PORT
+    if text.startswith('['):
+        host, _, rest = text[1:].partition(']')
+        if rest.startswith(':'):
+            port = rest[1:]
+    elif text.count(':') == 1:
+        host, port = text.split(':')
+    try:
+        port = int(port)
+    except ValueError:
+        raise ValueError(f"{port!r} is not a port number") from None
+    if not 0 < port < 65536:
+        raise ValueError(f"port {port} is out of range")
+    return host or default_host, port
+
+
+def frame(kind: bytes, payload: bytes = b'')-> bytes:
+    flags = 0
+    if len(payload) >= COMPRESS_SIZE:
+        payload = zlib.compress(payload, 1)
+        flags |= FLAG_ZLIB
+    return FRAME_HEADER.pack(kind, flags, len(payload)) + payload
+
+
+def receive_exactly(sock: socket.socket, size: int)-> bytes:
+    """ return size bytes from socket, ConnectionError if connection is closed before """
+    parts = []
+    while size > 0:
+        data = sock.recv(min(size, 1 << 20))
+        if not data:
+            raise ConnectionError("connection is closed by agent")
+        parts.append(data)
+        size -= len(data)
+    return b''.join(parts)
+
+
+class AgentClient:
+    """ Connection of agent to one client, it has its own table of strings of stream.
+        Frames are queued by thread of collection and sent by thread of the client,
+        so a client that reads slowly delays neither collection nor other clients """
+    def __init__(self, sock: socket.socket, address: tuple):
+        self.sock = sock
+        self.address = address
+        self.encoder = RecordEncoder()
+        self.started = False            # is keyframe queued?
+        self.sendTime = 0.0             # time of the last queued frame
+        self.closed = False
+        self.__frames = deque()         # frames waiting for sending
+        self.__backlog = 0              # size of waiting frames in bytes
+        self.__condition = threading.Condition()
+        self.__thread = threading.Thread(target=self.__send_frames, name="AgentClient", daemon=True)
+        self.__thread.start()
+
+    def __send_frames(self):
+        try:
+            self.sock.sendall(MAGIC)
+            while True:
+                with self.__condition:
+                    while not self.__frames and not self.closed:
+                        self.__condition.wait()
+                    if self.closed:
+                        return
+                    data = self.__frames.popleft()
+                    self.__backlog -= len(data)
+                self.sock.sendall(data)
+        except OSError:
+            pass
+        finally:
+            self.close()
+
+    def queue(self, data: bytes, replace: bool = False)-> bool:
+        """ queue frame for sending, replace - waiting frames are dropped before.
+            return False if connection is closed """
+        with self.__condition:
+            if self.closed:
+                return False
+            if replace:
+                self.__frames.clear()
+                self.__backlog = 0
+            self.__frames.append(data)
+            self.__backlog += len(data)
+            self.sendTime = time.monotonic()
+            self.__condition.notify()
+            return True
+
+    def backlog(self)-> int:
+        """ size of frames waiting for sending in bytes """
+        return self.__backlog
+
+    def close(self):
+        with self.__condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.__condition.notify()
+        try:
+            # thread of the client blocked in sendall() is woken up
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class Agent:
+    """ Collects snapshots by TLCore and sends their changes to connected clients.
+        Rows sent to clients are kept, so new client gets keyframe without collection """
+    def __init__(self, core: TLCore, address: tuple = ('127.0.0.1', DEFAULT_PORT), interval: float = INTERVAL):
+        self.core = core
+        self.interval = interval
+        self.rows = {}                  # primary key -> row sent to clients
+        self.clients = []               # AgentClient of connected clients
+        self.bytesSent = 0              # bytes queued for all clients
+        self.__lock = threading.Lock()
+        self.__stopped = threading.Event()
+        self.__server = socket.create_server(address, family=socket.AF_INET6 if ':' in address[0] else socket.AF_INET)
+        self.address = self.__server.getsockname()[:2]
+        self.__accept_thread = threading.Thread(target=self.__accept, name="AgentAccept", daemon=True)
+        self.__accept_thread.start()
+
+    def __accept(self):
+        while not self.__stopped.is_set():
+            try:
+                sock, address = self.__server.accept()
+            except OSError:
+                break
+            sock.settimeout(SEND_TIMEOUT)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self.__lock:
+                # keyframe is queued by thread of collection, it owns the rows
+                self.clients.append(AgentClient(sock, address))
+
+    def update(self)-> TableDelta:
+        """ collect the next snapshot and send its changes to clients """
+        delta = self.core.collect()
+        for pk in delta.del_pks:
+            self.rows.pop(pk, None)
+        for row in delta.upd_rows:
+            self.rows[row[8]] = row
+        for row in delta.new_rows:
+            self.rows[row[8]] = row
+        now = time.monotonic()
+        with self.__lock:
+            clients = list(self.clients)
+        lost = []
+        for client in clients:
+            replace = False
+            if not client.started or client.backlog() > MAX_BACKLOG:
+                # client that doesn't keep up gets the whole table instead of waiting deltas
+                replace = client.started
+                client.started = True
+                data = frame(KIND_KEYFRAME, client.encoder.keyframe(self.rows.values()))
+            elif not delta.is_empty():
+                data = frame(KIND_DELTA, client.encoder.delta(delta))
+            elif now - client.sendTime >= HEARTBEAT_INTERVAL:
+                data = frame(KIND_HEARTBEAT)
+            else:
+                continue
+            if client.queue(data, replace):
+                self.bytesSent += len(data)
+            else:
+                lost.append(client)
+        if lost:
+            with self.__lock:
+                self.clients = [client for client in self.clients if client not in lost]
+        return delta
+
+    def serve_forever(self, count: int = 0):
+        """ update every interval until stop(), count - count of updates, 0 - no limit """
+        tick = 0
+        next_time = time.monotonic()
+        while not self.__stopped.is_set() and (count <= 0 or tick < count):
+            self.update()
+            self.core.flush_cache_if_due()
+            tick += 1
+            # updates are not piled up if collection takes longer than interval
+            next_time = max(next_time + self.interval, time.monotonic())
+            self.__stopped.wait(max(0.0, next_time - time.monotonic()))
+
+    def stop(self):
+        """ close server and connections of clients """
+        self.__stopped.set()
+        try:
+            # thread of accept() is woken up
+            self.__server.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.__server.close()
+        self.__accept_thread.join()
+        with self.__lock:
+            for client in self.clients:
+                client.close()
+            self.clients = []
+
+
+class AgentSource:
+    """ Connection table of agent for TLCore in place of local snapshots (TLCore.source).
+        Frames are received by background thread and applied by next_delta(), so
+        changes of all frames since the previous call are sent as one delta, and cost
+        of update is proportional to changes. Lost connection is made again every
+        RECONNECT_INTERVAL seconds until close(), agent sends keyframe again then """
+    def __init__(self, host: str, port: int = DEFAULT_PORT):
+        self.address = (host, port)
+        self.rows = {}                  # primary key -> row of agent table after applied frames
+        self.aggregates = TableAggregates()     # counts of connections of self.rows
+        self.connected = False
+        self.error = None               # reason of the last lost connection or failed attempt
+        self.bytesReceived = 0
+        self.__frames = deque()         # tuples (kind, payload) received but not applied
+        self.__decoder = RecordDecoder()
+        self.__resync = False           # send all rows as new in the next delta?
+        self.__closed = threading.Event()
+        self.__socket = None
+        self.__thread = threading.Thread(target=self.__receive, name="AgentSource", daemon=True)
+        self.__thread.start()
+
+    def __str__(self):
+        return f"{self.address[0]}:{self.address[1]}"
+
+    def __receive(self):
+        while not self.__closed.is_set():
+            try:
+                sock = socket.create_connection(self.address, timeout=RECEIVE_TIMEOUT)
+            except OSError as e:
+                self.error = str(e)
+                self.__closed.wait(RECONNECT_INTERVAL)
+                continue
+            self.__socket = sock
+            try:
+                if receive_exactly(sock, len(MAGIC)) != MAGIC:
+                    raise ConnectionError("it is not TLView agent")
+                self.connected = True
+                self.error = None
+                while True:
+                    kind, flags, length = FRAME_HEADER.unpack(receive_exactly(sock, FRAME_HEADER.size))
+                    payload = receive_exactly(sock, length)
+                    self.bytesReceived += FRAME_HEADER.size + length
+                    if kind == KIND_HEARTBEAT:
+                        continue
+                    if kind not in (KIND_KEYFRAME, KIND_DELTA):
+                        raise ConnectionError(f"unknown frame {kind!r}")
+                    self.__frames.append((kind, zlib.decompress(payload) if flags & FLAG_ZLIB else payload))
+            except (OSError, zlib.error) as e:
+                if not self.__closed.is_set():
+                    self.error = str(e) or type(e).__name__
+            finally:
+                self.connected = False
+                self.__socket = None
+                sock.close()
+            self.__closed.wait(RECONNECT_INTERVAL)
+
+    def request_resync(self):
+        """ the next delta will contain all rows as new """
+        self.__resync = True
+
+    def next_delta(self)-> tuple:
+        """ apply received frames, return delta since the previous call and rows of table """
+        changed = {}                    # primary key -> row before applied frames, None if it was absent
+        rows = self.rows
+        while self.__frames:
+            kind, payload = self.__frames.popleft()
+            del_pks, new_rows = self.__decoder.decode(kind, payload)
+            if del_pks is None:
+                # keyframe of new connection replaces all rows, primary keys of agent can be new
+                del_pks = list(rows)
+            for pk in del_pks:
+                if pk in rows:
+                    changed.setdefault(pk, rows.pop(pk))
+            for row in new_rows:
+                changed.setdefault(row[8], rows.get(row[8], None))
+                rows[row[8]] = row
+        if self.__resync:
+            self.__resync = False
+            self.aggregates = TableAggregates(list(rows.values()))
+            return TableDelta((), rows.values(), (), (), self.aggregates.copy()), rows.values()
+        del_pks = []
+        new_rows = []
+        upd_rows = []
+        chg_pks = []
+        removed = []
+        for pk, old_row in changed.items():
+            row = rows.get(pk, None)
+            if old_row is None:
+                if row is not None:
+                    new_rows.append(row)
+            elif row is None:
+                del_pks.append(pk)
+                removed.append(old_row)
+            elif row != old_row:
+                upd_rows.append(row)
+                removed.append(old_row)
+                if row[7] != old_row[7]:
+                    chg_pks.append(pk)
+        if changed:
+            self.aggregates.update(removed, new_rows + upd_rows)
+        return TableDelta(del_pks, new_rows, upd_rows, chg_pks, self.aggregates.copy()), rows.values()
+
+    def close(self):
+        self.__closed.set()
+        sock = self.__socket
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def parse_args(argv = None):
+    parser = argparse.ArgumentParser(prog="python -m tlagent",
+                                     description="Stream changes of network connections to TLView over TCP")
+    parser.add_argument('-l', '--listen', default=f"127.0.0.1:{DEFAULT_PORT}",
+                        help=f"address and port of agent, default 127.0.0.1:{DEFAULT_PORT}")
+    parser.add_argument('-i', '--interval', type=float, default=INTERVAL, help="seconds between updates")
+    parser.add_argument('--backend', choices=tuple(BACKENDS), default='auto', help="source of system data")
+    parser.add_argument('--protocols', default=','.join(PROTOCOL_NAMES),
+                        help="collected protocols: " + ','.join(PROTOCOL_NAMES))
+    parser.add_argument('--status', help="collected TCP states, e.g. ESTABLISHED,LISTEN")
+    parser.add_argument('--pid', type=int, action='append', help="collected process, can be repeated")
+    parser.add_argument('--filter', metavar='EXPRESSION',
+                        help="sent connections, e.g. \"proc:nginx rport:443 raddr:10.0.0.0/8\"")
+    args = parser.parse_args(argv)
+    try:
+        args.listen = parse_address(args.listen, '')
+    except ValueError as e:
+        parser.error(f"listen: {e}")
+    try:
+        args.protocols = [PROTOCOL_NAMES[name.strip().lower()] for name in args.protocols.split(',') if name.strip()]
+    except KeyError as e:
+        parser.error(f"unknown protocol {e}")
+    try:
+        args.filter = RowFilter(args.filter) if args.filter else None
+    except ValueError as e:
+        parser.error(f"filter: {e}")
+    return args
+
+
+def main(argv = None):
+    args = parse_args(argv)
+    backend_class = BACKENDS[args.backend]
+    core = TLCore(backend_class() if backend_class is not None else None)
+    core.backend.filter = CollectionFilter(args.protocols,
+                                           args.status.upper().split(',') if args.status else None, args.pid)
+    core.set_row_filter(args.filter)
+    agent = Agent(core, args.listen, args.interval)
+    print(f"TLView agent listens on {agent.address[0]}:{agent.address[1]}", file=sys.stderr)
+    try:
+        agent.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        agent.stop()
+        core.stop()
+
+
+if __name__ == "__main__":
+    main()
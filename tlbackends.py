@@ -0,0 +1,296 @@
+import os
+import sys
+import time
+import socket
+import psutil
+from work_with_netdata import psutilAddrToIPAndPort, CacheProcesses, ZERO_IPV4, ZERO_IPV6, DENIED_PROCESS_NAME
+from tlprofiler import TickProfile
+
+
+# files of /proc/net with connections on transport layer and their protocols
+PROC_NET_FILES = (('tcp', socket.AF_INET, socket.SOCK_STREAM), ('tcp6', socket.AF_INET6, socket.SOCK_STREAM),
+                  ('udp', socket.AF_INET, socket.SOCK_DGRAM), ('udp6', socket.AF_INET6, socket.SOCK_DGRAM))
+# TCP states of /proc/net files, names are the same as in psutil
+TCP_STATUSES = {'01': "ESTABLISHED", '02': "SYN_SENT", '03': "SYN_RECV", '04': "FIN_WAIT1",
+                '05': "FIN_WAIT2", '06': "TIME_WAIT", '07': "CLOSE", '08': "CLOSE_WAIT",
+                '09': "LAST_ACK", '0A': "LISTEN", '0B': "CLOSING", '0C': "SYN_RECV"}
+STATUS_NONE = "NONE"                # status of UDP sockets
+FULL_RESCAN_INTERVAL = 60           # the number of seconds after which owners of all sockets are searched again
+PROTOCOLS = ((socket.AF_INET, socket.SOCK_STREAM), (socket.AF_INET6, socket.SOCK_STREAM),
+             (socket.AF_INET, socket.SOCK_DGRAM), (socket.AF_INET6, socket.SOCK_DGRAM))
+# names of protocols for command line and files
+PROTOCOL_NAMES = {'tcp': PROTOCOLS[0], 'tcp6': PROTOCOLS[1], 'udp': PROTOCOLS[2], 'udp6': PROTOCOLS[3]}
+# kinds of psutil.net_connections() from smallest and protocols which they include
+PSUTIL_KINDS = (('tcp4', PROTOCOLS[:1]), ('tcp6', PROTOCOLS[1:2]), ('udp4', PROTOCOLS[2:3]), ('udp6', PROTOCOLS[3:]),
+                ('tcp', PROTOCOLS[:2]), ('udp', PROTOCOLS[2:]), ('inet4', PROTOCOLS[::2]),
+                ('inet6', PROTOCOLS[1::2]), ('inet', PROTOCOLS))
+
+
+class CollectionFilter:
+    """ Conditions for connections that are collected. Backends skip other
+        connections before rows are created, so they are not compared, sorted
+        and displayed. Condition None is not checked. """
+    def __init__(self, protocols = None, statuses = None, pids = None):
+        """ * protocols - set of tuples (family, type);
+            * statuses - set of TCP states, UDP sockets are not checked;
+            * pids - set of process identifiers """
+        self.protocols = frozenset(protocols) if protocols is not None else None
+        self.statuses = frozenset(statuses) if statuses is not None else None
+        self.pids = frozenset(pids) if pids is not None else None
+
+    def accepts_protocol(self, family: socket.AddressFamily, type: socket.SocketKind)-> bool:
+        return self.protocols is None or (family, type) in self.protocols
+
+    def accepts_status(self, type: socket.SocketKind, status: str)-> bool:
+        return self.statuses is None or type != socket.SOCK_STREAM or status in self.statuses
+
+    def accepts_pid(self, pid: int)-> bool:
+        return self.pids is None or pid in self.pids
+
+    def psutil_kind(self)-> str:
+        """ return the smallest kind of psutil.net_connections() that includes all
+            accepted protocols, None if no protocol is accepted """
+        if self.protocols is None:
+            return 'inet'
+        if len(self.protocols) == 0:
+            return None
+        for kind, protocols in PSUTIL_KINDS:
+            if self.protocols.issubset(protocols):
+                return kind
+
+    def __str__(self):
+        return f"[protocols: {self.protocols}, statuses: {self.statuses}, pids: {self.pids}]"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+def psutilConnectionToList(connection, pk_function = lambda:0, cache_processes: CacheProcesses = None)-> list:
+    """ transfer psutil._common.sconn to list.
+        pk_function - function for generate primary key values for table rows;
+        cache_processes - filled cache of process names, if None then process name is requested from system.
+        Connection without known owner has empty process name"""
+    try:
+        if connection.pid is None:
+            process_name = ''
+        elif cache_processes is None:
+            try:
+                process_name = psutil.Process(connection.pid).name()
+            except psutil.AccessDenied:
+                process_name = DENIED_PROCESS_NAME
+        else:
+            process_name = cache_processes.process_name(connection.pid)
+            if process_name is None:
+                return []
+        return [process_name, connection.pid, (connection.family, connection.type),
+                *psutilAddrToIPAndPort(connection.laddr, connection.family),
+                *psutilAddrToIPAndPort(connection.raddr, connection.family), connection.status,
+                pk_function()]
+    except psutil.NoSuchProcess:
+        return []
+
+
+class PsutilBackend:
+    """ Loads connections with psutil.net_connections(), works on all systems """
+    name = "psutil"
+
+    def __init__(self, collection_filter: CollectionFilter = None):
+        self.filter = collection_filter if collection_filter is not None else CollectionFilter()
+
+    @staticmethod
+    def is_available()-> bool:
+        return True
+
+    def load(self, pk_function = lambda:0, cache_processes: CacheProcesses = None, profile: TickProfile = None)-> list:
+        """ load system data about all network connections on taransport layer and
+            create data table.
+            pk_function - function for generate primary key values for table rows;
+            cache_processes - cache of process names, it is refreshed once for all connections;
+            profile - durations of stages are added in it, if not None"""
+        collection_filter = self.filter
+        kind = collection_filter.psutil_kind()
+        if kind is None:
+            return []
+        connections = [connection for connection in psutil.net_connections(kind)
+                       if collection_filter.accepts_protocol(connection.family, connection.type) and
+                       collection_filter.accepts_status(connection.type, connection.status) and
+                       collection_filter.accepts_pid(connection.pid)]
+        if cache_processes is not None:
+            if profile is not None:
+                profile.start('process_lookup')
+            cache_processes.update(connection.pid for connection in connections)
+            if profile is not None:
+                profile.stop('process_lookup')
+        net_connections = []
+        for connection in connections:
+            row = psutilConnectionToList(connection, pk_function, cache_processes)
+            if len(row) > 0:
+                net_connections.append(row)
+        return net_connections
+
+
+class ProcNetBackend:
+    """ Loads connections on Linux by reading /proc/net/{tcp,tcp6,udp,udp6}.
+        Owners of sockets are found by socket inodes in /proc/<pid>/fd.
+        The map inode -> pids is kept between loads, descriptors of processes
+        are read again only when sockets with unknown owner appear. """
+    name = "procfs"
+
+    def __init__(self, proc_path: str = '/proc', full_rescan_interval: float = FULL_RESCAN_INTERVAL,
+                 collection_filter: CollectionFilter = None):
+        self.filter = collection_filter if collection_filter is not None else CollectionFilter()
+        self.procPath = proc_path
+        self.fullRescanInterval = full_rescan_interval
+        self.__pid_inodes = {}              # pid -> list of socket inodes, one inode per descriptor
+        self.__owners = {}                  # socket inode -> list of pids, one pid per descriptor
+        self.__unowned = set()              # inodes whose owners were not found
+        self.__addresses = {}               # hex address of /proc/net -> bytes address
+        self.__rescan_time = time.time() + full_rescan_interval
+        self.scannedProcesses = 0           # count of reads of process descriptors
+
+    @staticmethod
+    def is_available(proc_path: str = '/proc')-> bool:
+        return sys.platform.startswith('linux') and os.access(os.path.join(proc_path, 'net', 'tcp'), os.R_OK)
+
+    def __address(self, hex_addr: str)-> bytes:
+        """ "0100007F" -> b'\\x7f\\x00\\x00\\x01'. Address in file is written
+            by 32-bit words in byte order of host """
+        addr = self.__addresses.get(hex_addr, None)
+        if addr is None:
+            raw = bytes.fromhex(hex_addr)
+            if sys.byteorder == 'little':
+                raw = b''.join(raw[i:i + 4][::-1] for i in range(0, len(raw), 4))
+            self.__addresses[hex_addr] = addr = raw
+        return addr
+
+    def sockets(self, collection_filter: CollectionFilter = None)-> list:
+        """ return list of tuples (family, type, local address, local port,
+            remote address, remote port, status, inode).
+            Files of not accepted protocols are not read """
+        if collection_filter is None:
+            collection_filter = CollectionFilter()
+        sockets = []
+        for filename, family, type in PROC_NET_FILES:
+            if not collection_filter.accepts_protocol(family, type):
+                continue
+            zero_ip = ZERO_IPV6 if family == socket.AF_INET6 else ZERO_IPV4
+            try:
+                file = open(os.path.join(self.procPath, 'net', filename))
+            except FileNotFoundError:
+                continue                    # protocol (IPv6) is not supported
+            with file:
+                file.readline()             # skip header
+                for line in file:
+                    fields = line.split()
+                    if len(fields) < 10:
+                        continue
+                    status = TCP_STATUSES.get(fields[3], STATUS_NONE) if type == socket.SOCK_STREAM else STATUS_NONE
+                    if not collection_filter.accepts_status(type, status):
+                        continue
+                    local_ip, local_port = fields[1].split(':')
+                    remote_ip, remote_port = fields[2].split(':')
+                    local_port = int(local_port, 16)
+                    remote_port = int(remote_port, 16)
+                    # address without port is shown as zero address, as psutil does
+                    sockets.append((family, type,
+                                    self.__address(local_ip) if local_port else zero_ip, local_port,
+                                    self.__address(remote_ip) if remote_port else zero_ip, remote_port,
+                                    status, int(fields[9])))
+        # forget addresses of closed sockets
+        if len(self.__addresses) > 2 * len(sockets) + 1024:
+            self.__addresses.clear()
+        return sockets
+
+    def __scan_process(self, pid: int)-> list:
+        """ return list of socket inodes of process descriptors,
+            None if descriptors can't be read """
+        self.scannedProcesses += 1
+        fd_path = os.path.join(self.procPath, str(pid), 'fd')
+        inodes = []
+        try:
+            for fd in os.listdir(fd_path):
+                try:
+                    link = os.readlink(os.path.join(fd_path, fd))
+                except OSError:
+                    continue                # descriptor is closed
+                if link.startswith('socket:['):
+                    inodes.append(int(link[8:-1]))
+        except OSError:
+            return None                     # process is finished or access is denied
+        return inodes
+
+    def __rebuild_owners(self)-> None:
+        self.__owners = {}
+        for pid, pid_inodes in self.__pid_inodes.items():
+            for inode in pid_inodes:
+                self.__owners.setdefault(inode, []).append(pid)
+
+    def __update_owners(self, inodes: set)-> None:
+        """ Finds owners of sockets with unknown owner.
+            Processes are read in order: new processes, processes that own
+            more sockets, other processes, until owners of all sockets are found """
+        pids = set(int(name) for name in os.listdir(self.procPath) if name.isdigit())
+        changed = False
+        for pid in [pid for pid in self.__pid_inodes if pid not in pids]:
+            del self.__pid_inodes[pid]      # process is finished
+            changed = True
+        if time.time() >= self.__rescan_time:
+            # sockets could be passed between processes, so all owners are searched again
+            self.__pid_inodes.clear()
+            self.__unowned.clear()
+            self.__rescan_time = time.time() + self.fullRescanInterval
+            changed = True
+        if changed:
+            self.__rebuild_owners()
+        unknown = inodes - self.__owners.keys() - self.__unowned
+        unknown.discard(0)                  # sockets without owner, such as TIME_WAIT
+        if unknown:
+            new_pids = [pid for pid in pids if pid not in self.__pid_inodes]
+            known_pids = sorted(self.__pid_inodes, key=lambda pid: len(self.__pid_inodes[pid]), reverse=True)
+            for pid in new_pids + known_pids:
+                pid_inodes = self.__scan_process(pid)
+                self.__pid_inodes[pid] = pid_inodes if pid_inodes is not None else []
+                unknown.difference_update(self.__pid_inodes[pid])
+                if not unknown:
+                    break
+            self.__rebuild_owners()
+        self.__unowned = (self.__unowned & inodes) | unknown
+
+    def load(self, pk_function = lambda:0, cache_processes: CacheProcesses = None, profile: TickProfile = None)-> list:
+        """ load system data about all network connections on taransport layer and
+            create data table. Row is created for every pair socket-descriptor,
+            sockets without known owner have pid None and empty process name.
+            pk_function - function for generate primary key values for table rows;
+            cache_processes - cache of process names, it is refreshed once for all connections;
+            profile - durations of stages are added in it, if not None"""
+        collection_filter = self.filter
+        sockets = self.sockets(collection_filter)
+        if profile is not None:
+            profile.start('process_lookup')
+            scanned_processes = self.scannedProcesses
+        self.__update_owners(set(sock[7] for sock in sockets))
+        owners = self.__owners
+        if cache_processes is None:
+            cache_processes = CacheProcesses()
+        cache_processes.update(pid for sock in sockets for pid in owners.get(sock[7], (None,))
+                               if collection_filter.accepts_pid(pid))
+        if profile is not None:
+            profile.stop('process_lookup')
+            profile.set('scanned_processes', self.scannedProcesses - scanned_processes)
+        net_connections = []
+        for family, type, local_ip, local_port, remote_ip, remote_port, status, inode in sockets:
+            for pid in owners.get(inode, (None,)):
+                if not collection_filter.accepts_pid(pid):
+                    continue
+                process_name = cache_processes.process_name(pid) if pid is not None else ''
+                if process_name is not None:
+                    net_connections.append([process_name, pid, (family, type), local_ip, local_port,
+                                            remote_ip, remote_port, status, pk_function()])
+        return net_connections
+
+
+def defaultBackend():
+    """ return the fastest backend available on this system """
+    if ProcNetBackend.is_available():
+        return ProcNetBackend()
+    return PsutilBackend()
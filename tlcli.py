@@ -0,0 +1,132 @@
+""" Headless mode of TLView: connections are monitored without Qt and display,
+    every update with changes is written as one JSON line:
+
+        {"time": 1700000000.0, "added": [...], "removed": [...], "changed": [...]}
+
+    Usage: python -m tlcli --interval 2 --protocols tcp,tcp6 --output changes.jsonl
+"""
+import sys
+import json
+import time
+import argparse
+from tlcore import TLCore, ROW_FIELDS, row_to_dict
+from tlbackends import PsutilBackend, ProcNetBackend, CollectionFilter, PROTOCOL_NAMES
+from tlintervals import IntervalStore
+from tlfilter import RowFilter
+from work_with_netdata import CacheDomainNames, DomainNamesStorage
+
+
+INTERVAL = 1.0                  # the number of seconds between updates
+BACKENDS = {'auto': None, 'psutil': PsutilBackend, 'procfs': ProcNetBackend}
+
+
+class DeltaWriter:
+    """ Converts deltas of TLCore to JSON lines. Rows of the last snapshot
+        are kept, so removed connections and old values of changed ones are known """
+    def __init__(self, file, cache_domain_names: CacheDomainNames = None, skip_first: bool = False):
+        self.file = file
+        self.cacheDomainNames = cache_domain_names
+        self.skipFirst = skip_first
+        self.rows = {}                  # primary key -> row of the last snapshot
+
+    def record(self, delta)-> dict:
+        """ return dictionary of delta, None if nothing changed """
+        removed = [self.rows.pop(pk) for pk in delta.del_pks if pk in self.rows]
+        changed = []
+        for row in delta.upd_rows:
+            old_row = self.rows.get(row[8], None)
+            connection = row_to_dict(row, self.cacheDomainNames)
+            if old_row is not None:
+                connection["old"] = {field: old_row[i] for i, field in enumerate(ROW_FIELDS)
+                                     if i != 2 and old_row[i] != row[i]}
+            changed.append(connection)
+            self.rows[row[8]] = row
+        for row in delta.new_rows:
+            self.rows[row[8]] = row
+        if self.skipFirst:
+            self.skipFirst = False
+            return None
+        if not (removed or changed or delta.new_rows):
+            return None
+        return {"time": time.time(),
+                "added": [row_to_dict(row, self.cacheDomainNames) for row in delta.new_rows],
+                "removed": [row_to_dict(row, self.cacheDomainNames) for row in removed],
+                "changed": changed}
+
+    def write(self, delta)-> bool:
+        """ write delta as JSON line, return False if nothing changed """
+        record = self.record(delta)
+        if record is None:
+            return False
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+        return True
+
+
+def parse_args(argv = None):
+    parser = argparse.ArgumentParser(prog="python -m tlcli",
+                                     description="Write changes of network connections as JSON lines")
+    parser.add_argument('-i', '--interval', type=float, default=INTERVAL, help="seconds between updates")
+    parser.add_argument('-n', '--count', type=int, default=0, help="count of updates, 0 - until interrupted")
+    parser.add_argument('-o', '--output', default='-', help="file for JSON lines, '-' - stdout")
+    parser.add_argument('--backend', choices=tuple(BACKENDS), default='auto', help="source of system data")
+    parser.add_argument('--protocols', default=','.join(PROTOCOL_NAMES),
+                        help="collected protocols: " + ','.join(PROTOCOL_NAMES))
+    parser.add_argument('--status', help="collected TCP states, e.g. ESTABLISHED,LISTEN")
+    parser.add_argument('--pid', type=int, action='append', help="collected process, can be repeated")
+    parser.add_argument('--filter', metavar='EXPRESSION',
+                        help="written connections, e.g. \"proc:nginx rport:443 raddr:10.0.0.0/8\"")
+    parser.add_argument('--resolve', action='store_true', help="add known domain names of addresses")
+    parser.add_argument('--dns-cache', metavar='FILE', help="file of domain names cache between launches")
+    parser.add_argument('--skip-initial', action='store_true',
+                        help="don't write connections of the first snapshot as added")
+    parser.add_argument('--intervals', metavar='FILE',
+                        help="database of lifetimes of connections, it is queried by python -m tlintervals")
+    args = parser.parse_args(argv)
+    try:
+        args.protocols = [PROTOCOL_NAMES[name.strip().lower()] for name in args.protocols.split(',') if name.strip()]
+    except KeyError as e:
+        parser.error(f"unknown protocol {e}")
+    try:
+        args.filter = RowFilter(args.filter) if args.filter else None
+    except ValueError as e:
+        parser.error(f"filter: {e}")
+    return args
+
+
+def main(argv = None):
+    args = parse_args(argv)
+    backend_class = BACKENDS[args.backend]
+    collection_filter = CollectionFilter(args.protocols,
+                                         args.status.upper().split(',') if args.status else None, args.pid)
+    cache_domain_names = CacheDomainNames() if args.resolve else None
+    storage = DomainNamesStorage(args.dns_cache) if args.resolve and args.dns_cache else None
+    core = TLCore(backend_class() if backend_class is not None else None, cache_domain_names, storage)
+    core.backend.filter = collection_filter
+    core.set_row_filter(args.filter)
+    if args.intervals:
+        core.intervalStore = IntervalStore(args.intervals)
+    core.load_cache()
+    file = sys.stdout if args.output == '-' else open(args.output, 'a')
+    writer = DeltaWriter(file, cache_domain_names, args.skip_initial)
+    try:
+        tick = 0
+        next_time = time.monotonic()
+        while args.count <= 0 or tick < args.count:
+            writer.write(core.collect())
+            core.flush_cache_if_due()
+            tick += 1
+            # updates are not piled up if collection takes longer than interval
+            next_time = max(next_time + args.interval, time.monotonic())
+            if args.count <= 0 or tick < args.count:
+                time.sleep(max(0.0, next_time - time.monotonic()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        core.stop()
+        if file is not sys.stdout:
+            file.close()
+
+
+if __name__ == "__main__":
+    main()
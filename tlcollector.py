@@ -0,0 +1,46 @@
+import traceback
+from PySide2.QtCore import QObject, Signal, Slot
+from tlsnapshot import TableDelta
+from tlcore import TLCore
+
+
+# class TLCollector is worker that runs TLCore in background thread
+class TLCollector(QObject):
+    snapshotReady = Signal(object)              # TableDelta between the last two snapshots
+
+    def __init__(self, core: TLCore):
+        """ core - pipeline that loads and compares snapshots of network connections """
+        super().__init__()
+        self.core = core
+
+    @property
+    def profiling(self)-> bool:
+        return self.core.profiling
+
+    @profiling.setter
+    def profiling(self, flag: bool):
+        self.core.profiling = flag
+
+    @Slot()
+    def loadCache(self):
+        """ load domain names cache from storage """
+        self.core.load_cache()
+
+    @Slot()
+    def flushCache(self):
+        """ write domain names cache to storage """
+        self.core.flush_cache()
+
+    @Slot()
+    def collect(self):
+        """ load the next snapshot, compare it with
+            the previous one and send changes """
+        try:
+            delta = self.core.collect()
+        except Exception:
+            # the model waits for answer, so an empty delta is sent
+            traceback.print_exc()
+            self.snapshotReady.emit(TableDelta())
+            return
+        self.snapshotReady.emit(delta)
+        self.core.flush_cache_if_due()
@@ -0,0 +1,246 @@
+import time
+import socket
+from tlsnapshot import SnapshotDiffer, TableDelta
+from tlprofiler import TickProfile
+from tlbackends import defaultBackend
+from work_with_list import new_primary_key
+from work_with_netdata import (CacheDomainNames, CacheProcesses, DomainNamesStorage, FLUSH_INTERVAL_DNRECORDS,
+                               nameTransportProtocol)
+
+# headers of columns of connection table
+TABLE_HEADERS = ("Process", "PID", "Protocol", "Local Address", "Local Port",
+                 "Remote Address", "Remote Port", "Status")
+# names of fields of connection in dictionaries, in order of columns of row
+ROW_FIELDS = ("process", "pid", "protocol", "laddr", "lport", "raddr", "rport", "status")
+
+
+def row_to_dict(row, cache_domain_names: CacheDomainNames = None)-> dict:
+    """ convert row of connection table to dictionary of JSON-compatible values.
+        If cache_domain_names is given then known domain names of addresses
+        are added as "lname" and "rname" """
+    family, type = row[2]
+    connection = {"process": row[0], "pid": row[1], "protocol": nameTransportProtocol(family, type),
+                  "laddr": socket.inet_ntop(family, row[3]), "lport": row[4],
+                  "raddr": socket.inet_ntop(family, row[5]), "rport": row[6], "status": row[7]}
+    if cache_domain_names is not None:
+        for field, addr in (("lname", row[3]), ("rname", row[5])):
+            domain_name = cache_domain_names.domain_name(addr)
+            if domain_name is not None:
+                connection[field] = domain_name
+    return connection
+
+
+class TLCore:
+    """ Data pipeline of TLView without Qt: loads snapshots of network connections,
+        compares them (or receives changes from remote agent, see tlagent)
+        and keeps caches of process and domain names.
+        GUI runs it in background thread by TLCollector, headless mode (tlcli) runs it directly. """
+    MAX_PK = 2**64
+    UNIQUE_KEY = tuple(i for i in range(2, 7))         # column numbers that uniquely identify a row in a table
+    CMP_COLUMNS = (7,)                                 # columns which changes highlight a row
+    PK_COLUMN = 8                                      # column of primary key
+
+    def __init__(self, backend = None, cache_domain_names: CacheDomainNames = None,
+                 storage: DomainNamesStorage = None, flush_interval: float = FLUSH_INTERVAL_DNRECORDS,
+                 load_function = None):
+        """ * backend - source of system data (see tlbackends), if None then the best for system is used;
+            * cache_domain_names - cache in which addresses of created connections are appended,
+              if None then addresses are not resolved;
+            * storage - file in which cache of domain names is kept between launches;
+            * flush_interval - the number of seconds between writes of cache to storage;
+            * load_function - function that returns snapshot of connection table, its argument is
+              TickProfile in which durations of stages are added or None. If None then backend is used """
+        self.backend = backend if backend is not None else defaultBackend()
+        self.cacheProcesses = CacheProcesses()          # process names of connections owners
+        self.cacheDomainNames = cache_domain_names
+        self.storage = storage
+        self.differ = SnapshotDiffer(self.UNIQUE_KEY, self.CMP_COLUMNS, self.PK_COLUMN)
+        self.loadFunction = load_function if load_function is not None else self.load
+        self.source = None                              # AgentSource of remote table (see tlagent), None - local
+        self.flushInterval = flush_interval
+        self.flushTime = time.time() + flush_interval   # time of the next write of cache
+        self.profiling = False                          # measure stages of collection?
+        self.recorder = None                            # HistoryRecorder of deltas, None - history is not written
+        self.intervalStore = None                       # IntervalStore of lifetimes of connections, None - not written
+        self.resyncRequested = False                    # send all rows as new in the next delta?
+        self.rowFilter = None                           # RowFilter of rows in deltas, None - all rows are sent
+        self.refilterRequested = False                  # is filter changed since the last delta?
+        self.__shown = None                             # primary keys of sent rows, None - all rows are sent
+        self.__pk = -1                                  # value for generate primary key for table rows
+
+    def pk(self)-> int:
+        self.__pk = new_primary_key(self.__pk, self.MAX_PK)
+        return self.__pk
+
+    def load(self, profile: TickProfile = None)-> list:
+        """ return snapshot of connection table from backend """
+        return self.backend.load(self.pk, self.cacheProcesses, profile)
+
+    def load_cache(self):
+        """ load domain names cache from storage """
+        if self.storage is not None and self.cacheDomainNames is not None:
+            self.storage.load(self.cacheDomainNames)
+
+    def flush_cache(self):
+        """ write domain names cache to storage """
+        if self.storage is not None and self.cacheDomainNames is not None:
+            self.storage.save(self.cacheDomainNames)
+            self.flushTime = time.time() + self.flushInterval
+
+    def flush_cache_if_due(self):
+        if time.time() >= self.flushTime:
+            self.flush_cache()
+
+    def collect(self)-> TableDelta:
+        """ load the next snapshot, compare it with the previous one
+            and return changes. Addresses of created connections are
+            appended in domain names cache """
+        profile = TickProfile() if self.profiling else None
+        start = time.perf_counter()
+        # set_source() changes source before resync is requested, so resync is read first
+        resync = self.resyncRequested
+        source = self.source
+        if resync:
+            self.resyncRequested = False
+            self.differ.clear()
+            if source is not None:
+                source.request_resync()
+            self.__shown = set() if self.__shown is not None else None
+        refilter = self.refilterRequested
+        if refilter:
+            self.refilterRequested = False
+        row_filter = self.rowFilter
+        if source is not None:
+            # changes are received from agent, they are already found by its differ
+            if profile is not None:
+                profile.start('receive')
+            delta, table = source.next_delta()
+            if profile is not None:
+                profile.stop('receive')
+                profile.set('rows_in', len(table))
+        else:
+            if profile is not None:
+                profile.start('load')
+            table = self.loadFunction(profile)
+            if profile is not None:
+                profile.stop('load')
+                profile.set('rows_in', len(table))
+                profile.start('diff')
+            delta = self.differ.update(table)
+            if profile is not None:
+                profile.stop('diff')
+        delta.collect_time = time.perf_counter() - start
+        delta.keyframe = resync
+        recorder = self.recorder
+        if recorder is not None:
+            if profile is not None:
+                profile.start('record')
+            # after resync rows have new primary keys, so history starts from keyframe
+            recorder.record(delta, table, keyframe=resync)
+            if profile is not None:
+                profile.stop('record')
+        interval_store = self.intervalStore
+        if interval_store is not None:
+            if profile is not None:
+                profile.start('intervals')
+            interval_store.record(delta, table, keyframe=resync)
+            if profile is not None:
+                profile.stop('intervals')
+        # history is complete, receiver of deltas gets only rows accepted by filter
+        if refilter or self.__shown is not None:
+            if profile is not None:
+                profile.start('filter')
+            delta = self.filter_delta(delta, table, row_filter, refilter)
+            if profile is not None:
+                profile.stop('filter')
+        # append in cache domain names created connections
+        addresses = []
+        if self.cacheDomainNames is not None:
+            if profile is not None:
+                profile.start('dns_enqueue')
+            addresses = [(row[3], row[2][0]) for row in delta.new_rows if row[3] not in self.cacheDomainNames]
+            addresses += [(row[5], row[2][0]) for row in delta.new_rows if row[5] not in self.cacheDomainNames]
+            self.cacheDomainNames.append(*addresses)
+            if profile is not None:
+                profile.stop('dns_enqueue')
+        if profile is not None:
+            profile.set('rows_diffed', len(table) - len(delta.new_rows))
+            profile.set('rows_new', len(delta.new_rows))
+            profile.set('rows_deleted', len(delta.del_pks))
+            profile.set('rows_updated', len(delta.upd_rows))
+            profile.set('dns_enqueued', len(addresses))
+            delta.profile = profile
+        return delta
+
+    def filter_delta(self, delta: TableDelta, table: list, row_filter, refilter: bool = False)-> TableDelta:
+        """ return changes of rows accepted by row_filter. Rows that start to be accepted are sent
+            as created, rows that stop are sent as removed. refilter - filter is changed, all rows
+            of snapshot table are checked again """
+        accepts = row_filter.accepts if row_filter is not None else None
+        if refilter or accepts is None:
+            shown = self.__shown
+            if shown is None:
+                # all rows of the previous snapshot were sent
+                new_pks = {row[8] for row in delta.new_rows}
+                shown = {row[8] for row in table if row[8] not in new_pks}
+                shown.update(delta.del_pks)
+            visible = {row[8] for row in table if accepts is None or accepts(row)}
+            del_pks = [pk for pk in shown if pk not in visible]
+            new_rows = [row for row in table if row[8] in visible and row[8] not in shown]
+            upd_rows = [row for row in delta.upd_rows if row[8] in visible and row[8] in shown]
+        else:
+            shown = self.__shown
+            visible = shown
+            del_pks = [pk for pk in delta.del_pks if pk in shown]
+            visible.difference_update(del_pks)
+            new_rows = [row for row in delta.new_rows if accepts(row)]
+            visible.update(row[8] for row in new_rows)
+            upd_rows = []
+            for row in delta.upd_rows:
+                if row[8] in shown:
+                    if accepts(row):
+                        upd_rows.append(row)
+                    else:
+                        del_pks.append(row[8])
+                        visible.discard(row[8])
+                elif accepts(row):
+                    new_rows.append(row)
+                    visible.add(row[8])
+        self.__shown = visible if accepts is not None else None
+        new_pks = {row[8] for row in new_rows}
+        upd_pks = {row[8] for row in upd_rows}
+        chg_pks = [pk for pk in delta.chg_pks if pk in upd_pks and pk not in new_pks]
+        return TableDelta(del_pks, new_rows, upd_rows, chg_pks, delta.aggregates, delta.collect_time, delta.profile,
+                          delta.keyframe)
+
+    def set_row_filter(self, row_filter = None):
+        """ send only rows accepted by row_filter (see tlfilter) since the next delta,
+            None - all rows are sent """
+        self.rowFilter = row_filter if row_filter is not None and not row_filter.is_empty() else None
+        self.refilterRequested = True
+
+    def request_resync(self):
+        """ the next delta will contain all rows of snapshot as new,
+            it is used when receiver of deltas has lost the previous ones """
+        self.resyncRequested = True
+
+    def set_source(self, source = None):
+        """ take changes from source (see tlagent.AgentSource) instead of local snapshots
+            since the next delta, None - local snapshots again. The next delta contains
+            all rows as new, previous source is closed """
+        old_source, self.source = self.source, source
+        self.request_resync()
+        if old_source is not None:
+            old_source.close()
+
+    def stop(self):
+        """ stop resolving threads, write domain names cache to storage, close history, intervals and source """
+        if self.cacheDomainNames is not None:
+            self.cacheDomainNames.stop()
+        self.flush_cache()
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.intervalStore is not None:
+            self.intervalStore.close()
+        if self.source is not None:
+            self.source.close()
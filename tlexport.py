@@ -0,0 +1,131 @@
+import os
+import csv
+import json
+import sqlite3
+import threading
+from contextlib import closing
+from tlcore import TABLE_HEADERS, row_to_dict
+from work_with_netdata import rowViewStrs
+
+
+BATCH_ROWS = 2000               # count of rows written between reports of progress
+CSV_DELIMITER = ';'
+# extension of file -> format of export
+EXPORT_FORMATS = {'csv': 'csv', 'txt': 'csv', 'jsonl': 'jsonl', 'json': 'jsonl',
+                  'sqlite': 'sqlite', 'sqlite3': 'sqlite', 'db': 'sqlite'}
+SQLITE_SCHEMA = """CREATE TABLE connections (process TEXT, pid INTEGER, protocol TEXT,
+                       local_address TEXT, local_port INTEGER, remote_address TEXT, remote_port INTEGER,
+                       status TEXT, local_name TEXT, remote_name TEXT)"""
+
+
+def exportFormat(filename: str)-> str:
+    """ Return format of export by extension of file, csv by default """
+    return EXPORT_FORMATS.get(os.path.splitext(filename)[1].lstrip('.').lower(), 'csv')
+
+
+class TableExport:
+    """ Writes snapshot of connection table in file in background thread.
+        Snapshot is not changed by updates of the table, so export doesn't block
+        them. File is written under temporary name and renamed when it is complete,
+        cancelled or failed export leaves no file.
+        * rows - iterable of rows of snapshot, it is read only in thread of export;
+        * cache_domain_names - if given, then known domain names are written instead of addresses;
+        * service_names - if given, then service names are written instead of ports (CSV only);
+        * on_progress - function(written rows, all rows), it is called from thread of export;
+        * on_finished - function(ok, error message or ''), it is called from thread of export """
+    def __init__(self, rows, count_rows: int, filename: str, format: str = None, cache_domain_names = None,
+                 service_names = None, on_progress = None, on_finished = None,
+                 csv_delimiter: str = CSV_DELIMITER, batch_rows: int = BATCH_ROWS):
+        self.rows = rows
+        self.countRows = count_rows
+        self.filename = filename
+        self.format = format if format is not None else exportFormat(filename)
+        self.cacheDomainNames = cache_domain_names
+        self.serviceNames = service_names
+        self.onProgress = on_progress
+        self.onFinished = on_finished
+        self.csvDelimiter = csv_delimiter
+        self.batchRows = batch_rows
+        self.written = 0                            # count of written rows
+        self.__cancelled = threading.Event()
+        self.__thread = None
+
+    def start(self):
+        """ start export in background thread """
+        self.__thread = threading.Thread(target=self.run, name="TableExport", daemon=True)
+        self.__thread.start()
+
+    def cancel(self):
+        self.__cancelled.set()
+
+    def is_cancelled(self)-> bool:
+        return self.__cancelled.is_set()
+
+    def wait(self, timeout: float = None):
+        if self.__thread is not None:
+            self.__thread.join(timeout)
+
+    def run(self)-> bool:
+        """ write file, return True if file is complete """
+        part_filename = self.filename + '.part'
+        error = ''
+        try:
+            if os.path.exists(part_filename):
+                os.remove(part_filename)
+            write = {'csv': self.__write_csv, 'jsonl': self.__write_jsonl, 'sqlite': self.__write_sqlite}[self.format]
+            write(part_filename)
+            if not self.is_cancelled():
+                os.replace(part_filename, self.filename)
+        except Exception as e:
+            # error is reported by on_finished, thread of export has no other way to report it
+            error = str(e)
+        ok = not error and not self.is_cancelled()
+        if not ok and os.path.exists(part_filename):
+            os.remove(part_filename)
+        if self.onFinished is not None:
+            self.onFinished(ok, error)
+        return ok
+
+    def __batches(self):
+        """ return lists of rows by batch_rows, progress is reported after every batch """
+        batch = []
+        for row in self.rows:
+            batch.append(row)
+            if len(batch) == self.batchRows:
+                yield batch
+                if not self.__progress(len(batch)):
+                    return
+                batch = []
+        if batch:
+            yield batch
+            self.__progress(len(batch))
+
+    def __progress(self, count: int)-> bool:
+        self.written += count
+        if self.onProgress is not None:
+            self.onProgress(self.written, self.countRows)
+        return not self.is_cancelled()
+
+    def __write_csv(self, filename: str):
+        with open(filename, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file, delimiter=self.csvDelimiter, quoting=csv.QUOTE_MINIMAL,
+                                lineterminator='\n')
+            writer.writerow(TABLE_HEADERS)
+            for batch in self.__batches():
+                writer.writerows(rowViewStrs(row, self.cacheDomainNames, self.serviceNames) for row in batch)
+
+    def __write_jsonl(self, filename: str):
+        with open(filename, 'w', encoding='utf-8') as file:
+            for batch in self.__batches():
+                file.write(''.join(json.dumps(row_to_dict(row, self.cacheDomainNames)) + '\n' for row in batch))
+
+    def __write_sqlite(self, filename: str):
+        with closing(sqlite3.connect(filename)) as connection:
+            connection.execute(SQLITE_SCHEMA)
+            for batch in self.__batches():
+                records = [row_to_dict(row, self.cacheDomainNames) for row in batch]
+                connection.executemany("INSERT INTO connections VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                       ((r["process"], r["pid"], r["protocol"], r["laddr"], r["lport"],
+                                         r["raddr"], r["rport"], r["status"], r.get("lname"), r.get("rname"))
+                                        for r in records))
+            connection.commit()
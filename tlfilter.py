@@ -0,0 +1,145 @@
+""" Filter expressions of connection table.
+
+    Expression is a list of terms separated by spaces, row is accepted if it matches all terms:
+
+        proc:nginx state:ESTABLISHED rport:443 raddr:10.0.0.0/8
+
+    * proc:NAME - process name contains NAME (case insensitive), * and ? are wildcards;
+    * pid:N - process identifier;
+    * proto:NAME - transport protocol: tcp, tcp6, udp or udp6;
+    * state:NAME - status of connection, e.g. ESTABLISHED or LISTEN;
+    * lport:N, rport:N, port:N - local, remote or any port, N can be range 1024-2048;
+    * laddr:NET, raddr:NET, addr:NET - local, remote or any address, NET is address or network 10.0.0.0/8;
+    * word without field - process name contains word.
+    Several values separated by commas match any of them: rport:80,443. Term with prefix '-' or '!'
+    matches rows that don't match the term: -state:LISTEN. Values with spaces are quoted: proc:"my app".
+"""
+import re
+import shlex
+import fnmatch
+import ipaddress
+from tlbackends import PROTOCOL_NAMES
+
+
+FIELD_ALIASES = {'proc': 'proc', 'process': 'proc', 'pid': 'pid', 'proto': 'proto', 'protocol': 'proto',
+                 'state': 'state', 'status': 'state', 'lport': 'lport', 'rport': 'rport', 'port': 'port',
+                 'laddr': 'laddr', 'raddr': 'raddr', 'addr': 'addr'}
+
+
+def integer(value: str, field: str)-> int:
+    if not value.isdigit():
+        raise ValueError(f"{field}: {value!r} is not a number")
+    return int(value)
+
+
+def process_predicate(values: list):
+    """ process name contains any of values, values with wildcards match whole name """
+    parts = [value.lower() for value in values if not any(c in value for c in '*?[')]
+    patterns = [re.compile(fnmatch.translate(value.lower())) for value in values if any(c in value for c in '*?[')]
+
+    def predicate(row)-> bool:
+        name = (row[0] or '').lower()
+        return any(part in name for part in parts) or any(pattern.match(name) for pattern in patterns)
+    return predicate
+
+
+def port_predicate(values: list, field: str, columns: tuple):
+    """ port of any of columns is one of values or in one of ranges of values """
+    ports = set()
+    ranges = []
+    for value in values:
+        if '-' in value:
+            first, last = value.split('-', 1)
+            ranges.append((integer(first, field), integer(last, field)))
+        else:
+            ports.add(integer(value, field))
+    if not ranges:
+        if len(columns) == 1:
+            column = columns[0]
+            return lambda row: row[column] in ports
+        return lambda row: any(row[column] in ports for column in columns)
+    return lambda row: any(row[column] in ports or any(first <= row[column] <= last for first, last in ranges)
+                           for column in columns)
+
+
+def address_predicate(values: list, field: str, columns: tuple):
+    """ address of any of columns is in one of networks. Networks are ranges of integers
+        for every size of address, so address is converted to integer and compared """
+    ranges = {}                         # size of address in bytes -> list of (first, last) integers
+    for value in values:
+        try:
+            network = ipaddress.ip_network(value, strict=False)
+        except ValueError:
+            raise ValueError(f"{field}: {value!r} is not an address or network") from None
+        ranges.setdefault(network.max_prefixlen // 8, []).append((int(network.network_address),
+                                                                  int(network.broadcast_address)))
+
+    def in_networks(addr: bytes)-> bool:
+        number = int.from_bytes(addr, 'big')
+        return any(first <= number <= last for first, last in ranges.get(len(addr), ()))
+    if len(columns) == 1:
+        column = columns[0]
+        return lambda row: in_networks(row[column])
+    return lambda row: any(in_networks(row[column]) for column in columns)
+
+
+def term_predicate(field: str, values: list):
+    """ return function row -> bool for one term of expression """
+    if field == 'proc':
+        return process_predicate(values)
+    elif field == 'pid':
+        pids = {integer(value, field) for value in values}
+        return lambda row: row[1] in pids
+    elif field == 'proto':
+        try:
+            protocols = {PROTOCOL_NAMES[value.lower()] for value in values}
+        except KeyError as e:
+            raise ValueError(f"proto: unknown protocol {e}, known: {', '.join(PROTOCOL_NAMES)}") from None
+        return lambda row: row[2] in protocols
+    elif field == 'state':
+        states = {value.upper() for value in values}
+        return lambda row: row[7] in states
+    elif field in ('lport', 'rport', 'port'):
+        return port_predicate(values, field, {'lport': (4,), 'rport': (6,), 'port': (4, 6)}[field])
+    else:
+        return address_predicate(values, field, {'laddr': (3,), 'raddr': (5,), 'addr': (3, 5)}[field])
+
+
+class RowFilter:
+    """ Filter of rows of connection table by expression. Expression is compiled
+        once, accepts(row) checks raw fields of row without conversion to text.
+        ValueError is raised if expression is not valid """
+    def __init__(self, expression: str = ''):
+        self.expression = expression.strip()
+        predicates = []
+        terms = shlex.split(self.expression)          # ValueError if quotation is not closed
+        for term in terms:
+            negative = term[:1] in ('-', '!') and len(term) > 1
+            if negative:
+                term = term[1:]
+            field, separator, value = term.partition(':')
+            if not separator:
+                field, value = 'proc', term
+            elif field.lower() not in FIELD_ALIASES:
+                raise ValueError(f"unknown field {field!r}, known: {', '.join(sorted(set(FIELD_ALIASES.values())))}")
+            values = [value for value in value.split(',') if value]
+            if not values:
+                raise ValueError(f"{field}: value is missing")
+            predicate = term_predicate(FIELD_ALIASES[field.lower()], values)
+            predicates.append((lambda row, p=predicate: not p(row)) if negative else predicate)
+        self.countTerms = len(predicates)
+        if not predicates:
+            self.accepts = lambda row: True
+        elif len(predicates) == 1:
+            self.accepts = predicates[0]
+        else:
+            self.accepts = lambda row: all(predicate(row) for predicate in predicates)
+
+    def is_empty(self)-> bool:
+        return self.countTerms == 0
+
+    def __str__(self):
+        return self.expression
+
+    def __repr__(self):
+        return f"RowFilter({self.expression!r})"
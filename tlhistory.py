@@ -0,0 +1,324 @@
+""" Append-only history of connection table.
+
+    File starts with MAGIC, then records follow. Record is header
+    (kind, flags, time, payload length) and payload, payload is compressed
+    by zlib if flags has FLAG_ZLIB. Kinds of records:
+    * keyframe - all rows of table;
+    * delta - primary keys of removed rows, added rows and updated rows.
+    Strings (process names and statuses) are written once in a table of strings,
+    which starts again at every keyframe, so replay can start at any keyframe.
+"""
+import os
+import zlib
+import socket
+import time
+import bisect
+import struct
+import threading
+from tlsnapshot import TableDelta, TableAggregates
+from tlbackends import PROTOCOLS
+
+
+MAGIC = b'TLVH\x01'
+KIND_KEYFRAME = b'K'
+KIND_DELTA = b'D'
+FLAG_ZLIB = 1
+RECORD_HEADER = struct.Struct('<cBdI')          # kind, flags, time, length of payload
+ROW_HEADER = struct.Struct('<QqBHHII')          # pk, pid, protocol, local port, remote port, process, status
+COUNT = struct.Struct('<I')
+PK = struct.Struct('<Q')
+STRING_LENGTH = struct.Struct('<H')
+NO_PID = -1
+NO_STRING = 0xFFFFFFFF
+KEYFRAME_INTERVAL = 600         # the number of seconds between keyframes
+KEYFRAME_DELTAS = 600           # the largest count of deltas between keyframes
+COMPRESS_SIZE = 256             # payloads from this size are compressed
+ADDRESS_SIZES = {socket.AF_INET: 4, socket.AF_INET6: 16}
+PROTOCOL_CODES = {protocol: code for code, protocol in enumerate(PROTOCOLS)}
+
+
+def scan_records(file, offset: int = len(MAGIC))-> tuple:
+    """ return list of tuples (kind, time, offset of payload, length of payload, flags)
+        of complete records from offset and offset of the end of the last complete record """
+    records = []
+    size = os.fstat(file.fileno()).st_size
+    file.seek(offset)
+    while True:
+        header = file.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            break
+        kind, flags, t, length = RECORD_HEADER.unpack(header)
+        if kind not in (KIND_KEYFRAME, KIND_DELTA):
+            break
+        payload_offset = offset + RECORD_HEADER.size
+        if payload_offset + length > size:
+            break                       # record is not written completely
+        file.seek(length, os.SEEK_CUR)
+        records.append((kind, t, payload_offset, length, flags))
+        offset = payload_offset + length
+    return records, offset
+
+
+class RecordEncoder:
+    """ Encodes snapshots and deltas in payloads of records. Strings are written once in
+        table of strings, which starts again at every keyframe. It is used by history files
+        and by stream of agent (see tlagent) """
+    def __init__(self):
+        self.strings = None             # string -> index in table of strings since the last keyframe
+
+    def __string(self, value: str, new_strings: list)-> int:
+        if value is None:
+            return NO_STRING
+        index = self.strings.get(value, None)
+        if index is None:
+            index = self.strings[value] = len(self.strings)
+            new_strings.append(value)
+        return index
+
+    def __encode_rows(self, rows, new_strings: list, parts: list):
+        parts.append(COUNT.pack(len(rows)))
+        for row in rows:
+            parts.append(ROW_HEADER.pack(row[8], row[1] if row[1] is not None else NO_PID,
+                                         PROTOCOL_CODES[row[2]], row[4], row[6],
+                                         self.__string(row[0], new_strings), self.__string(row[7], new_strings)))
+            parts.append(row[3])
+            parts.append(row[5])
+
+    @staticmethod
+    def __payload(new_strings: list, parts: list)-> bytes:
+        strings = [COUNT.pack(len(new_strings))]
+        for value in new_strings:
+            data = value.encode('utf-8')
+            strings.append(STRING_LENGTH.pack(len(data)))
+            strings.append(data)
+        return b''.join(strings + parts)
+
+    def keyframe(self, table)-> bytes:
+        """ return payload of keyframe record with all rows of table """
+        self.strings = {}
+        new_strings = []
+        parts = []
+        self.__encode_rows(table, new_strings, parts)
+        return self.__payload(new_strings, parts)
+
+    def delta(self, delta: TableDelta)-> bytes:
+        """ return payload of delta record, keyframe must be encoded before """
+        new_strings = []
+        parts = [COUNT.pack(len(delta.del_pks))]
+        parts.extend(PK.pack(pk) for pk in delta.del_pks)
+        self.__encode_rows(delta.new_rows, new_strings, parts)
+        self.__encode_rows(delta.upd_rows, new_strings, parts)
+        return self.__payload(new_strings, parts)
+
+
+class RecordDecoder:
+    """ Decodes payloads of records made by RecordEncoder, records must be decoded in order from keyframe """
+    def __init__(self):
+        self.strings = []               # table of strings since the last keyframe
+
+    def __decode_rows(self, payload: bytes, offset: int)-> tuple:
+        count, = COUNT.unpack_from(payload, offset)
+        offset += COUNT.size
+        rows = []
+        strings = self.strings
+        for _ in range(count):
+            pk, pid, protocol, local_port, remote_port, process, status = ROW_HEADER.unpack_from(payload, offset)
+            offset += ROW_HEADER.size
+            protocol = PROTOCOLS[protocol]
+            size = ADDRESS_SIZES[protocol[0]]
+            local_ip = payload[offset:offset + size]
+            remote_ip = payload[offset + size:offset + 2 * size]
+            offset += 2 * size
+            rows.append([strings[process] if process != NO_STRING else None, pid if pid != NO_PID else None,
+                         protocol, local_ip, local_port, remote_ip, remote_port,
+                         strings[status] if status != NO_STRING else None, pk])
+        return rows, offset
+
+    def decode(self, kind: bytes, payload: bytes)-> tuple:
+        """ return primary keys of removed rows and list of added or updated rows.
+            Removed rows of keyframe are None, keyframe replaces all rows """
+        if kind == KIND_KEYFRAME:
+            self.strings = []
+        count, = COUNT.unpack_from(payload, 0)
+        offset = COUNT.size
+        for _ in range(count):
+            length, = STRING_LENGTH.unpack_from(payload, offset)
+            offset += STRING_LENGTH.size
+            self.strings.append(payload[offset:offset + length].decode('utf-8'))
+            offset += length
+        del_pks = None
+        if kind == KIND_DELTA:
+            count, = COUNT.unpack_from(payload, offset)
+            offset += COUNT.size
+            del_pks = [PK.unpack_from(payload, offset + i * PK.size)[0] for i in range(count)]
+            offset += count * PK.size
+        rows = []
+        for _ in range(1 if kind == KIND_KEYFRAME else 2):
+            part, offset = self.__decode_rows(payload, offset)
+            rows += part
+        return del_pks, rows
+
+
+class HistoryRecorder:
+    """ Writes deltas of snapshots in history file. Keyframe is written at the
+        beginning and then after keyframe_interval seconds or keyframe_deltas deltas.
+        Methods are thread-safe, recorder is called from thread of collector """
+    def __init__(self, filename: str, keyframe_interval: float = KEYFRAME_INTERVAL,
+                 keyframe_deltas: int = KEYFRAME_DELTAS):
+        self.filename = filename
+        self.keyframeInterval = keyframe_interval
+        self.keyframeDeltas = keyframe_deltas
+        self.__lock = threading.Lock()
+        self.__file = open(filename, 'a+b')
+        self.__file.seek(0)
+        magic = self.__file.read(len(MAGIC))
+        if len(magic) == 0:
+            self.__file.write(MAGIC)
+        elif magic != MAGIC:
+            self.__file.close()
+            raise ValueError(f"{filename} is not a history file")
+        else:
+            # tail of record that was not written completely is cut off
+            _, end = scan_records(self.__file)
+            self.__file.truncate(end)
+        self.__file.seek(0, os.SEEK_END)
+        self.__encoder = RecordEncoder()
+        self.__keyframe_time = 0.0
+        self.__deltas = 0               # count of deltas since the last keyframe
+        self.bytesWritten = 0
+
+    def __write(self, kind: bytes, t: float, payload: bytes):
+        flags = 0
+        if len(payload) >= COMPRESS_SIZE:
+            payload = zlib.compress(payload, 1)
+            flags |= FLAG_ZLIB
+        self.__file.write(RECORD_HEADER.pack(kind, flags, t, len(payload)) + payload)
+        self.__file.flush()
+        self.bytesWritten += RECORD_HEADER.size + len(payload)
+
+    def record(self, delta: TableDelta, table: list, t: float = None, keyframe: bool = False):
+        """ write changes of snapshot. table - all rows of the snapshot, it is used for keyframes;
+            keyframe - write keyframe instead of delta """
+        t = t if t is not None else time.time()
+        with self.__lock:
+            if self.__file.closed:
+                return
+            if (keyframe or self.__encoder.strings is None or t - self.__keyframe_time >= self.keyframeInterval or
+                    self.__deltas >= self.keyframeDeltas):
+                self.__write(KIND_KEYFRAME, t, self.__encoder.keyframe(table))
+                self.__keyframe_time = t
+                self.__deltas = 0
+            elif not delta.is_empty():
+                self.__write(KIND_DELTA, t, self.__encoder.delta(delta))
+                self.__deltas += 1
+
+    def close(self):
+        with self.__lock:
+            self.__file.close()
+
+
+class HistoryReader:
+    """ Index of records of history file. File can be written by recorder at the same time,
+        refresh() appends new records in the index """
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.__file = open(filename, 'rb')
+        if self.__file.read(len(MAGIC)) != MAGIC:
+            self.__file.close()
+            raise ValueError(f"{filename} is not a history file")
+        self.records = []               # tuples (kind, time, offset of payload, length of payload, flags)
+        self.times = []                 # times of records
+        self.keyframes = []             # numbers of keyframe records
+        self.__end = len(MAGIC)
+        self.refresh()
+
+    def refresh(self)-> int:
+        """ read headers of new records, return count of them """
+        records, self.__end = scan_records(self.__file, self.__end)
+        for record in records:
+            if record[0] == KIND_KEYFRAME:
+                self.keyframes.append(len(self.records))
+            self.records.append(record)
+            self.times.append(record[1])
+        return len(records)
+
+    def start_time(self)-> float:
+        return self.times[self.keyframes[0]] if self.keyframes else 0.0
+
+    def end_time(self)-> float:
+        return self.times[-1] if self.times else 0.0
+
+    def record_at(self, t: float)-> int:
+        """ return number of the last record written not later than t, -1 if there is no such record """
+        return bisect.bisect_right(self.times, t) - 1
+
+    def keyframe_before(self, record: int)-> int:
+        """ return number of the last keyframe not later than record, -1 if there is no such keyframe """
+        index = bisect.bisect_right(self.keyframes, record) - 1
+        return self.keyframes[index] if index >= 0 else -1
+
+    def payload(self, record: int)-> bytes:
+        kind, t, offset, length, flags = self.records[record]
+        self.__file.seek(offset)
+        payload = self.__file.read(length)
+        return zlib.decompress(payload) if flags & FLAG_ZLIB else payload
+
+    def close(self):
+        self.__file.close()
+
+
+class HistoryReplay:
+    """ State of table at chosen time. It is made from the nearest
+        keyframe before the time and deltas after the keyframe,
+        moving forward applies only new deltas """
+    def __init__(self, reader: HistoryReader):
+        self.reader = reader
+        self.rows = {}                  # primary key -> row at current position
+        self.position = -1              # number of the last applied record
+        self.__decoder = RecordDecoder()
+
+    def __apply(self, record: int):
+        del_pks, rows = self.__decoder.decode(self.reader.records[record][0], self.reader.payload(record))
+        if del_pks is None:
+            self.rows = {}
+        else:
+            for pk in del_pks:
+                self.rows.pop(pk, None)
+        for row in rows:
+            self.rows[row[8]] = row
+        self.position = record
+
+    def seek(self, t: float)-> dict:
+        """ move to time t, return dictionary primary key -> row of table at that time """
+        record = self.reader.record_at(t)
+        keyframe = self.reader.keyframe_before(record)
+        if keyframe < 0:
+            self.rows = {}
+            self.position = -1
+            return self.rows
+        if not keyframe <= self.position <= record:
+            self.__apply(keyframe)
+        for i in range(self.position + 1, record + 1):
+            self.__apply(i)
+        return self.rows
+
+    def time(self)-> float:
+        return self.reader.times[self.position] if self.position >= 0 else 0.0
+
+
+def delta_between(old_rows: dict, new_rows: dict)-> TableDelta:
+    """ return delta that turns table old_rows into table new_rows,
+        tables are dictionaries primary key -> row """
+    del_pks = [pk for pk in old_rows if pk not in new_rows]
+    added = []
+    updated = []
+    chg_pks = []
+    for pk, row in new_rows.items():
+        old_row = old_rows.get(pk, None)
+        if old_row is None:
+            added.append(list(row))
+        elif old_row != row:
+            updated.append(list(row))
+            if old_row[7] != row[7]:
+                chg_pks.append(pk)
+    return TableDelta(del_pks, added, updated, chg_pks, TableAggregates(list(new_rows.values())))
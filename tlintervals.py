@@ -0,0 +1,257 @@
+""" Database of lifetimes of connections.
+
+    Every connection is one row of table connections: endpoints, process, the first
+    and the last time it was seen and the last status. Changes of status are kept in
+    table status_changes. Queries use indexes by remote address, ports, pid and time:
+
+        python -m tlintervals ~/.tlview_intervals.sqlite3 --raddr 10.2.0.0/16 --rport 5432 --since 1d
+"""
+import sys
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+import ipaddress
+from datetime import datetime
+from tlsnapshot import TableDelta
+from work_with_netdata import nameTransportProtocol
+
+
+COMMIT_INTERVAL = 10            # the number of seconds between transactions
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS connections (
+           id INTEGER PRIMARY KEY, process TEXT, pid INTEGER, protocol TEXT, family INTEGER,
+           local_address BLOB, local_port INTEGER, remote_address BLOB, remote_port INTEGER,
+           status TEXT, first_seen REAL, last_seen REAL)""",
+    """CREATE TABLE IF NOT EXISTS status_changes (
+           connection_id INTEGER, time REAL, status TEXT)""",
+    "CREATE INDEX IF NOT EXISTS connections_remote_address ON connections (family, remote_address)",
+    "CREATE INDEX IF NOT EXISTS connections_remote_port ON connections (remote_port)",
+    "CREATE INDEX IF NOT EXISTS connections_local_port ON connections (local_port)",
+    "CREATE INDEX IF NOT EXISTS connections_pid ON connections (pid)",
+    "CREATE INDEX IF NOT EXISTS connections_first_seen ON connections (first_seen)",
+    "CREATE INDEX IF NOT EXISTS connections_last_seen ON connections (last_seen)",
+    "CREATE INDEX IF NOT EXISTS status_changes_connection ON status_changes (connection_id)",
+)
+IP_VERSIONS = {socket.AF_INET: 4, socket.AF_INET6: 6}
+FAMILIES = {4: socket.AF_INET, 6: socket.AF_INET6}
+
+
+def connection_key(row)-> tuple:
+    """ connection is the same while its endpoints, protocol and owner are the same """
+    return row[1], row[2], row[3], row[4], row[5], row[6]
+
+
+class IntervalStore:
+    """ Turns deltas of snapshots into lifetimes of connections in SQLite database.
+        Changes are collected in memory and written by one transaction in
+        commit_interval seconds with executemany(), never by statement per row.
+        Methods are thread-safe, store is called from thread of collector """
+    def __init__(self, filename: str, commit_interval: float = COMMIT_INTERVAL):
+        self.filename = filename
+        self.commitInterval = commit_interval
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(filename, check_same_thread=False)
+        for statement in SCHEMA:
+            self.__connection.execute(statement)
+        self.__connection.commit()
+        self.__next_id = (self.__connection.execute("SELECT MAX(id) FROM connections").fetchone()[0] or 0) + 1
+        # connection key -> [id, status, count of rows] of connections seen in the last snapshot,
+        # several rows have one key when backend makes row for every descriptor of socket
+        self.__open = {}
+        self.__keys = {}                # primary key of row -> connection key
+        self.__last_time = None         # time of the last snapshot
+        self.__commit_time = time.time() + commit_interval
+        # changes waiting for transaction
+        self.__inserts = []
+        self.__closes = []
+        self.__statuses = []
+        self.__status_changes = []
+
+    def __open_connection(self, row, t: float)-> list:
+        """ count row in its connection, connection is inserted for its first row. return record of connection """
+        key = connection_key(row)
+        if self.__keys.get(row[8], None) == key:
+            return self.__open[key]     # row is already counted
+        self.__keys[row[8]] = key
+        record = self.__open.get(key, None)
+        if record is not None:
+            record[2] += 1
+            return record
+        family, type = row[2]
+        record = self.__open[key] = [self.__next_id, row[7], 1]
+        self.__inserts.append((self.__next_id, row[0], row[1], nameTransportProtocol(family, type),
+                               IP_VERSIONS.get(family, 0), row[3], row[4], row[5], row[6], row[7], t, t))
+        self.__status_changes.append((self.__next_id, t, row[7]))
+        self.__next_id += 1
+        return record
+
+    def __close_connection(self, pk: int):
+        """ uncount row, connection is closed when its last row is removed """
+        key = self.__keys.pop(pk, None)
+        if key is None:
+            return
+        record = self.__open[key]
+        record[2] -= 1
+        if record[2] == 0:
+            del self.__open[key]
+            self.__closes.append((self.__last_time, record[0]))
+
+    def record(self, delta: TableDelta, table: list, t: float = None, keyframe: bool = False):
+        """ add changes of snapshot. table - all rows of the snapshot;
+            keyframe - primary keys of rows are new, connections are matched by endpoints """
+        t = t if t is not None else time.time()
+        with self.__lock:
+            if self.__connection is None:
+                return
+            if keyframe or self.__last_time is None:
+                # rows are counted again, connections without rows are closed
+                self.__keys = {}
+                for record in self.__open.values():
+                    record[2] = 0
+                for row in table:
+                    self.__open_connection(row, t)
+                for key in [key for key, record in self.__open.items() if record[2] == 0]:
+                    self.__closes.append((self.__last_time, self.__open.pop(key)[0]))
+            else:
+                for pk in delta.del_pks:
+                    self.__close_connection(pk)
+                for row in delta.upd_rows:
+                    old_key = self.__keys.get(row[8], None)
+                    if old_key is not None and old_key != connection_key(row):
+                        # owner of connection is changed, it is a new connection
+                        self.__close_connection(row[8])
+                    record = self.__open_connection(row, t)
+                    if record[1] != row[7]:
+                        record[1] = row[7]
+                        self.__statuses.append((row[7], record[0]))
+                        self.__status_changes.append((record[0], t, row[7]))
+                for row in delta.new_rows:
+                    self.__open_connection(row, t)
+            self.__last_time = t
+            if t >= self.__commit_time:
+                self.__commit()
+
+    def __commit(self):
+        """ write collected changes and the last time of open connections by one transaction """
+        with self.__connection:
+            self.__connection.executemany("INSERT INTO connections VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                          self.__inserts)
+            self.__connection.executemany("UPDATE connections SET last_seen = ? WHERE id = ?", self.__closes)
+            self.__connection.executemany("UPDATE connections SET status = ? WHERE id = ?", self.__statuses)
+            self.__connection.executemany("INSERT INTO status_changes VALUES (?, ?, ?)", self.__status_changes)
+            if self.__last_time is not None:
+                self.__connection.executemany("UPDATE connections SET last_seen = ? WHERE id = ?",
+                                              ((self.__last_time, record[0]) for record in self.__open.values()))
+        self.__inserts = []
+        self.__closes = []
+        self.__statuses = []
+        self.__status_changes = []
+        self.__commit_time = time.time() + self.commitInterval
+
+    def commit(self):
+        with self.__lock:
+            if self.__connection is not None:
+                self.__commit()
+
+    def close(self):
+        """ write collected changes and close database """
+        with self.__lock:
+            if self.__connection is not None:
+                self.__commit()
+                self.__connection.close()
+                self.__connection = None
+
+
+def parse_time(text: str)-> float:
+    """ "2h", "1d", "30m" (or "-2h") - time before now; "2024-01-31" or "2024-01-31T12:00" - local time;
+        number - seconds since epoch """
+    text = text.strip()
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    if text[-1:] in units and text[:-1].lstrip('-').replace('.', '', 1).isdigit():
+        return time.time() - float(text[:-1].lstrip('-')) * units[text[-1]]
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.fromisoformat(text).timestamp()
+
+
+def query_intervals(raddr: str = None, rport: int = None, lport: int = None, pid: int = None,
+                    process: str = None, since: float = None, until: float = None, limit: int = None)-> tuple:
+    """ return SQL query and its parameters for connections that satisfy all given conditions.
+        raddr - address or network in CIDR notation; since, until - connection was alive in the period """
+    conditions = []
+    parameters = []
+    if raddr is not None:
+        network = ipaddress.ip_network(raddr, strict=False)
+        # addresses are blobs in network byte order, so network is a range of blobs of the same length
+        conditions.append("family = ? AND remote_address BETWEEN ? AND ?")
+        parameters += [network.version, network.network_address.packed, network.broadcast_address.packed]
+    if rport is not None:
+        conditions.append("remote_port = ?")
+        parameters.append(rport)
+    if lport is not None:
+        conditions.append("local_port = ?")
+        parameters.append(lport)
+    if pid is not None:
+        conditions.append("pid = ?")
+        parameters.append(pid)
+    if process is not None:
+        conditions.append("process = ?")
+        parameters.append(process)
+    if since is not None:
+        conditions.append("last_seen >= ?")
+        parameters.append(since)
+    if until is not None:
+        conditions.append("first_seen <= ?")
+        parameters.append(until)
+    query = "SELECT * FROM connections"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY first_seen"
+    if limit is not None:
+        query += f" LIMIT {int(limit)}"
+    return query, parameters
+
+
+def format_interval(record: tuple)-> str:
+    id, process, pid, protocol, version, laddr, lport, raddr, rport, status, first_seen, last_seen = record
+    family = FAMILIES.get(version, socket.AF_INET)
+    return (f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(first_seen))} - "
+            f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(last_seen))}  {process} ({pid})  {protocol}  "
+            f"{socket.inet_ntop(family, laddr)}:{lport} -> {socket.inet_ntop(family, raddr)}:{rport}  {status}")
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog="python -m tlintervals", description="Query lifetimes of past connections")
+    parser.add_argument('database', help="database written by TLView")
+    parser.add_argument('--raddr', help="remote address or network, e.g. 10.2.0.0/16")
+    parser.add_argument('--rport', type=int, help="remote port")
+    parser.add_argument('--lport', type=int, help="local port")
+    parser.add_argument('--pid', type=int, help="process identifier")
+    parser.add_argument('--process', help="process name")
+    parser.add_argument('--since', type=parse_time, help="1d, 2h (time ago), ISO time or epoch seconds")
+    parser.add_argument('--until', type=parse_time, help="1d, 2h (time ago), ISO time or epoch seconds")
+    parser.add_argument('--limit', type=int, help="the largest count of connections")
+    parser.add_argument('--statuses', action='store_true', help="print changes of status of connections")
+    parser.add_argument('--explain', action='store_true', help="print plan of query instead of connections")
+    args = parser.parse_args(argv)
+    connection = sqlite3.connect(f"file:{args.database}?mode=ro", uri=True)
+    query, parameters = query_intervals(args.raddr, args.rport, args.lport, args.pid, args.process,
+                                        args.since, args.until, args.limit)
+    if args.explain:
+        for record in connection.execute("EXPLAIN QUERY PLAN " + query, parameters):
+            print(record[-1])
+        return
+    for record in connection.execute(query, parameters):
+        print(format_interval(record))
+        if args.statuses:
+            for t, status in connection.execute("SELECT time, status FROM status_changes "
+                                                "WHERE connection_id = ? ORDER BY time", (record[0],)):
+                print(f"    {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(t))}  {status}")
+    connection.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
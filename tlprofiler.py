@@ -0,0 +1,63 @@
+import json
+import time
+
+
+class TickProfile:
+    """ Durations of stages and counters of one update of the table.
+        The profile is created only when profiling is on, code of stages
+        checks that profile is not None, so profiling off costs nothing """
+    def __init__(self):
+        self.time = time.time()             # time of the start of update
+        self.stages = {}                    # stage name -> the number of seconds
+        self.counters = {}                  # counter name -> value
+        self.__starts = {}                  # stage name -> time of the start of stage
+
+    def start(self, stage: str):
+        self.__starts[stage] = time.perf_counter()
+
+    def stop(self, stage: str):
+        """ adds duration of stage since start(), stage can be measured several times """
+        duration = time.perf_counter() - self.__starts.pop(stage)
+        self.stages[stage] = self.stages.get(stage, 0.0) + duration
+
+    def count(self, counter: str, value: int = 1):
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def set(self, counter: str, value):
+        self.counters[counter] = value
+
+    def merge(self, other):
+        """ adds stages and counters of other profile """
+        for stage, duration in other.stages.items():
+            self.stages[stage] = self.stages.get(stage, 0.0) + duration
+        for counter, value in other.counters.items():
+            self.count(counter, value)
+
+    def duration(self, stage: str)-> float:
+        return self.stages.get(stage, 0.0)
+
+    def counter(self, counter: str, default = 0):
+        return self.counters.get(counter, default)
+
+    def to_dict(self)-> dict:
+        return {'time': self.time, 'stages': self.stages, 'counters': self.counters}
+
+    def __str__(self):
+        return str(self.to_dict())
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class ProfileLog:
+    """ Appends profiles to file as JSON lines """
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.__file = open(filename, 'a')
+
+    def write(self, profile: TickProfile):
+        self.__file.write(json.dumps(profile.to_dict()) + '\n')
+        self.__file.flush()
+
+    def close(self):
+        self.__file.close()
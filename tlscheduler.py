@@ -0,0 +1,39 @@
+MIN_INTERVAL = 500              # the smallest interval of updates in milliseconds
+MAX_INTERVAL = 10000            # the largest interval of updates in milliseconds
+START_INTERVAL = 1000           # interval of the first update in milliseconds
+COST_SHARE = 0.1                # collection may take no more than this share of the interval
+HIGH_CHURN = 0.02               # share of changed connections from which the interval is shortened
+IDLE_GROWTH = 1.5               # interval is multiplied by it when nothing changed
+CHURN_REDUCTION = 0.5           # interval is multiplied by it when churn is high
+
+
+class AdaptiveInterval:
+    """ Interval of updates in "Auto" mode. It is computed after every
+        snapshot from time of collection and count of changed connections:
+        * interval is not less than time of collection divided by COST_SHARE;
+        * interval grows when nothing changed;
+        * interval is shortened when many connections changed. """
+    def __init__(self, interval: int = START_INTERVAL, min_interval: int = MIN_INTERVAL,
+                 max_interval: int = MAX_INTERVAL, cost_share: float = COST_SHARE, high_churn: float = HIGH_CHURN):
+        self.minInterval = min_interval
+        self.maxInterval = max_interval
+        self.costShare = cost_share
+        self.highChurn = high_churn
+        self.interval = interval
+
+    def update(self, collect_time: float, changes: int, total: int)-> int:
+        """ return interval in milliseconds before the next update.
+            * collect_time - the number of seconds spent on the last snapshot;
+            * changes - count of created, deleted and changed connections;
+            * total - count of connections in the last snapshot """
+        interval = self.interval
+        if changes == 0:
+            interval *= IDLE_GROWTH
+        elif changes >= self.highChurn * max(total, 1):
+            interval *= CHURN_REDUCTION
+        lower = max(self.minInterval, collect_time * 1000 / self.costShare)
+        self.interval = int(min(max(interval, lower), self.maxInterval))
+        return self.interval
+
+    def reset(self, interval: int = START_INTERVAL):
+        self.interval = interval
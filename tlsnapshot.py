@@ -0,0 +1,117 @@
+from collections import Counter
+from operator import itemgetter
+from work_with_list import tables_match, lists_are_diff
+
+
+class TableAggregates:
+    """ Counts of connections of one snapshot by status, protocol and process.
+        They are counted once when the snapshot is loaded """
+    def __init__(self, table = (), process_column: int = 0, pid_column: int = 1,
+                 protocol_column: int = 2, status_column: int = 7):
+        self.total = len(table)
+        self.__process_column = process_column
+        self.__pid_column = pid_column
+        self.__protocol_column = protocol_column
+        self.__status_column = status_column
+        # counting by columns is done by Counter in C, it is faster than a loop over rows in Python
+        self.statuses = Counter(map(itemgetter(status_column), table))      # status -> count
+        self.protocols = Counter(map(itemgetter(protocol_column), table))   # (family, type) -> count
+        self.processes = Counter(map(itemgetter(pid_column, process_column), table))   # (pid, name) -> count
+
+    def update(self, removed_rows = (), added_rows = ()):
+        """ subtract removed rows and add added rows, counts become counts of changed
+            table without counting of all its rows """
+        removed_rows = list(removed_rows)
+        added_rows = list(added_rows)
+        self.total += len(added_rows) - len(removed_rows)
+        for counter, key in ((self.statuses, itemgetter(self.__status_column)),
+                             (self.protocols, itemgetter(self.__protocol_column)),
+                             (self.processes, itemgetter(self.__pid_column, self.__process_column))):
+            removed = list(map(key, removed_rows))
+            counter.subtract(removed)
+            counter.update(map(key, added_rows))
+            for value in removed:
+                if counter.get(value, 1) <= 0:
+                    del counter[value]
+
+    def copy(self):
+        aggregates = TableAggregates((), self.__process_column, self.__pid_column,
+                                     self.__protocol_column, self.__status_column)
+        aggregates.total = self.total
+        aggregates.statuses = Counter(self.statuses)
+        aggregates.protocols = Counter(self.protocols)
+        aggregates.processes = Counter(self.processes)
+        return aggregates
+
+    def count_status(self, status: str)-> int:
+        return self.statuses.get(status, 0)
+
+    def count_protocol(self, protocol: tuple)-> int:
+        return self.protocols.get(protocol, 0)
+
+    def count_process(self, pid: int, name: str)-> int:
+        return self.processes.get((pid, name), 0)
+
+    def __str__(self):
+        return f"[total: {self.total}, statuses: {dict(self.statuses)}]"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class TableDelta:
+    """ Changes between two consecutive snapshots of the connection table """
+    def __init__(self, del_pks = (), new_rows = (), upd_rows = (), chg_pks = (), aggregates: TableAggregates = None,
+                 collect_time: float = 0.0, profile = None, keyframe: bool = False):
+        self.del_pks = tuple(del_pks)           # primary keys of disappeared rows
+        self.new_rows = list(new_rows)          # created rows
+        self.upd_rows = list(upd_rows)          # new data of remaining rows that differ from the previous snapshot
+        self.chg_pks = tuple(chg_pks)           # primary keys of rows which compared columns are updated
+        self.aggregates = aggregates            # counts of connections of the new snapshot
+        self.collect_time = collect_time        # the number of seconds spent on loading and comparing snapshot
+        self.profile = profile                  # TickProfile of update if profiling is on, else None
+        self.keyframe = keyframe                # are all rows of snapshot new, after resync of pipeline?
+
+    def is_empty(self)-> bool:
+        return not (self.del_pks or self.new_rows or self.upd_rows)
+
+    def count_changes(self)-> int:
+        """ count of created, deleted and changed connections """
+        return len(self.del_pks) + len(self.new_rows) + len(self.chg_pks)
+
+    def __str__(self):
+        return f"[del: {len(self.del_pks)}, new: {len(self.new_rows)}, " \
+               f"upd: {len(self.upd_rows)}, chg: {len(self.chg_pks)}]"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class SnapshotDiffer:
+    """ Keeps the last snapshot of the connection table and
+        finds changes of next snapshots relative to it.
+        Rows that remain in the table keep their primary keys. """
+    def __init__(self, unique_key: tuple, cmp_columns: tuple, pk_column: int):
+        self.unique_key = unique_key            # columns that uniquely identify a row in a table
+        self.cmp_columns = cmp_columns          # columns which changes highlight a row
+        self.pk_column = pk_column              # column of primary key
+        self.table = []                         # last snapshot
+
+    def update(self, table: list)-> TableDelta:
+        """ Compares the new snapshot with the last one and
+            makes the new snapshot the last one """
+        pk = self.pk_column
+        del_rows, new_rows, pairs = tables_match(self.table, table, *self.unique_key)
+        upd_rows = []
+        chg_pks = []
+        for old_row, new_row in pairs:
+            new_row[pk] = old_row[pk]
+            if new_row != old_row:
+                upd_rows.append(new_row)
+                if lists_are_diff(old_row, new_row, *self.cmp_columns):
+                    chg_pks.append(new_row[pk])
+        self.table = table
+        return TableDelta((row[pk] for row in del_rows), new_rows, upd_rows, chg_pks, TableAggregates(table))
+
+    def clear(self):
+        self.table = []
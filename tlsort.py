@@ -0,0 +1,159 @@
+""" Sorting of connection table by cached keys.
+
+    Key of row is computed once, when the row appears or changes. Rows with
+    unchanged keys keep their order and new or changed rows are merged into it,
+    so table with few changes is sorted by one pass instead of full sort.
+    Full sorts of large tables are made in background thread on copy of table.
+"""
+import threading
+from operator import itemgetter
+from tlstorage import ConnectionTable
+from work_with_netdata import nameTransportProtocol, statusViewStr
+
+
+BACKGROUND_SORT_ROWS = 20000    # full sorts of tables from this size are made in background thread
+MERGE_SHARE = 0.25              # if larger share of rows is changed, then full sort is made instead of merge
+
+
+def sort_key_function(column: int, cache_domain_names = None, service_names = None):
+    """ return function row -> sort key of column. Keys are ordered as displayed values:
+        protocols by names, addresses by families and then by numeric values.
+        If cache_domain_names is given, then addresses with known domain names are ordered
+        by names before the others; if service_names is given, the same is made for ports """
+    if column == 0:
+        return lambda row: row[0] or ''
+    elif column == 1:
+        return lambda row: row[1] if row[1] is not None else -1
+    elif column == 2:
+        names = {}                      # protocol -> its name, there are only a few protocols
+
+        def protocol_key(row):
+            name = names.get(row[2], None)
+            if name is None:
+                name = names[row[2]] = nameTransportProtocol(*row[2])
+            return name
+        return protocol_key
+    elif column in (3, 5):
+        # length of address is the first byte of key, so IPv4 addresses are before IPv6 ones
+        if cache_domain_names is None:
+            return lambda row: bytes((len(row[column]),)) + row[column]
+
+        def address_key(row):
+            name = cache_domain_names.peek(row[column])
+            return (0, name.lower()) if name is not None else (1, bytes((len(row[column]),)) + row[column])
+        return address_key
+    elif column in (4, 6):
+        if service_names is None:
+            return itemgetter(column)
+
+        def port_key(row):
+            name = service_names.name(row[column], row[2][1])
+            return (0, name.lower()) if not name.isdigit() else (1, row[column])
+        return port_key
+    elif column == 7:
+        return lambda row: statusViewStr(row[7])
+    raise IndexError("column index out of range")
+
+
+def merged_order(key, stay: list, moved, reverse: bool = False)-> list:
+    """ return order of rows: rows moved are inserted in rows stay that are already ordered.
+        Place of every moved row is found by binary search, rows stay are copied by slices.
+        key - function row number -> sort key """
+    order = []
+    start = 0
+    for ind in sorted(moved, key=key, reverse=reverse):
+        value = key(ind)
+        low, high = start, len(stay)
+        # moved row is placed after rows stay with equal keys
+        while low < high:
+            middle = (low + high) // 2
+            if (value < key(stay[middle])) if not reverse else (key(stay[middle]) < value):
+                high = middle
+            else:
+                low = middle + 1
+        order.extend(stay[start:low])
+        order.append(ind)
+        start = low
+    order.extend(stay[start:])
+    return order
+
+
+class SortKeys:
+    """ Cache of sort keys of rows by one column, primary key of row -> key """
+    def __init__(self, key_function):
+        self.keyFunction = key_function
+        self.keys = {}
+
+    def update(self, rows)-> list:
+        """ compute keys of new or changed rows, return primary keys of rows whose keys have changed """
+        changed = []
+        keys = self.keys
+        key_function = self.keyFunction
+        for row in rows:
+            key = key_function(row)
+            if keys.get(row[8], None) != key:
+                keys[row[8]] = key
+                changed.append(row[8])
+        return changed
+
+    def fill(self, table: ConnectionTable):
+        """ compute keys of rows of table that have no keys """
+        keys = self.keys
+        for ind in range(len(table)):
+            if table.pk(ind) not in keys:
+                keys[table.pk(ind)] = self.keyFunction(table.row(ind))
+
+    def remove(self, pks):
+        for pk in pks:
+            self.keys.pop(pk, None)
+
+    def row_keys(self, table: ConnectionTable)-> list:
+        """ return list row number -> key """
+        return list(map(self.keys.__getitem__, table.pks()))
+
+    def row_key_function(self, table: ConnectionTable):
+        """ return function row number -> key """
+        keys = self.keys
+        return lambda ind: keys[table.pk(ind)]
+
+
+class BackgroundSort:
+    """ Full sort of copy of table in background thread. Result is primary keys
+        in sorted order (pks) and keys of all rows (keys).
+        * keys - already computed keys of rows, they are not computed again;
+        * on_finished - function(sort), it is called from thread of sort if sort is not cancelled """
+    def __init__(self, table: ConnectionTable, key_function, keys: dict = None, reverse: bool = False,
+                 on_finished = None):
+        self.table = table
+        self.keyFunction = key_function
+        self.keys = dict(keys) if keys is not None else {}
+        self.reverse = reverse
+        self.onFinished = on_finished
+        self.pks = None
+        self.__cancelled = threading.Event()
+        self.__thread = None
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.run, name="BackgroundSort", daemon=True)
+        self.__thread.start()
+
+    def cancel(self):
+        self.__cancelled.set()
+
+    def is_cancelled(self)-> bool:
+        return self.__cancelled.is_set()
+
+    def wait(self, timeout: float = None):
+        if self.__thread is not None:
+            self.__thread.join(timeout)
+
+    def run(self):
+        sort_keys = SortKeys(self.keyFunction)
+        sort_keys.keys = self.keys
+        sort_keys.fill(self.table)
+        if self.is_cancelled():
+            return
+        pks = [self.table.pk(ind) for ind in range(len(self.table))]
+        self.pks = sorted(pks, key=self.keys.__getitem__, reverse=self.reverse)
+        if not self.is_cancelled() and self.onFinished is not None:
+            self.onFinished(self)
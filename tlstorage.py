@@ -0,0 +1,186 @@
+import sys
+from array import array
+from operator import itemgetter
+
+
+class CodeTable:
+    """ Table of small integer codes for repeated values, such as
+        protocols and statuses of connections """
+    def __init__(self):
+        self.values = []                # code -> value
+        self.codes = {}                 # value -> code
+
+    def code(self, value)-> int:
+        """ Return code of value, new values get next code """
+        code = self.codes.get(value, None)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+    def value(self, code: int):
+        return self.values[code]
+
+
+class ConnectionTable:
+    """ Columnar storage of the connection table.
+        Every column is kept in a separate array: ports, pid and primary key
+        as numbers, protocol and status as small codes, process names and
+        addresses as shared (interned) objects. A row is made as list
+        [process, pid, (family, type), local address, local port,
+         remote address, remote port, status, primary key] only when requested. """
+    NO_PID = -1                         # value of pid column for connections without pid
+    COUNT_COLUMNS = 9
+
+    def __init__(self, rows = ()):
+        self.__protocols = CodeTable()          # (family, type) <-> code
+        self.__statuses = CodeTable()           # status <-> code
+        self.__addresses = {}                   # bytes address -> the same shared bytes object
+        self.__processes = []                   # interned process names
+        self.__pids = array('q')
+        self.__protocol_codes = array('B')
+        self.__local_addresses = []
+        self.__local_ports = array('H')
+        self.__remote_addresses = []
+        self.__remote_ports = array('H')
+        self.__status_codes = array('B')
+        self.__pks = array('Q')
+        self.extend(rows)
+
+    def __address(self, addr: bytes)-> bytes:
+        return self.__addresses.setdefault(addr, addr)
+
+    def __prune_addresses(self):
+        # forget addresses that are not used by rows
+        if len(self.__addresses) > 2 * (len(self.__local_addresses) + len(self.__remote_addresses)) + 1024:
+            self.__addresses = {addr: addr for addr in self.__local_addresses}
+            self.__addresses.update((addr, addr) for addr in self.__remote_addresses)
+
+    def extend(self, rows)-> None:
+        """ Appends rows to the end of table """
+        for row in rows:
+            self.__processes.append(sys.intern(row[0]) if row[0] is not None else None)
+            self.__pids.append(row[1] if row[1] is not None else self.NO_PID)
+            self.__protocol_codes.append(self.__protocols.code(row[2]))
+            self.__local_addresses.append(self.__address(row[3]))
+            self.__local_ports.append(row[4])
+            self.__remote_addresses.append(self.__address(row[5]))
+            self.__remote_ports.append(row[6])
+            self.__status_codes.append(self.__statuses.code(row[7]))
+            self.__pks.append(row[8])
+
+    def set_row(self, ind: int, row)-> None:
+        """ Replaces data of row with number ind """
+        self.__processes[ind] = sys.intern(row[0]) if row[0] is not None else None
+        self.__pids[ind] = row[1] if row[1] is not None else self.NO_PID
+        self.__protocol_codes[ind] = self.__protocols.code(row[2])
+        self.__local_addresses[ind] = self.__address(row[3])
+        self.__local_ports[ind] = row[4]
+        self.__remote_addresses[ind] = self.__address(row[5])
+        self.__remote_ports[ind] = row[6]
+        self.__status_codes[ind] = self.__statuses.code(row[7])
+        self.__pks[ind] = row[8]
+
+    def __columns(self)-> tuple:
+        return (self.__processes, self.__pids, self.__protocol_codes, self.__local_addresses, self.__local_ports,
+                self.__remote_addresses, self.__remote_ports, self.__status_codes, self.__pks)
+
+    def delete(self, first: int, last: int)-> None:
+        """ Removes rows from first to last inclusive """
+        for column in self.__columns():
+            del column[first:last + 1]
+        self.__prune_addresses()
+
+    def clear(self)-> None:
+        self.delete(0, len(self) - 1)
+
+    def copy(self):
+        """ Return independent copy of rows, it is made by copying of columns.
+            Code tables are shared, codes are only appended to them """
+        table = ConnectionTable.__new__(ConnectionTable)
+        table.__protocols = self.__protocols
+        table.__statuses = self.__statuses
+        table.__addresses = {}
+        table.__processes, table.__pids, table.__protocol_codes, table.__local_addresses, table.__local_ports, \
+            table.__remote_addresses, table.__remote_ports, table.__status_codes, table.__pks = \
+            (column[:] for column in self.__columns())
+        return table
+
+    def permute(self, order: list)-> None:
+        """ Reorders rows, order[i] - old number of row that becomes row i """
+        if len(order) < 2:
+            return
+        # itemgetter picks all values of column at once
+        getter = itemgetter(*order)
+        for column in self.__columns():
+            if isinstance(column, array):
+                column[:] = array(column.typecode, getter(column))
+            else:
+                column[:] = getter(column)
+
+    def value(self, ind: int, column: int):
+        """ Return value of cell in the same form as in row """
+        if column == 0:
+            return self.__processes[ind]
+        elif column == 1:
+            pid = self.__pids[ind]
+            return pid if pid != self.NO_PID else None
+        elif column == 2:
+            return self.__protocols.value(self.__protocol_codes[ind])
+        elif column == 3:
+            return self.__local_addresses[ind]
+        elif column == 4:
+            return self.__local_ports[ind]
+        elif column == 5:
+            return self.__remote_addresses[ind]
+        elif column == 6:
+            return self.__remote_ports[ind]
+        elif column == 7:
+            return self.__statuses.value(self.__status_codes[ind])
+        elif column == 8:
+            return self.__pks[ind]
+        raise IndexError("column index out of range")
+
+    def pk(self, ind: int)-> int:
+        return self.__pks[ind]
+
+    def pks(self, start: int = 0)-> array:
+        """ Return copy of primary key column from row start """
+        return self.__pks[start:]
+
+    def row(self, ind: int)-> list:
+        return [self.value(ind, column) for column in range(self.COUNT_COLUMNS)]
+
+    def sort_key(self, column: int):
+        """ Return function row number -> value of column for sorting rows """
+        if column == 2:
+            return lambda ind: self.__protocols.value(self.__protocol_codes[ind])
+        elif column == 7:
+            return lambda ind: self.__statuses.value(self.__status_codes[ind])
+        elif column == 1:
+            return self.__pids.__getitem__
+        return self.__columns()[column].__getitem__
+
+    def column_values(self, column: int):
+        """ Return iterator over values of column """
+        return (self.value(ind, column) for ind in range(len(self)))
+
+    def __len__(self):
+        return len(self.__pks)
+
+    def __getitem__(self, ind: int)-> list:
+        if ind < 0:
+            ind += len(self)
+        if not 0 <= ind < len(self):
+            raise IndexError("row index out of range")
+        return self.row(ind)
+
+    def __iter__(self):
+        return (self.row(ind) for ind in range(len(self)))
+
+    def __str__(self):
+        return str(list(self))
+
+    def __repr__(self):
+        return self.__str__()
@@ -1,147 +1,563 @@
+import sys
 import psutil
 import socket
-from PySide2.QtCore import QAbstractTableModel, Qt, QModelIndex, Slot
+import threading
+from PySide2.QtCore import QAbstractTableModel, Qt, QModelIndex, QThread, Signal, Slot
 from PySide2.QtGui import QColor
-from operator import itemgetter
-from work_with_list import lists_are_diff, tables_difference, updated_rows, get_of, new_primary_key
-from work_with_netdata import (nameTransportProtocol, ipToDomainName, portToServiceName,
-                               isZeroIPAddress, psutilAddrToIPAndPort, CacheDomainNames)
+from work_with_list import index_ranges, get_of
+from work_with_netdata import (nameTransportProtocol, ipToDomainName, ServiceNames,
+                               CacheDomainNames, CacheProcesses, DomainNamesStorage,
+                               addressViewStr, portViewStr, statusViewStr, pidViewStr)
+from tlsnapshot import TableAggregates
+from tlcollector import TLCollector
+from tlcore import TLCore, TABLE_HEADERS
+from tlexport import TableExport
+from tlhistory import HistoryRecorder, HistoryReader, HistoryReplay, delta_between
+from tlintervals import IntervalStore
+from tlstorage import ConnectionTable
+from tlsort import (SortKeys, BackgroundSort, sort_key_function, merged_order,
+                    BACKGROUND_SORT_ROWS, MERGE_SHARE)
+from tlbackends import PsutilBackend, psutilConnectionToList, CollectionFilter
+from tlprofiler import TickProfile
+from tlfilter import RowFilter
 
 
 # class TLTableModel is model table for work with host's network connections on transport layer
 class TLTableModel(QAbstractTableModel):
-    MAX_PK = 2**64
-    UNIQUE_KEY = tuple(i for i in range(2, 7))         # column numbers that uniquely identify a row in a table
+    collectRequested = Signal()                        # request next snapshot from collector
+    loadCacheRequested = Signal()                      # request loading domain names cache from file
+    domainNamesResolved = Signal()                     # domain names cache received new answers
+    aggregatesChanged = Signal()                       # counts of connections are recalculated
+    deltaApplied = Signal(object)                      # changes of snapshot are applied to table, argument is TableDelta
+    profileReady = Signal(object)                      # stages of update are measured, argument is TickProfile
+    sortFinished = Signal(object)                      # background sort is finished, argument is BackgroundSort
+    displayChanged = Signal()                          # display strings of rows are changed by modes or domain names
+    MAX_PK = TLCore.MAX_PK
+    UNIQUE_KEY = TLCore.UNIQUE_KEY                     # column numbers that uniquely identify a row in a table
     # All main headers in TLTableModel
-    TABLE_HEADERS = ("Process", "PID", "Protocol", "Local Address", "Local Port",
-                     "Remote Address", "Remote Port", "Status")
+    TABLE_HEADERS = TABLE_HEADERS
+    # background colors of created, updated, deleted and other rows
+    COLOR_NEW = QColor(Qt.green)
+    COLOR_CHANGED = QColor(Qt.yellow)
+    COLOR_DELETED = QColor(Qt.red)
+    COLOR_DEFAULT = QColor(Qt.white)
     SIGN_ASC = '⯅'
     SIGN_DESC = '⯆'
     DEFAULT_FILENAME = "net_connections"
     DEFAULT_EXTANSIONS = ('csv', 'txt')
 
-    def __init__(self):
+    def __init__(self, dns_cache_filename: str = None, backend = None):
+        """ * dns_cache_filename - file for keeping domain names cache between launches,
+              if None then cache is kept only in memory;
+            * backend - source of system data (see tlbackends), if None then the best for system is used """
         super().__init__()
         self.setFilename(self.DEFAULT_FILENAME + '.' + self.DEFAULT_EXTANSIONS[0])
-        self.__pk = -1                                  # value for generate primary key for table rows
-        self.net_connections = []                       # main model table
+        self.net_connections = ConnectionTable()        # main model table
         self.domainNameMode = True                      # return numeric address or domain name?
-        self.cacheDomainNames = CacheDomainNames()      # for solved ip adresses to domain names for display in table
+        # for solved ip adresses to domain names for display in table
+        self.cacheDomainNames = CacheDomainNames(on_resolved=self.__notifyDomainNameResolved)
+        self.__resolvedNotified = False                 # view is already notified about new domain names
+        self.__resolvedAddresses = set()                # addresses resolved since the last notification
+        self.__resolvedLock = threading.Lock()
+        self.domainNamesResolved.connect(self.emitAddressesChanged)
         self.serviceNameMode = True                     # return numeric port or service name?
+        self.serviceNames = ServiceNames()              # table of service names by port
+        self.displayRows = {}                           # primary key -> tuple of display strings of row
         self.sortColumn = 0                             # sorted column number
         self.sortASC = True                             # ascending sort?
-        # tuples primary keys deleted, created and updated rows
-        self.del_pks = self.new_pks = self.chg_pks = tuple()
-        # create function for count the number of rows status == "ESTABLISHED"
-        self.countEstablished = self.__generateCountValueInTable(7, "ESTABLISHED")
-        self.countListen = self.__generateCountValueInTable(7, "LISTEN")
-        self.countCloseWait = self.__generateCountValueInTable(7, "CLOSE_WAIT")
-        self.countTimeWait = self.__generateCountValueInTable(7, "TIME_WAIT")
+        self.sortByDisplay = False                      # sort by domain names and service names if they are shown?
+        self.sortKeys = SortKeys(self.sortKeyFunction())    # cached sort keys of rows by sorted column
+        self.sortKeysComplete = True                    # have all rows keys in self.sortKeys?
+        self.sortOrderValid = True                      # are rows ordered by keys, except rows of self.sortMoved?
+        self.sortMoved = set()                          # primary keys of rows whose keys have changed since sort
+        self.backgroundSort = None                      # BackgroundSort of large table, None - sort is not running
+        self.sortFinished.connect(self.finishBackgroundSort)
+        # sets primary keys deleted, created and updated rows
+        self.del_pks = self.new_pks = self.chg_pks = frozenset()
+        self.rowColors = {}                             # primary key -> background color of highlighted row
+        self.rowsByPK = {}                              # primary key -> row number in self.net_connections
+        self.aggregates = TableAggregates()             # counts of connections of the last snapshot
+        # pipeline of data without Qt, it is run in background thread
+        self.core = TLCore(backend, self.cacheDomainNames,
+                           DomainNamesStorage(dns_cache_filename) if dns_cache_filename else None,
+                           load_function=lambda profile = None: TLTableModel.loadDataNetConnections(
+                               self.pk, self.cacheProcesses, self.backend, profile))
+        self.backend = self.core.backend                # source of system data about connections
+        self.cacheProcesses = self.core.cacheProcesses  # process names of connections owners
+        # collect and compare snapshots in background thread
+        self.collecting = False                         # is collector busy?
+        self.collector = TLCollector(self.core)
+        # profiles are made only when profiling is on
+        self.profiling = False
+        self.paintProfile = None                        # counters of display since the last update
+        self.__dnsStats = (0, 0)                        # hits and misses of domain names cache at the last update
+        # history of deltas
+        self.replay = None                              # HistoryReplay while table shows history
+        self.replayRows = {}                            # primary key -> row of shown state of history
+        # after table is cleared deltas of the previous rows are skipped until keyframe of pipeline
+        self.awaitingKeyframe = False
+        self.collectorThread = QThread()
+        self.collector.moveToThread(self.collectorThread)
+        self.loadCacheRequested.connect(self.collector.loadCache)
+        self.collectRequested.connect(self.collector.collect)
+        self.collector.snapshotReady.connect(self.applyDelta)
+        self.collectorThread.start()
+        # domain names of the file are loaded before the first snapshot
+        self.loadCacheRequested.emit()
         # load system data in self.net_connections
         self.updateData()
 
+    def __notifyDomainNameResolved(self, ip_addr: bytes):
+        # called from resolving threads, notifications are coalesced until view is updated
+        with self.__resolvedLock:
+            self.__resolvedAddresses.add(ip_addr)
+            if self.__resolvedNotified:
+                return
+            self.__resolvedNotified = True
+        self.domainNamesResolved.emit()
+
+    @Slot()
+    def emitAddressesChanged(self):
+        """ Notifies the view that displayed addresses are changed """
+        with self.__resolvedLock:
+            addresses, self.__resolvedAddresses = self.__resolvedAddresses, set()
+            self.__resolvedNotified = False
+        if self.domainNameMode and addresses:
+            inds = self.rowsWithAddresses(addresses)
+            if not inds:
+                return
+            # display strings of other rows stay in cache
+            for ind in inds:
+                self.displayRows.pop(self.net_connections.pk(ind), None)
+            for first, last in index_ranges(inds):
+                self.dataChanged.emit(self.index(first, 3), self.index(last, 5))
+            self.displayChanged.emit()
+            if self.sortByDisplay and self.sortColumn in (3, 5):
+                # rows are sorted by new names at the next update
+                self.updateSortKeys(inds)
+
+    def rowsWithAddresses(self, addresses: set)-> list:
+        """ return numbers of rows whose local or remote address is in addresses """
+        local_address = self.net_connections.sort_key(3)
+        remote_address = self.net_connections.sort_key(5)
+        return [ind for ind in range(self.rowCount()) if local_address(ind) in addresses or
+                remote_address(ind) in addresses]
+
+    def updateSortKeys(self, inds: list):
+        """ compute again sort keys of rows with numbers inds, rows whose keys
+            have changed are merged into the order, other keys are kept """
+        rows = [self.net_connections.row(ind) for ind in inds]
+        # background sort merges these rows when it is finished
+        self.sortMoved.update(self.sortKeys.update(rows))
+
     def pk(self)-> int:
-        self.__pk = new_primary_key(self.__pk, self.MAX_PK)
-        return self.__pk
-
-    def __generateCountValueInTable(self, column, value):
-        """ This method creates a function-method for TLTableModel that counts the number of rows
-            that have a specific value in a particular column """
-        def countValueInTable():
-            count = 0
-            for row in self.net_connections:
-                if row[column] == value:
-                    count += 1
-            return count
-        return countValueInTable
+        return self.core.pk()
+
+    def countEstablished(self)-> int:
+        return self.aggregates.count_status("ESTABLISHED")
+
+    def countListen(self)-> int:
+        return self.aggregates.count_status("LISTEN")
+
+    def countCloseWait(self)-> int:
+        return self.aggregates.count_status("CLOSE_WAIT")
+
+    def countTimeWait(self)-> int:
+        return self.aggregates.count_status("TIME_WAIT")
 
     @staticmethod
-    def psutilConnectionToList(connection: psutil._common.sconn, pk_function = lambda:0) -> list:
+    def psutilConnectionToList(connection: psutil._common.sconn, pk_function = lambda:0,
+                               cache_processes: CacheProcesses = None) -> list:
         """ transfer psutil._common.sconn to list.
-            pk_function - function for generate primary key values for table rows"""
-        try:
-            process = psutil.Process(connection.pid)
-            return [process.name(), connection.pid, (connection.family, connection.type),
-                    *psutilAddrToIPAndPort(connection.laddr, connection.family),
-                    *psutilAddrToIPAndPort(connection.raddr, connection.family), connection.status,
-                    pk_function()]
-        except psutil.NoSuchProcess:
-            return []
+            pk_function - function for generate primary key values for table rows;
+            cache_processes - filled cache of process names, if None then process name is requested from system"""
+        return psutilConnectionToList(connection, pk_function, cache_processes)
 
     @staticmethod
-    def loadDataNetConnections(pk_function = lambda:0)-> list:
+    def loadDataNetConnections(pk_function = lambda:0, cache_processes: CacheProcesses = None,
+                               backend = None, profile: TickProfile = None)-> list:
         """ load system data about all network connections on taransport layer and
             create data table.
-            pk_function - function for generate primary key values for table rows"""
-        net_connections = []
-        for connection in psutil.net_connections():
-            row = TLTableModel.psutilConnectionToList(connection, pk_function)
-            if len(row) > 0:
-                net_connections.append(row)
-        return net_connections
+            pk_function - function for generate primary key values for table rows;
+            cache_processes - cache of process names, it is refreshed once for all connections;
+            backend - source of system data (see tlbackends), if None then psutil is used;
+            profile - durations of stages are added in it, if not None"""
+        if backend is None:
+            backend = PsutilBackend()
+        return backend.load(pk_function, cache_processes, profile)
+
+    def setCollectionFilter(self, collection_filter: CollectionFilter):
+        """ set conditions for collected connections, they are
+            applied by backend since the next snapshot """
+        self.backend.filter = collection_filter
+
+    def collectionFilter(self)-> CollectionFilter:
+        return self.backend.filter
+
+    def setRowFilter(self, row_filter: RowFilter = None):
+        """ show only rows accepted by row_filter, None - all rows. Other rows are not
+            rendered, resolved and exported, they are still written in history """
+        self.core.set_row_filter(row_filter)
+        if self.replay is not None:
+            self.replayTo(self.replay.time())
+        else:
+            self.updateData()
+
+    def rowFilter(self)-> RowFilter:
+        return self.core.rowFilter
+
+    def setProfiling(self, flag: bool):
+        """ measure stages of updates? Profiles are sent by signal profileReady """
+        self.profiling = flag
+        self.collector.profiling = flag
+        self.paintProfile = TickProfile() if flag else None
+        self.__dnsStats = (self.cacheDomainNames.hits, self.cacheDomainNames.misses)
+
+    def rowByPK(self, pk: int)-> int:
+        """ return row number by primary key, -1 if row is not found """
+        return self.rowsByPK.get(pk, -1)
+
+    def reindexRows(self, start: int = 0):
+        """ Updates row numbers in primary key index beginning from row start """
+        self.rowsByPK.update(zip(self.net_connections.pks(start), range(start, len(self.net_connections))))
 
     def removeRowByPK(self, pk: int):
         """ Function for remove row from
             table by primary key"""
-        ind = -1
-        for i in range(self.rowCount()):
-            if self.primary_key(i) == pk:
-                ind = i
-                break
-        if ind >= 0:
-            self.net_connections.pop(ind)
+        self.removeRowsByPK(pk)
+
+    def removeRowsByPK(self, *pks):
+        """ Function for remove rows from table by primary keys.
+            Notifies the view once per range of adjacent rows """
+        inds = [self.rowsByPK[pk] for pk in pks if pk in self.rowsByPK]
+        if len(inds) == 0:
+            return
+        ranges = index_ranges(inds)
+        for pk in pks:
+            self.rowsByPK.pop(pk, None)
+            self.displayRows.pop(pk, None)
+        # remove from the end so that the remaining indexes stay valid
+        for first, last in reversed(ranges):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            self.net_connections.delete(first, last)
+            self.endRemoveRows()
+        self.sortKeys.remove(pks)
+        self.sortMoved.difference_update(pks)
+        self.reindexRows(ranges[0][0])
+
+    def emitRowsChanged(self, *pks):
+        """ Notifies the view about changed data
+            in rows with specified primary keys """
+        inds = [self.rowsByPK[pk] for pk in pks if pk in self.rowsByPK]
+        for first, last in index_ranges(inds):
+            self.dataChanged.emit(self.index(first, 0), self.index(last, self.columnCount() - 1))
 
     @Slot()
     def updateData(self):
-        # notify the view of the begin of a radical change in data
-        self.beginResetModel()
-        # load system data about all network connections
-        net_connections = TLTableModel.loadDataNetConnections(self.pk)
+        """ request the next snapshot from collector. Request is
+            skipped if collector has not finished the previous one """
+        if self.collecting:
+            return
+        self.collecting = True
+        self.collectRequested.emit()
+
+    @Slot(object)
+    def applyDelta(self, delta):
+        """ apply changes found by collector to model table,
+            they are ignored while table shows history """
+        self.collecting = False
+        if self.replay is not None:
+            return
+        if self.awaitingKeyframe:
+            if not delta.keyframe:
+                # delta was collected before the table was cleared, keyframe is requested again
+                self.updateData()
+                return
+            self.awaitingKeyframe = False
+        self.showDelta(delta)
+
+    def showDelta(self, delta):
+        """ apply changes to model table, highlight changed rows and sort table """
+        profile = delta.profile if self.profiling else None
+        if profile is not None:
+            profile.start('apply')
         # remove rows which were added from those deleted in the previous step
-        for pk in self.del_pks:
-            self.removeRowByPK(pk)
-        del_rows = tables_difference(self.net_connections, net_connections, *TLTableModel.UNIQUE_KEY)
-        new_rows = tables_difference(net_connections, self.net_connections, *TLTableModel.UNIQUE_KEY)
-        chg_rows = updated_rows(self.net_connections, net_connections, TLTableModel.UNIQUE_KEY, (7,))
-        self.del_pks = tuple(row[8] for row in del_rows)
-        self.new_pks = tuple(row[8] for row in new_rows)
-        self.chg_pks = tuple(row[8] for row in chg_rows)
-        # append del_rows for display in tableview deleted rows
-        self.net_connections = net_connections + del_rows
-        # append in cache domain names created connections
-        self.cacheDomainNames.append(
-            *[(row[3], row[2][0]) for row in self.net_connections if row[3] not in self.cacheDomainNames],
-            *[(row[5], row[2][0]) for row in self.net_connections if row[5] not in self.cacheDomainNames])
-        self.sortData()
-        # notify the view of the end of a radical change in data
+        self.removeRowsByPK(*self.del_pks)
+        # rows highlighted in the previous step must be repainted
+        old_pks = self.new_pks | self.chg_pks
+        upd_rows = delta.upd_rows
+        if any(row[8] not in self.rowsByPK for row in upd_rows):
+            # delta doesn't follow the shown table, its producer is wrong, but the table stays consistent
+            upd_rows = [row for row in upd_rows if row[8] in self.rowsByPK]
+            print(f"TLView: {len(delta.upd_rows) - len(upd_rows)} updated rows are not in the table, they are skipped",
+                  file=sys.stderr)
+        # refresh data of the remaining rows in place
+        for new_row in upd_rows:
+            self.net_connections.set_row(self.rowsByPK[new_row[8]], new_row)
+            self.displayRows.pop(new_row[8], None)
+        self.del_pks = frozenset(delta.del_pks)
+        self.new_pks = frozenset(row[8] for row in delta.new_rows)
+        self.chg_pks = frozenset(delta.chg_pks)
+        self.rowColors = dict.fromkeys(self.new_pks, self.COLOR_NEW)
+        self.rowColors.update(dict.fromkeys(self.chg_pks - self.new_pks, self.COLOR_CHANGED))
+        self.rowColors.update(dict.fromkeys(self.del_pks - self.new_pks - self.chg_pks, self.COLOR_DELETED))
+        self.emitRowsChanged(*old_pks, *(row[8] for row in upd_rows), *self.del_pks)
+        # only rows whose sort keys have changed are moved by sort
+        self.sortMoved.update(self.sortKeys.update(upd_rows))
+        self.sortMoved.update(self.sortKeys.update(delta.new_rows))
+        # append new rows, deleted rows stay in table for display in tableview
+        if len(delta.new_rows) > 0:
+            self.beginInsertRows(QModelIndex(), self.rowCount(), self.rowCount() + len(delta.new_rows) - 1)
+            start = self.rowCount()
+            self.net_connections.extend(delta.new_rows)
+            self.reindexRows(start)
+            self.endInsertRows()
+        if profile is not None:
+            profile.stop('apply')
+            profile.start('sort')
+        self.updateSort()
+        if profile is not None:
+            profile.stop('sort')
+        if delta.aggregates is not None:
+            self.aggregates = delta.aggregates
+            self.aggregatesChanged.emit()
+        self.deltaApplied.emit(delta)
+        if profile is not None:
+            self.emitProfile(profile)
+
+    def emitProfile(self, profile: TickProfile):
+        """ add counters of display and domain names cache since the previous update to profile and send it """
+        if self.paintProfile is not None:
+            profile.merge(self.paintProfile)
+        self.paintProfile = TickProfile()
+        dns_stats = (self.cacheDomainNames.hits, self.cacheDomainNames.misses)
+        profile.set('dns_hits', dns_stats[0] - self.__dnsStats[0])
+        profile.set('dns_misses', dns_stats[1] - self.__dnsStats[1])
+        self.__dnsStats = dns_stats
+        profile.set('rows', self.rowCount())
+        self.profileReady.emit(profile)
+
+    def setRecording(self, filename: str = None):
+        """ write deltas of snapshots in history file, if filename is None then recording is stopped """
+        recorder, self.core.recorder = self.core.recorder, None
+        if recorder is not None:
+            recorder.close()
+        if filename is not None:
+            self.core.recorder = HistoryRecorder(filename)
+
+    def isRecording(self)-> bool:
+        return self.core.recorder is not None
+
+    def setIntervalStore(self, filename: str = None):
+        """ write lifetimes of connections in database, if filename is None then writing is stopped """
+        interval_store, self.core.intervalStore = self.core.intervalStore, None
+        if interval_store is not None:
+            interval_store.close()
+        if filename is not None:
+            self.core.intervalStore = IntervalStore(filename)
+
+    def isStoringIntervals(self)-> bool:
+        return self.core.intervalStore is not None
+
+    def startReplay(self, reader: HistoryReader):
+        """ show history instead of live connections, time is chosen by replayTo().
+            Primary keys of history are of other session, so the table is cleared
+            and the first replayTo() fills it as keyframe """
+        self.replay = HistoryReplay(reader)
+        self.replayRows = {}
+        self.clearTable()
+
+    def replayTo(self, t: float)-> float:
+        """ show table at time t of history, return time of shown record """
+        all_rows = rows = self.replay.seek(t)
+        row_filter = self.core.rowFilter
+        if row_filter is not None:
+            rows = {pk: row for pk, row in rows.items() if row_filter.accepts(row)}
+        delta = delta_between(self.replayRows, rows)
+        # counts of connections are made by all rows, as in live mode
+        delta.aggregates = TableAggregates(list(all_rows.values()))
+        self.replayRows = dict(rows)
+        self.showDelta(delta)
+        return self.replay.time()
+
+    def stopReplay(self):
+        """ show live connections again, table is filled by the next snapshot """
+        if self.replay is None:
+            return
+        self.replay = None
+        self.replayRows = {}
+        self.core.request_resync()
+        self.clearTable()
+        self.updateData()
+
+    def clearTable(self):
+        """ remove all rows, the table is filled again by the next keyframe of pipeline (TLCore.request_resync()) """
+        self.beginResetModel()
+        self.net_connections.clear()
+        self.rowsByPK.clear()
+        self.displayRows.clear()
+        self.del_pks = self.new_pks = self.chg_pks = frozenset()
+        self.rowColors = {}
+        self.invalidateSort(True)
         self.endResetModel()
+        self.awaitingKeyframe = True
+
+    def setAgentSource(self, source = None):
+        """ show connection table of agent (tlagent.AgentSource) instead of local
+            connections, if source is None then local connections are shown again """
+        self.core.set_source(source)
+        if self.replay is None:
+            self.clearTable()
+            self.updateData()
+
+    def agentSource(self):
+        return self.core.source
+
+    def isReplaying(self)-> bool:
+        return self.replay is not None
+
+    def stopCollector(self):
+        """ stop background threads of collector, domain names resolver and sort """
+        self.cancelBackgroundSort()
+        self.collectorThread.quit()
+        self.collectorThread.wait()
+        self.core.stop()
 
     def unique_key(self, row: int)-> tuple:
         # a tuple of values that uniquely identifies a row in a table
         if not self.isRowValid(row):
             row = 0
-        return get_of(self.net_connections[row], *TLTableModel.UNIQUE_KEY)
+        return get_of(self.net_connections.row(row), *TLTableModel.UNIQUE_KEY)
 
     def primary_key(self, row: int)-> int:
         # value that uniquely identifies a row in a table
         if not self.isRowValid(row):
             row = 0
-        return self.net_connections[row][8]
+        return self.net_connections.pk(row)
 
     @Slot(bool)
     def setDomainNameMode(self, flag: bool):
         """ numeric address or domain name? """
         self.domainNameMode = flag
+        if self.sortByDisplay:
+            self.invalidateSort(True)
+        self.emitAllRowsChanged()
 
     @Slot(bool)
     def setServiceNameMode(self, flag: bool):
         """ numeric port or service name? """
         self.serviceNameMode = flag
+        if self.sortByDisplay:
+            self.invalidateSort(True)
+        self.emitAllRowsChanged()
+
+    def emitAllRowsChanged(self):
+        """ Notifies the view that display data of all rows are changed """
+        self.displayRows.clear()
+        if self.rowCount() > 0:
+            self.dataChanged.emit(self.index(0, 0), self.index(self.rowCount() - 1, self.columnCount() - 1))
+        self.displayChanged.emit()
+
+    @Slot(bool)
+    def setSortByDisplay(self, flag: bool):
+        """ sort addresses and ports by domain names and service names if they are shown? """
+        self.sortByDisplay = flag
+        self.invalidateSort(True)
+        self.updateSort()
+
+    def sortKeyFunction(self):
+        """ return function row -> sort key by sorted column in current display modes """
+        return sort_key_function(self.sortColumn,
+                                 self.cacheDomainNames if self.sortByDisplay and self.domainNameMode else None,
+                                 self.serviceNames if self.sortByDisplay and self.serviceNameMode else None)
+
+    def invalidateSort(self, keys: bool = False):
+        """ rows must be sorted again, keys - sort keys must be computed again """
+        if keys:
+            self.sortKeys = SortKeys(self.sortKeyFunction())
+            self.sortKeysComplete = self.rowCount() == 0
+        self.sortOrderValid = False
+        self.cancelBackgroundSort()
+
+    def cancelBackgroundSort(self):
+        if self.backgroundSort is not None:
+            self.backgroundSort.cancel()
+            self.backgroundSort = None
+
+    def updateSort(self):
+        """ sort rows after changes of table. Rows with changed keys are merged into
+            the existing order, full sort of large table is made in background thread """
+        if self.backgroundSort is not None:
+            return                      # changes are merged when background sort is finished
+        if not self.sortOrderValid or not self.sortKeysComplete:
+            if self.rowCount() >= BACKGROUND_SORT_ROWS:
+                self.startBackgroundSort()
+            else:
+                self.sortData()
+        elif len(self.sortMoved) > MERGE_SHARE * self.rowCount():
+            self.sortData()
+        elif self.sortMoved:
+            moved = {self.rowsByPK[pk] for pk in self.sortMoved}
+            stay = [ind for ind in range(self.rowCount()) if ind not in moved]
+            self.permuteRows(merged_order(self.sortKeys.row_key_function(self.net_connections), stay, moved,
+                                          not self.sortASC))
+            self.sortMoved.clear()
+
+    def startBackgroundSort(self):
+        """ sort copy of table in background thread, changes of table during
+            sort are merged into its result by finishBackgroundSort() """
+        self.cancelBackgroundSort()
+        keys = self.sortKeys.keys if self.sortKeysComplete else None
+        self.backgroundSort = BackgroundSort(self.net_connections.copy(), self.sortKeys.keyFunction, keys,
+                                             not self.sortASC, self.sortFinished.emit)
+        self.sortMoved.clear()
+        self.backgroundSort.start()
+
+    @Slot(object)
+    def finishBackgroundSort(self, sort: BackgroundSort):
+        """ apply result of background sort, rows changed during sort are merged into it """
+        if sort is not self.backgroundSort:
+            return                      # sort is cancelled
+        self.backgroundSort = None
+        # keys computed for rows changed during sort are newer than keys of sort
+        sort.keys.update((pk, self.sortKeys.keys[pk]) for pk in self.sortMoved)
+        self.sortKeys.keys = {pk: sort.keys[pk] for pk in self.rowsByPK if pk in sort.keys}
+        self.sortKeysComplete = True
+        self.sortKeys.fill(self.net_connections)
+        moved = {self.rowsByPK[pk] for pk in self.sortMoved}
+        moved.update(self.rowsByPK[pk] for pk in self.rowsByPK if pk not in sort.keys)
+        stay = [self.rowsByPK[pk] for pk in sort.pks if pk in self.rowsByPK]
+        stay = [ind for ind in stay if ind not in moved]
+        self.permuteRows(merged_order(self.sortKeys.row_key_function(self.net_connections), stay, moved,
+                                      not self.sortASC))
+        self.sortMoved.clear()
+        self.sortOrderValid = True
 
     @Slot()
     def sortData(self):
-        """ sorts model data """
-        self.net_connections = sorted(self.net_connections, key=itemgetter(self.sortColumn), reverse=not self.sortASC)
+        """ sorts all rows by cached keys in current thread """
+        self.cancelBackgroundSort()
+        if not self.sortKeysComplete:
+            self.sortKeys.fill(self.net_connections)
+            self.sortKeysComplete = True
+        keys = self.sortKeys.row_keys(self.net_connections)
+        self.permuteRows(sorted(range(self.rowCount()), key=keys.__getitem__, reverse=not self.sortASC))
+        self.sortMoved.clear()
+        self.sortOrderValid = True
+
+    def permuteRows(self, order: list):
+        """ reorders rows, order[i] - old number of row that becomes row i. Persistent
+            indexes (selection, current index) are moved together with their rows """
+        if all(i == j for i, j in enumerate(order)):
+            return                      # order has not changed
+        self.layoutAboutToBeChanged.emit()
+        old_indexes = self.persistentIndexList()
+        pks = [self.primary_key(index.row()) for index in old_indexes]
+        self.net_connections.permute(order)
+        self.reindexRows()
+        new_indexes = [self.index(self.rowsByPK[pk], index.column()) for pk, index in zip(pks, old_indexes)]
+        self.changePersistentIndexList(old_indexes, new_indexes)
+        self.layoutChanged.emit()
 
     @Slot()
     def sortDataByColumn(self, column: int):
@@ -150,10 +566,14 @@ class TLTableModel(QAbstractTableModel):
             return
         if column == self.sortColumn:
             self.sortASC = not self.sortASC
+            self.invalidateSort()
         else:
             self.sortASC = True
             self.sortColumn = column
-        # self.sortData()               # If you need instant results. Сreates additional load
+            self.invalidateSort(True)
+        self.headerDataChanged.emit(Qt.Horizontal, 0, self.columnCount() - 1)
+        # keys are cached and large tables are sorted in background, so result is shown at once
+        self.updateSort()
 
     def setSortColumn(self, column: int):
         """ set sorted column number"""
@@ -161,18 +581,19 @@ class TLTableModel(QAbstractTableModel):
             self.sortColumn = column
         else:
             self.sortColumn = 0
+        self.invalidateSort(True)
 
     def setAscendingSort(self, flag: bool):
         """set ascending sort? """
-        self.sortASC = flag
+        if flag != self.sortASC:
+            self.sortASC = flag
+            self.invalidateSort()
 
     def rowCount(self, parent = QModelIndex()):
         return len(self.net_connections)
 
     def columnCount(self, parent = QModelIndex()):
-        if self.rowCount() == 0:
-            return 0
-        return len(self.net_connections[0]) - 1
+        return len(self.TABLE_HEADERS)
 
     def headerData(self, section, orientation, role):
         """ return every column header """
@@ -192,35 +613,38 @@ class TLTableModel(QAbstractTableModel):
         """ need for get data of model """
         column = index.column()
         row = index.row()
+        if self.paintProfile is not None:
+            self.paintProfile.count('data_calls')
         if role == Qt.DisplayRole:
-            if column == 0:
-                return self.processViewStr(row)
-            elif column == 1:
-                return self.pidViewStr(row)
-            elif column == 2:
-                return self.protocolViewStr(row)
-            elif column == 3:
-                return self.localAddressViewStr(row)
-            elif column == 4:
-                return self.localPortViewStr(row)
-            elif column == 5:
-                return self.remoteAddressViewStr(row)
-            elif column == 6:
-                return self.remotePortViewStr(row)
-            elif column == 7:
-                return self.statusViewStr(row)
+            return self.displayRow(row)[column]
         elif role == Qt.BackgroundRole:
-            if self.primary_key(row) in self.new_pks:
-                return QColor(Qt.green)
-            elif self.primary_key(row) in self.chg_pks:
-                return QColor(Qt.yellow)
-            elif self.primary_key(row) in self.del_pks:
-                return QColor(Qt.red)
-            return QColor(Qt.white)
+            return self.rowColors.get(self.net_connections.pk(row), self.COLOR_DEFAULT)
         elif role == Qt.TextAlignmentRole:
             return Qt.AlignRight
         return None
 
+    def displayRow(self, row: int)-> tuple:
+        """ return display strings of all columns of row.
+            Strings are made once after the row has appeared or changed,
+            or after display modes or domain names have changed """
+        pk = self.net_connections.pk(row)
+        strings = self.displayRows.get(pk, None)
+        if strings is None:
+            if self.paintProfile is not None:
+                self.paintProfile.start('display')
+            if self.domainNameMode:
+                # addresses displayed on screen are resolved first
+                family = self.protocol(row)[0]
+                self.cacheDomainNames.prioritize((self.localAddress(row), family), (self.remoteAddress(row), family))
+            strings = (self.processViewStr(row), self.pidViewStr(row), self.protocolViewStr(row),
+                       self.localAddressViewStr(row), self.localPortViewStr(row),
+                       self.remoteAddressViewStr(row), self.remotePortViewStr(row), self.statusViewStr(row))
+            self.displayRows[pk] = strings
+            if self.paintProfile is not None:
+                self.paintProfile.stop('display')
+                self.paintProfile.count('display_rows_built')
+        return strings
+
     def isRowValid(self, row: int)-> bool:
         return row >= 0 and row < self.rowCount()
 
@@ -230,7 +654,7 @@ class TLTableModel(QAbstractTableModel):
     def realData(self, row: int, column: int):
         """ get real data of model """
         if self.isRowValid(row) and self.isColumnValid(column):
-            return self.net_connections[row][column]
+            return self.net_connections.value(row, column)
         else:
             return None
 
@@ -256,7 +680,7 @@ class TLTableModel(QAbstractTableModel):
         return self.realData(row, 4)
 
     def localServiceName(self, row: int) -> str:
-        return portToServiceName(self.realData(row, 4), self.realData(row, 2)[1])
+        return self.serviceNames.name(self.realData(row, 4), self.realData(row, 2)[1])
 
     def remoteAddress(self, row: int) -> bytes:
         return self.realData(row, 5)
@@ -268,7 +692,7 @@ class TLTableModel(QAbstractTableModel):
         return self.realData(row, 6)
 
     def remoteServiceName(self, row: int) -> str:
-        return portToServiceName(self.realData(row, 6), self.realData(row, 2)[1])
+        return self.serviceNames.name(self.realData(row, 6), self.realData(row, 2)[1])
 
     def status(self, row: int)-> str:
         return self.realData(row, 7)
@@ -277,38 +701,28 @@ class TLTableModel(QAbstractTableModel):
         return self.process(row)
 
     def pidViewStr(self, row: int)-> str:
-        return str(self.pid(row))
+        return pidViewStr(self.pid(row))
 
     def protocolViewStr(self, row: int)-> str:
         return nameTransportProtocol(*self.protocol(row))
 
     def localAddressViewStr(self, row: int)-> str:
-        local_addr = self.localAddress(row)
-        addr = socket.inet_ntop(self.protocol(row)[0], local_addr)
-        return self.cacheDomainNames.domain_name(local_addr, addr) if self.domainNameMode else addr
+        return addressViewStr(self.localAddress(row), self.protocol(row),
+                              self.cacheDomainNames if self.domainNameMode else None)
 
     def localPortViewStr(self, row: int)-> str:
-        port = self.localPort(row)
-        return portToServiceName(port, self.protocol(row)[1]) if self.serviceNameMode else str(port)
+        return portViewStr(self.localPort(row), self.protocol(row), self.serviceNames if self.serviceNameMode else None)
 
     def remoteAddressViewStr(self, row: int) -> str:
-        remote_addr = self.remoteAddress(row)
-        protocol = self.protocol(row)
-        if isZeroIPAddress(remote_addr, protocol[0]) and protocol[1] == socket.SOCK_DGRAM:
-            return '*'
-        addr = socket.inet_ntop(protocol[0], remote_addr)
-        return self.cacheDomainNames.domain_name(remote_addr, addr) if self.domainNameMode else addr
+        return addressViewStr(self.remoteAddress(row), self.protocol(row),
+                              self.cacheDomainNames if self.domainNameMode else None, True)
 
     def remotePortViewStr(self, row: int)-> str:
-        port = self.remotePort(row)
-        ptype = self.protocol(row)[1]
-        if port == 0 and ptype == socket.SOCK_DGRAM:
-            return '*'
-        return portToServiceName(port, ptype) if self.serviceNameMode else str(port)
+        return portViewStr(self.remotePort(row), self.protocol(row),
+                           self.serviceNames if self.serviceNameMode else None, True)
 
     def statusViewStr(self, row: int)-> str:
-        status = self.status(row)
-        return '' if status == "NONE" else status
+        return statusViewStr(self.status(row))
 
     def setFilename(self, filename: str) -> None:
         if filename != "":
@@ -317,21 +731,17 @@ class TLTableModel(QAbstractTableModel):
     def filename(self) -> str:
         return self._filename
 
+    def exportData(self, filename: str = None, on_progress = None, on_finished = None)-> TableExport:
+        """ return export of current table in file, it must be started by start() or run().
+            Rows are copied at once, so export doesn't see later updates. Format of file
+            is chosen by extension: CSV, JSON Lines or SQLite """
+        return TableExport(self.net_connections.copy(), self.rowCount(),
+                           filename if filename is not None else self._filename,
+                           cache_domain_names=self.cacheDomainNames if self.domainNameMode else None,
+                           service_names=self.serviceNames if self.serviceNameMode else None,
+                           on_progress=on_progress, on_finished=on_finished)
+
     @Slot()
     def writeDataInFile(self)-> None:
-        # print(self._filename)
-        with open(self._filename, 'w') as file:
-            for i in range(len(self.TABLE_HEADERS)):
-                file.write(self.TABLE_HEADERS[i])
-                if i < len(self.TABLE_HEADERS) - 1:
-                    file.write(';')
-            file.write('\n')
-            for i in range(self.rowCount()):
-                file.write(self.processViewStr(i) + ';')
-                file.write(self.pidViewStr(i) + ';')
-                file.write(self.protocolViewStr(i) + ';')
-                file.write(self.localAddressViewStr(i) + ';')
-                file.write(self.localPortViewStr(i) + ';')
-                file.write(self.remoteAddressViewStr(i) + ';')
-                file.write(self.remotePortViewStr(i) + ';')
-                file.write(self.statusViewStr(i) + '\n')
\ No newline at end of file
+        """ write current table in file synchronously """
+        self.exportData().run()
\ No newline at end of file
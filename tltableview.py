@@ -1,4 +1,5 @@
 from PySide2.QtWidgets import QTableView, QAbstractItemView
+from PySide2.QtCore import QPersistentModelIndex
 
 
 # class TLTableView is view table for work with host's network connections on transport layer
@@ -10,12 +11,11 @@ class TLTableView(QTableView):
         # set only single row selection mode
         self.setSelectionMode(QAbstractItemView.SingleSelection)
         self.setAutoScroll(False)
-        self.selectedRow = -1        # selected row number
+        self.topRow = QPersistentModelIndex()       # first visible row, moves together with its connection
 
-    def storeSelectedRowNum(self):
-        selected_indexes = self.selectedIndexes()
-        if len(selected_indexes) > 0:
-            self.selectedRow = self.selectedIndexes()[0].row()
+    def storeTopRow(self):
+        self.topRow = QPersistentModelIndex(self.indexAt(self.viewport().rect().topLeft()))
 
-    def restoreSelectedRowNum(self):
-        self.selectRow(self.selectedRow)
\ No newline at end of file
+    def restoreTopRow(self):
+        if self.topRow.isValid():
+            self.scrollTo(self.model().index(self.topRow.row(), 0), QAbstractItemView.PositionAtTop)
@@ -0,0 +1,336 @@
+from collections import Counter
+from PySide2.QtCore import QAbstractItemModel, Qt, QModelIndex, Slot
+from work_with_list import index_ranges
+from work_with_netdata import nameTransportProtocol, statusViewStr
+from tltablemodel import TLTableModel
+
+
+# levels of grouping: function row -> key of group, function key -> label, function key -> sort key of group
+GROUP_LEVELS = {
+    'process': (lambda row: (row[0] or '', row[1] if row[1] is not None else -1),
+                lambda key: key[0] or '?', lambda key: (key[0].lower(), key[1])),
+    'protocol': (lambda row: row[2], lambda key: nameTransportProtocol(*key), lambda key: nameTransportProtocol(*key)),
+    'state': (lambda row: row[7], lambda key: statusViewStr(key) or key, lambda key: key),
+}
+COUNT_SUMMARY_STATUSES = 3              # count of the most frequent statuses shown in summary of group
+
+
+class GroupNode:
+    """ Group of connections in tree. Group keeps primary keys and counts of statuses
+        of all its connections. Child rows (subgroups or connections) are made only
+        when group is expanded, before that children is None """
+    __slots__ = ('parent', 'key', 'level', 'row', 'pks', 'statuses', 'groups', 'children')
+
+    def __init__(self, parent, key, level: int):
+        self.parent = parent
+        self.key = key
+        self.level = level                  # number of level of grouping, -1 for root
+        self.row = 0                        # row number in children of parent
+        self.pks = set()                    # primary keys of all connections of group
+        self.statuses = Counter()           # status -> count of connections of group
+        self.groups = {}                    # key -> child group, empty for the last level
+        self.children = None                # shown child groups or primary keys of connections, None - not fetched
+
+    def is_fetched(self)-> bool:
+        return self.children is not None
+
+    def renumber(self, start: int = 0):
+        """ update row numbers of child groups from start """
+        if self.groups:
+            for row in range(start, len(self.children)):
+                self.children[row].row = row
+
+
+# class TLTreeModel is tree of connections of TLTableModel grouped by process and optionally by protocol and state
+class TLTreeModel(QAbstractItemModel):
+    TABLE_HEADERS = TLTableModel.TABLE_HEADERS
+
+    def __init__(self, source: TLTableModel, levels: tuple = ('process',)):
+        """ * source - table model, its rows and deltas are used, so tree needs no collection;
+            * levels - names of levels of grouping from GROUP_LEVELS """
+        super().__init__()
+        self.source = source
+        self.levels = tuple(levels)
+        self.root = GroupNode(None, None, -1)
+        self.paths = {}                     # primary key -> tuple of groups of connection from top level
+        self.statuses = {}                  # primary key -> status of connection
+        self.del_pks = frozenset()          # connections that are shown as deleted, they are removed by next delta
+        self.colored = frozenset()          # connections that have background color
+        self.rebuild()
+        source.deltaApplied.connect(self.applyDelta)
+        source.modelReset.connect(self.rebuild)
+        source.displayChanged.connect(self.emitConnectionsChanged)
+
+    def detach(self):
+        """ stop following of source model """
+        self.source.deltaApplied.disconnect(self.applyDelta)
+        self.source.modelReset.disconnect(self.rebuild)
+        self.source.displayChanged.disconnect(self.emitConnectionsChanged)
+
+    def setLevels(self, levels: tuple):
+        self.levels = tuple(levels)
+        self.rebuild()
+
+    @Slot()
+    def rebuild(self):
+        """ make groups of all rows of source model again """
+        self.beginResetModel()
+        self.root = GroupNode(None, None, -1)
+        self.paths = {}
+        self.statuses = {}
+        for ind in range(self.source.rowCount()):
+            self.__add(self.source.net_connections.row(ind), None)
+        # top level groups are always shown
+        self.root.children = sorted(self.root.groups.values(), key=self.__sort_key)
+        self.root.renumber()
+        self.del_pks = frozenset(self.source.del_pks)
+        self.colored = frozenset(self.source.rowColors)
+        self.endResetModel()
+
+    def __path_keys(self, row)-> tuple:
+        return tuple(GROUP_LEVELS[level][0](row) for level in self.levels)
+
+    def __sort_key(self, node: GroupNode):
+        return GROUP_LEVELS[self.levels[node.level]][2](node.key)
+
+    def __add(self, row, touched: set):
+        """ add connection in its groups, touched - groups whose counts are changed """
+        pk = row[8]
+        node = self.root
+        path = []
+        for level, key in enumerate(self.__path_keys(row)):
+            child = node.groups.get(key, None)
+            if child is None:
+                child = node.groups[key] = GroupNode(node, key, level)
+                if node.is_fetched():
+                    self.__insert_group(node, child)
+            node = child
+            node.pks.add(pk)
+            node.statuses[row[7]] += 1
+            path.append(node)
+            if touched is not None:
+                touched.add(node)
+        self.paths[pk] = tuple(path)
+        self.statuses[pk] = row[7]
+        if node.is_fetched():
+            row_number = len(node.children)
+            self.beginInsertRows(self.indexOfNode(node), row_number, row_number)
+            node.children.append(pk)
+            self.endInsertRows()
+
+    def __insert_group(self, parent: GroupNode, child: GroupNode):
+        """ insert child group in shown children of parent in sorted order """
+        key = self.__sort_key(child)
+        row_number = 0
+        while row_number < len(parent.children) and self.__sort_key(parent.children[row_number]) < key:
+            row_number += 1
+        self.beginInsertRows(self.indexOfNode(parent), row_number, row_number)
+        parent.children.insert(row_number, child)
+        parent.renumber(row_number)
+        self.endInsertRows()
+
+    def __remove(self, pks, touched: set):
+        """ remove connections from their groups, empty groups are removed too """
+        leaf_groups = {}                    # group of the last level -> removed primary keys
+        for pk in pks:
+            path = self.paths.pop(pk, None)
+            if path is None:
+                continue
+            status = self.statuses.pop(pk)
+            for node in path:
+                node.pks.discard(pk)
+                node.statuses[status] -= 1
+                if node.statuses[status] <= 0:
+                    del node.statuses[status]
+                touched.add(node)
+            leaf_groups.setdefault(path[-1], set()).add(pk)
+        for node, removed in leaf_groups.items():
+            if node.is_fetched():
+                inds = [i for i, pk in enumerate(node.children) if pk in removed]
+                parent_index = self.indexOfNode(node)
+                for first, last in reversed(index_ranges(inds)):
+                    self.beginRemoveRows(parent_index, first, last)
+                    del node.children[first:last + 1]
+                    self.endRemoveRows()
+        # empty groups are removed from the deepest level
+        for node in sorted((node for node in touched if not node.pks), key=lambda node: -node.level):
+            parent = node.parent
+            if parent.groups.get(node.key, None) is not node:
+                continue
+            del parent.groups[node.key]
+            if parent.is_fetched():
+                self.beginRemoveRows(self.indexOfNode(parent), node.row, node.row)
+                del parent.children[node.row]
+                parent.renumber(node.row)
+                self.endRemoveRows()
+        touched.difference_update([node for node in touched if not node.pks])
+
+    @Slot(object)
+    def applyDelta(self, delta):
+        """ apply the same changes as source model: connections deleted at the previous
+            update are removed, updated ones are moved to their new groups, new ones are added """
+        touched = set()
+        self.__remove(self.del_pks, touched)
+        moved = []
+        changed = set()
+        for row in delta.upd_rows:
+            pk = row[8]
+            if pk not in self.paths:
+                continue
+            path = self.paths[pk]
+            if tuple(node.key for node in path) != self.__path_keys(row):
+                moved.append(row)
+            elif self.statuses[pk] != row[7]:
+                # status is not a level of grouping, only counts are changed
+                for node in path:
+                    node.statuses[self.statuses[pk]] -= 1
+                    if node.statuses[self.statuses[pk]] <= 0:
+                        del node.statuses[self.statuses[pk]]
+                    node.statuses[row[7]] += 1
+                    touched.add(node)
+                self.statuses[pk] = row[7]
+            changed.add(pk)
+        self.__remove([row[8] for row in moved], touched)
+        for row in moved:
+            self.__add(row, touched)
+        for row in delta.new_rows:
+            self.__add(row, touched)
+        self.del_pks = frozenset(delta.del_pks)
+        # connections whose background or data have changed are repainted
+        colored = frozenset(self.source.rowColors)
+        changed.update(self.colored, colored)
+        self.colored = colored
+        self.emitConnectionsChanged(changed)
+        for node in touched:
+            if node.parent.is_fetched() and node.parent.groups.get(node.key, None) is node:
+                self.dataChanged.emit(self.createIndex(node.row, 0, node.parent),
+                                      self.createIndex(node.row, self.columnCount() - 1, node.parent))
+
+    @Slot()
+    def emitConnectionsChanged(self, pks: set = None):
+        """ notifies the view about changed data of shown connections, pks - primary keys of
+            connections, if None then all shown connections are changed """
+        nodes = {self.paths[pk][-1] for pk in pks if pk in self.paths} if pks is not None else self.__leaf_groups()
+        for node in nodes:
+            if not node.is_fetched() or not node.children:
+                continue
+            if pks is None:
+                ranges = [(0, len(node.children) - 1)]
+            else:
+                ranges = index_ranges([i for i, pk in enumerate(node.children) if pk in pks])
+            for first, last in ranges:
+                self.dataChanged.emit(self.createIndex(first, 0, node), self.createIndex(last, self.columnCount() - 1, node))
+
+    def __leaf_groups(self)-> list:
+        nodes = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.groups:
+                stack.extend(node.groups.values())
+            elif node is not self.root:
+                nodes.append(node)
+        return nodes
+
+    def nodeOfIndex(self, index: QModelIndex):
+        """ return GroupNode or primary key of connection of index, root for invalid index """
+        if not index.isValid():
+            return self.root
+        return index.internalPointer().children[index.row()]
+
+    def indexOfNode(self, node: GroupNode)-> QModelIndex:
+        if node is self.root or node is None:
+            return QModelIndex()
+        return self.createIndex(node.row, 0, node.parent)
+
+    def primaryKey(self, index: QModelIndex)-> int:
+        """ return primary key of connection of index, None for group rows """
+        item = self.nodeOfIndex(index) if index.isValid() else None
+        return item if isinstance(item, int) else None
+
+    def sourceRow(self, index: QModelIndex)-> int:
+        """ return row number of connection of index in source model, -1 for group rows """
+        pk = self.primaryKey(index)
+        return self.source.rowByPK(pk) if pk is not None else -1
+
+    def index(self, row: int, column: int, parent = QModelIndex()):
+        node = self.nodeOfIndex(parent)
+        if not isinstance(node, GroupNode) or not node.is_fetched() or not 0 <= row < len(node.children):
+            return QModelIndex()
+        return self.createIndex(row, column, node)
+
+    def parent(self, index: QModelIndex):
+        if not index.isValid():
+            return QModelIndex()
+        return self.indexOfNode(index.internalPointer())
+
+    def rowCount(self, parent = QModelIndex()):
+        node = self.nodeOfIndex(parent)
+        if not isinstance(node, GroupNode) or not node.is_fetched():
+            return 0
+        return len(node.children)
+
+    def columnCount(self, parent = QModelIndex()):
+        return len(self.TABLE_HEADERS)
+
+    def hasChildren(self, parent = QModelIndex()):
+        node = self.nodeOfIndex(parent)
+        return isinstance(node, GroupNode) and len(node.pks) > 0
+
+    def canFetchMore(self, parent: QModelIndex):
+        node = self.nodeOfIndex(parent)
+        return isinstance(node, GroupNode) and not node.is_fetched() and len(node.pks) > 0
+
+    def fetchMore(self, parent: QModelIndex):
+        """ make child rows of group when it is expanded """
+        node = self.nodeOfIndex(parent)
+        if not self.canFetchMore(parent):
+            return
+        if node.groups:
+            children = sorted(node.groups.values(), key=self.__sort_key)
+        else:
+            # connections are shown in order of table
+            children = sorted(node.pks, key=self.source.rowByPK)
+        self.beginInsertRows(parent, 0, len(children) - 1)
+        node.children = children
+        node.renumber()
+        self.endInsertRows()
+
+    def headerData(self, section, orientation, role):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.TABLE_HEADERS[section]
+        return None
+
+    def data(self, index, role = Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        item = self.nodeOfIndex(index)
+        if isinstance(item, GroupNode):
+            if role == Qt.DisplayRole:
+                return self.groupData(item, index.column())
+            return None
+        row = self.source.rowByPK(item)
+        if row < 0:
+            return None
+        if role == Qt.DisplayRole:
+            return self.source.displayRow(row)[index.column()]
+        elif role == Qt.BackgroundRole:
+            return self.source.rowColors.get(item, self.source.COLOR_DEFAULT)
+        elif role == Qt.TextAlignmentRole:
+            return Qt.AlignRight
+        return None
+
+    def groupData(self, node: GroupNode, column: int)-> str:
+        """ return display string of group row: name and count of connections,
+            pid of process and counts of the most frequent statuses """
+        level = self.levels[node.level]
+        if column == 0:
+            return f"{GROUP_LEVELS[level][1](node.key)} ({len(node.pks)})"
+        elif column == 1 and level == 'process':
+            return str(node.key[1]) if node.key[1] >= 0 else ''
+        elif column == len(self.TABLE_HEADERS) - 1:
+            return ', '.join(f"{statusViewStr(status) or status} {count}"
+                             for status, count in node.statuses.most_common(COUNT_SUMMARY_STATUSES))
+        return ''
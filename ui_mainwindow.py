@@ -49,8 +49,61 @@ class Ui_MainWindow(object):
         self.action3_seconds = QAction(MainWindow)
         self.action3_seconds.setObjectName(u"action3_seconds")
         self.action3_seconds.setCheckable(True)
+        self.actionAuto = QAction(MainWindow)
+        self.actionAuto.setObjectName(u"actionAuto")
+        self.actionAuto.setCheckable(True)
+        self.actionPerformance = QAction(MainWindow)
+        self.actionPerformance.setObjectName(u"actionPerformance")
+        self.actionPerformance.setCheckable(True)
+        self.actionPerformance_Log = QAction(MainWindow)
+        self.actionPerformance_Log.setObjectName(u"actionPerformance_Log")
+        self.actionPerformance_Log.setCheckable(True)
+        self.actionOpen_History = QAction(MainWindow)
+        self.actionOpen_History.setObjectName(u"actionOpen_History")
+        self.actionConnect_to_Agent = QAction(MainWindow)
+        self.actionConnect_to_Agent.setObjectName(u"actionConnect_to_Agent")
+        self.actionDisconnect_from_Agent = QAction(MainWindow)
+        self.actionDisconnect_from_Agent.setObjectName(u"actionDisconnect_from_Agent")
+        self.actionDisconnect_from_Agent.setEnabled(False)
+        self.actionSort_by_Names = QAction(MainWindow)
+        self.actionSort_by_Names.setObjectName(u"actionSort_by_Names")
+        self.actionSort_by_Names.setCheckable(True)
+        self.actionRecord_History = QAction(MainWindow)
+        self.actionRecord_History.setObjectName(u"actionRecord_History")
+        self.actionRecord_History.setCheckable(True)
+        self.actionRecord_Intervals = QAction(MainWindow)
+        self.actionRecord_Intervals.setObjectName(u"actionRecord_Intervals")
+        self.actionRecord_Intervals.setCheckable(True)
         self.actionAbout = QAction(MainWindow)
         self.actionAbout.setObjectName(u"actionAbout")
+        self.actionTCP = QAction(MainWindow)
+        self.actionTCP.setObjectName(u"actionTCP")
+        self.actionTCP.setCheckable(True)
+        self.actionTCP.setChecked(True)
+        self.actionTCPV6 = QAction(MainWindow)
+        self.actionTCPV6.setObjectName(u"actionTCPV6")
+        self.actionTCPV6.setCheckable(True)
+        self.actionTCPV6.setChecked(True)
+        self.actionUDP = QAction(MainWindow)
+        self.actionUDP.setObjectName(u"actionUDP")
+        self.actionUDP.setCheckable(True)
+        self.actionUDP.setChecked(True)
+        self.actionUDPV6 = QAction(MainWindow)
+        self.actionUDPV6.setObjectName(u"actionUDPV6")
+        self.actionUDPV6.setCheckable(True)
+        self.actionUDPV6.setChecked(True)
+        self.actionListening_Only = QAction(MainWindow)
+        self.actionListening_Only.setObjectName(u"actionListening_Only")
+        self.actionListening_Only.setCheckable(True)
+        self.actionGroup_by_Process = QAction(MainWindow)
+        self.actionGroup_by_Process.setObjectName(u"actionGroup_by_Process")
+        self.actionGroup_by_Process.setCheckable(True)
+        self.actionGroup_by_Protocol = QAction(MainWindow)
+        self.actionGroup_by_Protocol.setObjectName(u"actionGroup_by_Protocol")
+        self.actionGroup_by_Protocol.setCheckable(True)
+        self.actionGroup_by_State = QAction(MainWindow)
+        self.actionGroup_by_State.setObjectName(u"actionGroup_by_State")
+        self.actionGroup_by_State.setCheckable(True)
         self.centralWidget = QWidget(MainWindow)
         self.centralWidget.setObjectName(u"centralWidget")
         self.gridLayout = QGridLayout(self.centralWidget)
@@ -74,6 +127,10 @@ class Ui_MainWindow(object):
         self.menuView.setObjectName(u"menuView")
         self.menuUpdate_Speed = QMenu(self.menuView)
         self.menuUpdate_Speed.setObjectName(u"menuUpdate_Speed")
+        self.menuFilter = QMenu(self.menuView)
+        self.menuFilter.setObjectName(u"menuFilter")
+        self.menuGroup = QMenu(self.menuView)
+        self.menuGroup.setObjectName(u"menuGroup")
         self.menuHelp = QMenu(self.menuBar)
         self.menuHelp.setObjectName(u"menuHelp")
         MainWindow.setMenuBar(self.menuBar)
@@ -91,12 +148,37 @@ class Ui_MainWindow(object):
         self.menuFile.addAction(self.actionSave)
         self.menuFile.addAction(self.actionSave_as)
         self.menuFile.addSeparator()
+        self.menuFile.addAction(self.actionOpen_History)
+        self.menuFile.addSeparator()
+        self.menuFile.addAction(self.actionConnect_to_Agent)
+        self.menuFile.addAction(self.actionDisconnect_from_Agent)
+        self.menuFile.addSeparator()
         self.menuFile.addAction(self.actionExit)
         self.menuOptions.addAction(self.actionResolve_Addresses)
+        self.menuOptions.addAction(self.actionSort_by_Names)
+        self.menuOptions.addAction(self.actionRecord_History)
+        self.menuOptions.addAction(self.actionRecord_Intervals)
         self.menuView.addAction(self.menuUpdate_Speed.menuAction())
+        self.menuView.addAction(self.menuFilter.menuAction())
+        self.menuView.addAction(self.menuGroup.menuAction())
+        self.menuView.addSeparator()
+        self.menuView.addAction(self.actionPerformance)
+        self.menuView.addAction(self.actionPerformance_Log)
         self.menuUpdate_Speed.addAction(self.action1_seconds)
         self.menuUpdate_Speed.addAction(self.action2_seconds)
         self.menuUpdate_Speed.addAction(self.action3_seconds)
+        self.menuUpdate_Speed.addSeparator()
+        self.menuUpdate_Speed.addAction(self.actionAuto)
+        self.menuFilter.addAction(self.actionTCP)
+        self.menuFilter.addAction(self.actionTCPV6)
+        self.menuFilter.addAction(self.actionUDP)
+        self.menuFilter.addAction(self.actionUDPV6)
+        self.menuFilter.addSeparator()
+        self.menuFilter.addAction(self.actionListening_Only)
+        self.menuGroup.addAction(self.actionGroup_by_Process)
+        self.menuGroup.addSeparator()
+        self.menuGroup.addAction(self.actionGroup_by_Protocol)
+        self.menuGroup.addAction(self.actionGroup_by_State)
         self.menuHelp.addAction(self.actionAbout)
         self.toolBar.addAction(self.actionEndpoints)
         self.toolBar.addSeparator()
@@ -140,14 +222,39 @@ class Ui_MainWindow(object):
         self.action1_seconds.setText(QCoreApplication.translate("MainWindow", u"1 second", None))
         self.action2_seconds.setText(QCoreApplication.translate("MainWindow", u"2 seconds", None))
         self.action3_seconds.setText(QCoreApplication.translate("MainWindow", u"5 seconds", None))
+        self.actionAuto.setText(QCoreApplication.translate("MainWindow", u"Auto", None))
+        self.actionPerformance.setText(QCoreApplication.translate("MainWindow", u"Performance", None))
+        self.actionPerformance_Log.setText(QCoreApplication.translate("MainWindow", u"Performance Log...", None))
+        self.actionOpen_History.setText(QCoreApplication.translate("MainWindow", u"Open History...", None))
+#if QT_CONFIG(shortcut)
+        self.actionOpen_History.setShortcut(QCoreApplication.translate("MainWindow", u"Ctrl+O", None))
+#endif // QT_CONFIG(shortcut)
+        self.actionConnect_to_Agent.setText(QCoreApplication.translate("MainWindow", u"Connect to Agent...", None))
+        self.actionDisconnect_from_Agent.setText(QCoreApplication.translate("MainWindow", u"Disconnect from Agent", None))
+        self.actionSort_by_Names.setText(QCoreApplication.translate("MainWindow", u"Sort by Names", None))
+        self.actionRecord_History.setText(QCoreApplication.translate("MainWindow", u"Record History", None))
+        self.actionRecord_Intervals.setText(QCoreApplication.translate("MainWindow", u"Record Connection Intervals", None))
         self.actionAbout.setText(QCoreApplication.translate("MainWindow", u"About", None))
 #if QT_CONFIG(shortcut)
         self.actionAbout.setShortcut(QCoreApplication.translate("MainWindow", u"Ctrl+H", None))
 #endif // QT_CONFIG(shortcut)
+        self.actionTCP.setText(QCoreApplication.translate("MainWindow", u"TCP", None))
+        self.actionTCPV6.setText(QCoreApplication.translate("MainWindow", u"TCPv6", None))
+        self.actionUDP.setText(QCoreApplication.translate("MainWindow", u"UDP", None))
+        self.actionUDPV6.setText(QCoreApplication.translate("MainWindow", u"UDPv6", None))
+        self.actionListening_Only.setText(QCoreApplication.translate("MainWindow", u"Listening Only", None))
+        self.actionGroup_by_Process.setText(QCoreApplication.translate("MainWindow", u"By Process", None))
+#if QT_CONFIG(shortcut)
+        self.actionGroup_by_Process.setShortcut(QCoreApplication.translate("MainWindow", u"Ctrl+G", None))
+#endif // QT_CONFIG(shortcut)
+        self.actionGroup_by_Protocol.setText(QCoreApplication.translate("MainWindow", u"Then by Protocol", None))
+        self.actionGroup_by_State.setText(QCoreApplication.translate("MainWindow", u"Then by State", None))
         self.menuFile.setTitle(QCoreApplication.translate("MainWindow", u"File", None))
         self.menuOptions.setTitle(QCoreApplication.translate("MainWindow", u"Options", None))
         self.menuView.setTitle(QCoreApplication.translate("MainWindow", u"View", None))
         self.menuUpdate_Speed.setTitle(QCoreApplication.translate("MainWindow", u"Update Speed", None))
+        self.menuFilter.setTitle(QCoreApplication.translate("MainWindow", u"Filter", None))
+        self.menuGroup.setTitle(QCoreApplication.translate("MainWindow", u"Group", None))
         self.menuHelp.setTitle(QCoreApplication.translate("MainWindow", u"Help", None))
         self.toolBar.setWindowTitle(QCoreApplication.translate("MainWindow", u"toolBar", None))
     # retranslateUi
@@ -39,6 +39,48 @@ def updated_rows(old_table: list, new_table: list, indexes_id: tuple, indexes_cm
                 answer.append(old_table[i])
     return answer
 
+
+def tables_match(old_table: list, new_table: list, *columns) -> tuple:
+    """ The function pairs rows of two tables that have the same values
+        in the specified columns in one linear pass using a hash index.
+        Rows with the same values are paired in order of their appearance
+        in the tables, so the k-th row with some values of the old table is
+        paired with the k-th row with these values of the new table.
+        * columns - a tuple of columns of the table identifying a row;
+        return: tuple(unpaired rows of the old table in order of the old table,
+                      unpaired rows of the new table in order of the new table,
+                      list of pairs (old row, new row) in order of the new table) """
+    old_index = {}                      # key -> positions of rows of the old table from the end
+    for ind in range(len(old_table) - 1, -1, -1):
+        key = get_of(old_table[ind], *columns)
+        inds = old_index.get(key)
+        if inds is None:
+            old_index[key] = [ind]
+        else:
+            inds.append(ind)
+    pairs = []
+    new_rows = []
+    for row in new_table:
+        inds = old_index.get(get_of(row, *columns))
+        if inds:
+            pairs.append((old_table[inds.pop()], row))
+        else:
+            new_rows.append(row)
+    del_rows = [old_table[ind] for ind in sorted(ind for inds in old_index.values() for ind in inds)]
+    return del_rows, new_rows, pairs
+
+def index_ranges(indices) -> list:
+    # indices: iterable(int,...)
+    """ Function groups indices into ranges of consecutive values.
+        return: list of tuples (first, last) sorted by ascending """
+    ranges = []
+    for ind in sorted(set(indices)):
+        if ranges and ranges[-1][1] == ind - 1:
+            ranges[-1] = (ranges[-1][0], ind)
+        else:
+            ranges.append((ind, ind))
+    return ranges
+
 def get_of(data, *inds, **kwargs):
     # inds: tuple(int,...)
     """ Function return set elements
@@ -1,12 +1,32 @@
+import os
 import socket
 import psutil
 import time
+import heapq
+import sqlite3
+import threading
 import multi_thread
+from collections import OrderedDict
+from contextlib import closing
 
 
 ZERO_IPV4 = bytes([0] * 4)
 ZERO_IPV6 = bytes([0] * 16)
 LIFETIME_DNRECORD = 120         # the number of seconds the entry is valid, default 2 minutes
+LIFETIME_NEGATIVE_DNRECORD = 30 # the number of seconds the entry of failed lookup is valid
+RESOLVE_TIMEOUT = 2.0           # the number of seconds to wait for one lookup
+RESOLVER_THREADS = 4            # count of threads which resolve domain names
+PRIORITY_VISIBLE = 0            # priority of addresses displayed on screen
+PRIORITY_BACKGROUND = 1         # priority of other addresses
+MAX_DNRECORDS = 20000           # maximum count of entries in domain names cache
+FLUSH_INTERVAL_DNRECORDS = 60   # the number of seconds between writes of domain names cache to file
+COUNT_PORTS = 2**16
+DENIED_PROCESS_NAME = "<access denied>"     # name of process whose data the user may not read
+# services database of system
+if os.name == 'nt':
+    SERVICES_FILENAME = os.path.join(os.environ.get('SystemRoot', r'C:\Windows'), 'System32', 'drivers', 'etc', 'services')
+else:
+    SERVICES_FILENAME = '/etc/services'
 
 def nameTransportProtocol(family: socket.AddressFamily, type: socket.SocketKind)-> str:
     """ Return str representation name transport protocol """
@@ -30,9 +50,84 @@ def portToServiceName(port: int, type: socket.SocketKind)-> str:
     except OSError:
         return str(port)
 
+class ServiceNames:
+    """ Table of service names by port number for TCP and UDP.
+        Known services are loaded once from services database,
+        then a name is found by index in list without system calls.
+        Ports not in database are converted to string once. """
+    def __init__(self, filename: str = SERVICES_FILENAME):
+        # tables of names for protocols tcp and udp, None - port not examined yet
+        self.__tables = {socket.SOCK_STREAM: [None] * COUNT_PORTS, socket.SOCK_DGRAM: [None] * COUNT_PORTS}
+        # if database is read, then ports that are not in it have no service names
+        self.__complete = self.__load(filename)
+
+    def __load(self, filename: str)-> bool:
+        """ Reads services database, format of line: "name port/protocol [aliases...] [# comment]".
+            The first name of port is used, as socket.getservbyport does """
+        protocols = {'tcp': self.__tables[socket.SOCK_STREAM], 'udp': self.__tables[socket.SOCK_DGRAM]}
+        try:
+            with open(filename, encoding='utf-8', errors='replace') as file:
+                for line in file:
+                    fields = line.split('#', 1)[0].split()
+                    if len(fields) < 2 or '/' not in fields[1]:
+                        continue
+                    port, protocol = fields[1].split('/', 1)
+                    table = protocols.get(protocol.lower(), None)
+                    if table is None or not port.isdigit() or int(port) >= COUNT_PORTS:
+                        continue
+                    if table[int(port)] is None:
+                        table[int(port)] = fields[0]
+        except OSError:
+            return False
+        return True
+
+    def name(self, port: int, type: socket.SocketKind)-> str:
+        """ Return service name of port or port number as string """
+        table = self.__tables[socket.SOCK_STREAM if type == socket.SOCK_STREAM else socket.SOCK_DGRAM]
+        name = table[port]
+        if name is None:
+            # memoize miss
+            name = str(port) if self.__complete else portToServiceName(port, type)
+            table[port] = name
+        return name
+
+    def is_complete(self)-> bool:
+        """ is services database loaded? """
+        return self.__complete
+
 def isZeroIPAddress(addr: bytes, family: socket.AddressFamily)-> bool:
     return addr == (ZERO_IPV4 if family != socket.AF_INET6 else ZERO_IPV6)
 
+def addressViewStr(addr: bytes, protocol: tuple, cache_domain_names = None, remote: bool = False)-> str:
+    """ Return address for display. If cache_domain_names is given, then domain name
+        of cache is returned when it is known. Any remote address of UDP socket is '*' """
+    if remote and protocol[1] == socket.SOCK_DGRAM and isZeroIPAddress(addr, protocol[0]):
+        return '*'
+    ip = socket.inet_ntop(protocol[0], addr)
+    return cache_domain_names.domain_name(addr, ip) if cache_domain_names is not None else ip
+
+def portViewStr(port: int, protocol: tuple, service_names = None, remote: bool = False)-> str:
+    """ Return port for display. If service_names is given, then service name is returned.
+        Any remote port of UDP socket is '*' """
+    if remote and port == 0 and protocol[1] == socket.SOCK_DGRAM:
+        return '*'
+    return service_names.name(port, protocol[1]) if service_names is not None else str(port)
+
+def statusViewStr(status: str)-> str:
+    return '' if status == "NONE" else status
+
+def pidViewStr(pid: int)-> str:
+    """ owner of some sockets is unknown, their pid is None """
+    return str(pid) if pid is not None else ''
+
+def rowViewStrs(row, cache_domain_names = None, service_names = None)-> tuple:
+    """ Return display strings of all columns of row of connection table """
+    protocol = row[2]
+    return (row[0], pidViewStr(row[1]), nameTransportProtocol(*protocol),
+            addressViewStr(row[3], protocol, cache_domain_names), portViewStr(row[4], protocol, service_names),
+            addressViewStr(row[5], protocol, cache_domain_names, True),
+            portViewStr(row[6], protocol, service_names, True), statusViewStr(row[7]))
+
 def psutilAddrToIPAndPort(paddr, pfamily: socket.AddressFamily)-> tuple:      # -> tuple(bytes, int)
     """ Correct result network address of psutil.net_connections() """
     if type(paddr) != tuple:
@@ -42,13 +137,20 @@ def psutilAddrToIPAndPort(paddr, pfamily: socket.AddressFamily)-> tuple:      #
     return socket.inet_pton(pfamily, ip), port
 
 
-class CacheDomainNames(multi_thread.MultiThread):
+class CacheDomainNames:
     """ Class for working with domain names cache.
         It is a more optimal solution in contrast to simple
-        functions for calculating domain names as needed. """
+        functions for calculating domain names as needed.
+        Addresses are resolved by a fixed pool of threads,
+        addresses displayed on screen are resolved first.
+        The cache is thread-safe and keeps no more than max_size
+        entries, the least recently used entries are evicted first. """
     class DNRecord:
         # Data unit for CacheDomainNames that have simple structure
+        __slots__ = ('domain_name', '__death_time')
+
         def __init__(self, domain_name: str, lifetime: float):
+            # domain_name - None if lookup failed
             # lifetime - the number of seconds the entry is valid
             self.domain_name = domain_name
             self.__death_time = time.time() + lifetime         # time when the entry will no longer be valid
@@ -56,6 +158,9 @@ class CacheDomainNames(multi_thread.MultiThread):
         def is_alive(self)-> bool:
             return time.time() < self.__death_time
 
+        def death_time(self)-> float:
+            return self.__death_time
+
         def set_death_time(self, val: float)-> None:
             if val > 0:
                 self.__death_time = val
@@ -68,53 +173,166 @@ class CacheDomainNames(multi_thread.MultiThread):
         def __repr__(self):
             return self.__str__()
 
-    def __init__(self, lifetime_record = LIFETIME_DNRECORD):
-        """ Initialization memory and setting basic configurations"""
-        super().__init__()
-        self.__memory = {}                                      # dictionary that stores DNRecords
+    def __init__(self, lifetime_record = LIFETIME_DNRECORD, resolve_function = ipToDomainName,
+                 count_threads = RESOLVER_THREADS, timeout = RESOLVE_TIMEOUT,
+                 lifetime_negative_record = LIFETIME_NEGATIVE_DNRECORD, on_resolved = None,
+                 max_size = MAX_DNRECORDS):
+        """ Initialization memory and setting basic configurations
+            * resolve_function - function str ip address -> str domain name,
+              returns ip address itself if domain name not found;
+            * count_threads - count of threads which resolve addresses;
+            * timeout - the number of seconds to wait for one lookup;
+            * lifetime_negative_record - the number of seconds the entry of failed lookup is valid;
+            * on_resolved - function that is called from resolving thread with bytes ip address
+              after each lookup;
+            * max_size - maximum count of entries """
+        self.__memory = OrderedDict()                           # DNRecords in order from least recently used
+        self.__death_times = []                                 # heap of tuples(death time, ip address)
+        self.__lock = threading.Lock()
+        self.__max_size = max(max_size, 1)
         self.__lifetime_record = lifetime_record                # the number of seconds the entry is valid
+        self.__lifetime_negative_record = lifetime_negative_record
+        self.__resolve_function = resolve_function
+        self.__timeout = timeout
+        self.__on_resolved = on_resolved
+        # lookup that is out of time is written as failed, thread of lookup is not replaced
+        self.__pool = multi_thread.WorkerPool(self.__lookup, count_threads, timeout,
+                                              on_result=self.__resolved, on_timeout=self.__timed_out)
+        self.hits = 0                       # count of found entries
+        self.misses = 0                     # count of not found entries
+        self.evictions = 0                  # count of entries removed because cache is full
+        self.expirations = 0                # count of entries removed because they are expired
 
     def domain_name(self, ip_addr: bytes, default = None)-> str:
         """ Return domain name of memory """
-        record = self.__memory.get(ip_addr, None)
-        return record.domain_name if record else default
+        with self.__lock:
+            record = self.__memory.get(ip_addr, None)
+            if record is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.__memory.move_to_end(ip_addr)
+        return record.domain_name if record.domain_name is not None else default
+
+    def peek(self, ip_addr: bytes, default = None)-> str:
+        """ Return domain name of memory, statistics and order of eviction are not changed """
+        with self.__lock:
+            record = self.__memory.get(ip_addr, None)
+        return record.domain_name if record is not None and record.domain_name is not None else default
+
+    def set_record(self, ip_addr: bytes, record: DNRecord)-> None:
+        """ Writes record to cache, the least recently used
+            records are removed if cache is full """
+        with self.__lock:
+            self.__memory[ip_addr] = record
+            self.__memory.move_to_end(ip_addr)
+            heapq.heappush(self.__death_times, (record.death_time(), ip_addr))
+            while len(self.__memory) > self.__max_size:
+                self.__memory.popitem(last=False)
+                self.evictions += 1
+            # drop heap entries of evicted and rewritten records
+            if len(self.__death_times) > 2 * len(self.__memory) + 64:
+                self.__death_times = [(rec.death_time(), key) for key, rec in self.__memory.items()]
+                heapq.heapify(self.__death_times)
 
-    def __append(self, *addrs)-> None:
+    def __lookup(self, addr: tuple)-> str:
+        # addr: tuple(bytes, socket.AddressFamily)
+        """ return domain name of ip address, None if lookup failed """
+        ip = socket.inet_ntop(addr[1], addr[0])
+        domain_name = self.__resolve_function(ip)
+        return domain_name if domain_name != ip else None
+
+    def __resolved(self, addr: tuple, domain_name: str)-> None:
+        """ write result of lookup to cache, failed lookups are written as negative records """
+        if domain_name is None:
+            self.set_record(addr[0], self.DNRecord(None, self.__lifetime_negative_record))
+        else:
+            self.set_record(addr[0], self.DNRecord(domain_name, self.__lifetime_record))
+        if self.__on_resolved:
+            self.__on_resolved(addr[0])
+
+    def __timed_out(self, addr: tuple)-> None:
+        self.__resolved(addr, None)
+
+    def append(self, *addrs, priority: int = PRIORITY_BACKGROUND)-> None:
         # addrs: tuple(tuple(bytes, socket.AddressFamily), ...)
         # addr: tuple(bytes, socket.AddressFamily)
-        """ function of adding multiple records to cache
+        """ function of adding multiple records to cache.
+            Addresses are queued for resolving in worker threads,
+            addresses already queued or in work are not queued again
             * addrs - is tuple of arguments.
               One addr - is tuple where:
                      addr[0] - is bytes ip address,
                      addr[1] - is family ip address """
+        self.remove_dead_domain_names()
+        self.enqueue(*addrs, priority=priority)
+
+    def enqueue(self, *addrs, priority: int = PRIORITY_BACKGROUND)-> None:
+        """ queues addresses that are not in cache for resolving """
         for addr in addrs:
             if addr[0] not in self.__memory:
-                # resolve ip address into domain name and write to cache
-                self.__memory[addr[0]] = \
-                    self.DNRecord(ipToDomainName(socket.inet_ntop(addr[1], addr[0])), self.__lifetime_record)
+                self.__pool.put(addr, priority)
 
-    def append(self, *addrs)-> None:
-        # addrs: tuple(tuple(bytes, socket.AddressFamily), ...)
-        # addr: tuple(bytes, socket.AddressFamily)
-        """ function of adding multiple records to cache
-            and works in multi-threaded mode"""
-        self.remove_dead_domain_names()
-        # filter out addresses that are already being examined by other threads
-        addrs = self.find_args_not_in_threads(self.__append, *addrs)
-        # try run function 'append' in new thread
-        if not self.run_thread(self.__append, *addrs):
-            self.__append(*addrs)
+    def prioritize(self, *addrs)-> None:
+        """ queues addresses displayed on screen before other addresses """
+        self.enqueue(*addrs, priority=PRIORITY_VISIBLE)
+
+    def is_pending(self, addr: tuple)-> bool:
+        """ is address queued or resolved now? """
+        return addr in self.__pool
+
+    def stop(self):
+        """ stops resolving threads """
+        self.__pool.stop()
 
     def remove_dead_domain_names(self):
-        """ Removes all domain names
-            from the cache that have expired """
-        keys = [key for key in self.__memory if not self.__memory[key].is_alive()]
-        for key in keys:
-            self.__memory.pop(key, None)
+        """ Removes all domain names from the cache that have expired.
+            Only expired entries are examined """
+        now = time.time()
+        with self.__lock:
+            while self.__death_times and self.__death_times[0][0] <= now:
+                death_time, key = heapq.heappop(self.__death_times)
+                record = self.__memory.get(key, None)
+                if record is None:
+                    continue                    # entry was evicted
+                if record.death_time() > now:
+                    # entry was rewritten or its death time was changed
+                    heapq.heappush(self.__death_times, (record.death_time(), key))
+                    continue
+                del self.__memory[key]
+                self.expirations += 1
 
     def clear(self):
         """ Removes all domain names from the cache """
-        self.__memory.clear()
+        with self.__lock:
+            self.__memory.clear()
+            self.__death_times.clear()
+
+    def records(self)-> list:
+        """ Return list of tuples (bytes ip address, domain name, death time)
+            of all alive entries, domain name is None for failed lookups """
+        now = time.time()
+        with self.__lock:
+            return [(key, record.domain_name, record.death_time())
+                    for key, record in self.__memory.items() if record.death_time() > now]
+
+    def load_records(self, records)-> int:
+        """ Writes entries to cache if their addresses are not in cache.
+            Entries live no longer than the current lifetime of records.
+            * records - iterable of tuples (bytes ip address, domain name, death time);
+            return: count of written entries """
+        now = time.time()
+        count = 0
+        for ip_addr, domain_name, death_time in records:
+            if ip_addr in self.__memory:
+                continue
+            lifetime = self.__lifetime_record if domain_name is not None else self.__lifetime_negative_record
+            record = self.DNRecord(domain_name, 0)
+            record.set_death_time(min(death_time, now + lifetime))
+            if record.death_time() > now:
+                self.set_record(ip_addr, record)
+                count += 1
+        return count
 
     def set_lifetime_record(self, lifetime: float)-> None:
         if lifetime > 0:
@@ -125,12 +343,128 @@ class CacheDomainNames(multi_thread.MultiThread):
     def lifetime_record(self)-> float:
         return self.__lifetime_record
 
+    def set_max_size(self, max_size: int)-> None:
+        with self.__lock:
+            self.__max_size = max(max_size, 1)
+            while len(self.__memory) > self.__max_size:
+                self.__memory.popitem(last=False)
+                self.evictions += 1
+
+    def max_size(self)-> int:
+        return self.__max_size
+
+    def stats(self)-> dict:
+        return {'size': len(self.__memory), 'max_size': self.__max_size, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions, 'expirations': self.expirations}
+
     def __contains__(self, key):
         return key in self.__memory
 
     def __len__(self):
         return len(self.__memory)
 
+    def __str__(self):
+        with self.__lock:
+            return self.__memory.__str__()
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class DomainNamesStorage:
+    """ Class for keeping domain names cache in SQLite file between
+        program launches. Every entry is stored with its death time,
+        so after loading it lives only the remaining time. """
+    def __init__(self, filename: str):
+        self.filename = filename
+
+    def __connect(self):
+        connection = sqlite3.connect(self.filename)
+        connection.execute("CREATE TABLE IF NOT EXISTS domain_names ("
+                           "ip BLOB PRIMARY KEY, domain_name TEXT, death_time REAL NOT NULL)")
+        return connection
+
+    def load(self, cache: CacheDomainNames)-> int:
+        """ Loads alive entries from file into cache.
+            return: count of loaded entries """
+        try:
+            with closing(self.__connect()) as connection:
+                records = connection.execute("SELECT ip, domain_name, death_time FROM domain_names "
+                                             "WHERE death_time > ?", (time.time(),)).fetchall()
+        except sqlite3.Error:
+            return 0
+        return cache.load_records((bytes(ip), domain_name, death_time) for ip, domain_name, death_time in records)
+
+    def save(self, cache: CacheDomainNames)-> bool:
+        """ Replaces entries in file with alive entries of cache.
+            return: False - if file can't be written """
+        records = cache.records()
+        try:
+            with closing(self.__connect()) as connection:
+                with connection:                # one transaction
+                    connection.execute("DELETE FROM domain_names")
+                    connection.executemany("INSERT INTO domain_names (ip, domain_name, death_time) "
+                                           "VALUES (?, ?, ?)", records)
+        except sqlite3.Error:
+            return False
+        return True
+
+
+class CacheProcesses:
+    """ Class for working with process names cache.
+        The cache is filled in one pass per snapshot for all
+        processes that own connections. Records are checked by
+        process creation time, so reused pid is detected. """
+    def __init__(self):
+        """ Initialization memory and counters """
+        self.__memory = {}              # dictionary pid -> tuple(create_time, process name)
+        self.hits = 0                   # count of records reused from previous pass
+        self.misses = 0                 # count of records loaded from system
+
+    def update(self, pids)-> None:
+        """ Refreshes records of all specified processes.
+            Records of other processes and dead processes are removed.
+            * pids - iterable of process identifiers, None (unknown owner) is skipped """
+        memory = {}
+        for pid in set(pids):
+            if pid is None:
+                continue                # psutil.Process(None) is the current process
+            try:
+                process = psutil.Process(pid)
+                create_time = process.create_time()
+                record = self.__memory.get(pid, None)
+                if record and record[0] == create_time:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+                    record = (create_time, process.name())
+                memory[pid] = record
+            except psutil.NoSuchProcess:
+                pass
+            except psutil.AccessDenied:
+                # connection is kept, record without creation time is loaded again by the next pass
+                self.misses += 1
+                memory[pid] = (None, DENIED_PROCESS_NAME)
+        self.__memory = memory
+
+    def process_name(self, pid: int, default = None)-> str:
+        """ Return process name of memory """
+        record = self.__memory.get(pid, None)
+        return record[1] if record else default
+
+    def stats(self)-> dict:
+        return {'size': len(self.__memory), 'hits': self.hits, 'misses': self.misses}
+
+    def clear(self):
+        """ Removes all records from the cache """
+        self.__memory.clear()
+
+    def __contains__(self, pid):
+        return pid in self.__memory
+
+    def __len__(self):
+        return len(self.__memory)
+
     def __str__(self):
         return self.__memory.__str__()
 